@@ -0,0 +1,118 @@
+"""Memory and speed benchmark of material extraction.
+
+Compares the Material records of netflix.material against the previous
+dict-based extract_asset_info on a synthetic downloadMaterials response.
+Run from the repository root:
+
+    python benchmarks/bench_extract.py [--materials 100000] [--repeat 5]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from netflix.material import iter_materials  # noqa: E402
+
+
+def synthetic_response(count, per_request=200, seed=0):
+    rng = random.Random(seed)
+    items = []
+    for start in range(0, count, per_request):
+        materials = []
+        for index in range(start, min(count, start + per_request)):
+            materials.append({
+                'createdDate': '2024-05-01T10:00:00Z',
+                'language': rng.choice(['en', 'es', 'fr']),
+                'status': rng.choice(['ACTIVE', 'INACTIVE']),
+                'type': rng.choice(['FINAL_PROXY', 'PRINT_MASTER_5_1_CH', 'DIALOGUE_LIST']),
+                'rootAmpAsset': {'assetId': {'id': f"amp-{index}", 'version': 1}},
+                'file': {'name': f"file_{index}.mov", 'location': {'url': f"s3://bucket/path/file_{index}.mov"}},
+                'movie': {'movieId': 80000000 + index % 1000, 'internalTitle': 'Title'},
+                'packageWrapper': {'id': f"pkg-{index}"} if index % 2 else None
+            })
+        items.append({'sourceRequestId': f"sr-{start}", 'materials': materials})
+    return {'sr_downloadMaterials': items}
+
+
+def legacy_extract(response_data):
+    """The dict-based extract_asset_info that Material replaced."""
+    assets_info = []
+    if 'sr_downloadMaterials' in response_data:
+        for item in response_data['sr_downloadMaterials']:
+            source_request_id = item.get('sourceRequestId')
+            for material in item.get('materials', []):
+                file_info = material.get('file', {})
+                movie_info = material.get('movie', {})
+                material_filter = {}
+                root_amp_asset = material.get('rootAmpAsset', {})
+                if root_amp_asset:
+                    material_filter["ampAssetId"] = root_amp_asset.get('assetId', {}).get('id')
+                if file_info:
+                    if 'location' in file_info and file_info['location'] and 'url' in file_info['location']:
+                        material_filter["fileLocationUrl"] = file_info['location']['url']
+                    if 'name' in file_info:
+                        material_filter["fileName"] = file_info['name']
+                if movie_info:
+                    material_filter["movieId"] = movie_info.get('movieId')
+                package_info = material.get('packageWrapper', {})
+                if package_info and package_info["id"]:
+                    material_filter["packageId"] = package_info["id"]
+                if "packageId" in material_filter and "ampAssetId" in material_filter:
+                    del material_filter["ampAssetId"]
+                assets_info.append({
+                    'status': material.get('status', 'UNKNOWN'),
+                    'language': material.get('language', None),
+                    'sourceRequestId': source_request_id,
+                    'materialType': material.get('type', 'UNKNOWN'),
+                    'fileInfo': file_info,
+                    'materialFilter': material_filter
+                })
+    return assets_info
+
+
+def measure_time(func, response, repeat):
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        result = func(response)
+        timings.append(time.perf_counter() - started)
+        del result
+    return min(timings)
+
+
+def measure_memory(func, response):
+    gc.collect()
+    tracemalloc.start()
+    result = func(response)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--materials', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    response = synthetic_response(args.materials)
+    rows = [
+        ('dict extract_asset_info', legacy_extract),
+        ('Material records', lambda data: list(iter_materials(data)))
+    ]
+    print(f"{args.materials} materials")
+    for name, func in rows:
+        elapsed = measure_time(func, response, args.repeat)
+        retained, peak = measure_memory(func, response)
+        print(f"{name:<24} {elapsed * 1000:8.1f} ms  retained {retained / 2 ** 20:7.1f} MiB  peak {peak / 2 ** 20:7.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
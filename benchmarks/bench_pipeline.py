@@ -0,0 +1,147 @@
+"""End-to-end benchmark of the tiramigiu pipeline against a local stand-in.
+
+For every materials-per-title scenario, starts benchmarks/standin_server.py,
+runs the real CLI against it with benchmarks/fake_ascp.py as ascp, and reports
+throughput, peak RSS of the tiramigiu process and the per-stage timings of its
+--report. Arguments after "--" are passed to tiramigiu.py. Run from the
+repository root:
+
+    python benchmarks/bench_pipeline.py [--titles 10] [--materials 1 100 1000 10000] \\
+        [--latency 0.02] [--json results.json] [-- --workers 4 --parallel-transfers 2]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.join(ROOT, 'benchmarks')
+
+STAGES = [
+    'backlot.fetch_access_token',
+    'backlot.search_requests',
+    'backlot.search_download_assets',
+    'selection.select',
+    'backlot.download_materials_manifests',
+    'aspera.batch',
+    'tiramigiu.prepare_movie_id',
+    'tiramigiu.transfer_movie_id'
+]
+
+
+def start_standin(args, materials):
+    command = [sys.executable, os.path.join(BENCHMARKS, 'standin_server.py'), '--port', '0',
+               '--materials', str(materials), '--latency', str(args.latency),
+               '--requests-per-title', str(args.requests_per_title)]
+    if args.replay:
+        command.extend(['--replay', args.replay])
+    if args.shared:
+        command.append('--shared')
+    if args.max_rps:
+        command.extend(['--max-rps', str(args.max_rps)])
+    command.extend(['--auth', args.auth])
+    if args.manifest_sizes:
+        command.extend(['--file-size', str(args.file_size)])
+    server = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    return server, server.stdout.readline().strip()
+
+
+def run_scenario(args, materials, tiramigiu_args):
+    server, url = start_standin(args, materials)
+    work_dir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    report_path = os.path.join(work_dir, 'report.json')
+    movie_ids = [str(80000001 + index) for index in range(args.titles)]
+    command = [
+        sys.executable, os.path.join(ROOT, 'tiramigiu.py'),
+        '--backlot-url', url, '--gateway-url', f"{url}/subscriptions/sse", '--auth-url', f"{url}/as/authorization.oauth2",
+        '--ascp-path', os.path.join(BENCHMARKS, 'fake_ascp.py'),
+        '--download-dir', os.path.join(work_dir, 'dl'), '--profile-dir', os.path.join(work_dir, 'profile'),
+        '--no-ledger', '--no-cache', '--artifacts', 'off', '--report', report_path
+    ] + tiramigiu_args + movie_ids
+    env = dict(os.environ, FAKE_ASCP_FILE_SIZE=str(args.file_size), FAKE_ASCP_RATE=str(args.rate), FAKE_ASCP_TRUNCATE=str(args.truncate))
+    try:
+        started = time.perf_counter()
+        with open(os.path.join(work_dir, 'tiramigiu.log'), 'w') as log:
+            process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+            _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - started
+        if not os.path.exists(report_path):
+            raise RuntimeError(f"tiramigiu exited with status {status} without a report, see {work_dir}/tiramigiu.log")
+        with open(report_path, 'r') as f:
+            report = json.load(f)
+    finally:
+        server.terminate()
+        server.wait()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    titles = report['counters'].get('titles.succeeded', 0)
+    return {
+        'materials_per_title': materials,
+        'titles': args.titles,
+        'succeeded': titles,
+        'wall': wall,
+        'titles_per_second': titles / wall,
+        'materials_per_second': titles * materials / wall,
+        'files': report['counters'].get('aspera.files', 0),
+        'peak_rss': peak_rss,
+        'timers': report['timers'],
+        'counters': report['counters']
+    }
+
+
+def print_result(result):
+    print(f"\n{result['materials_per_title']} materials/title: {result['succeeded']}/{result['titles']} titles in {result['wall']:.2f}s, "
+          f"{result['titles_per_second']:.2f} titles/s, {result['materials_per_second']:.0f} materials/s, "
+          f"{result['files']:.0f} files, peak RSS {result['peak_rss'] / 1024 / 1024:.1f} MiB")
+    print(f"  {'stage':<40}{'count':>7}{'mean':>11}{'max':>11}")
+    for stage in STAGES:
+        timer = result['timers'].get(stage)
+        if timer:
+            print(f"  {stage:<40}{timer['count']:>7}{timer['mean'] * 1000:>9.1f}ms{timer['max'] * 1000:>9.1f}ms")
+
+
+def main():
+    argv = sys.argv[1:]
+    tiramigiu_args = []
+    if '--' in argv:
+        tiramigiu_args = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--titles', type=int, default=10)
+    parser.add_argument('--materials', type=int, nargs='+', default=[1, 100, 1000, 10000], help='Materials per title, one scenario each')
+    parser.add_argument('--requests-per-title', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds the stand-in adds to every response')
+    parser.add_argument('--shared', action='store_true', help='Let every title point at the same files, to measure the download store')
+    parser.add_argument('--max-rps', type=int, default=0, help='Make the stand-in answer 429 above this many calls per second')
+    parser.add_argument('--replay', default=None, help='Directory of recorded artifacts for the stand-in to replay')
+    parser.add_argument('--auth', choices=('none', 'silent'), default='none',
+                        help='Make tiramigiu sign in to the stand-in, through the silent re-authentication')
+    parser.add_argument('--file-size', type=int, default=65536, help='Bytes written by the fake ascp per file')
+    parser.add_argument('--rate', type=float, default=0, help='Simulated ascp rate in Mbps, 0 for unlimited')
+    parser.add_argument('--truncate', type=int, default=0,
+                        help='Have the fake ascp truncate every Nth file of a transfer the first time, 0 for never')
+    parser.add_argument('--manifest-sizes', action='store_true',
+                        help='Have the manifests announce the exact size of every file, so that verification compares it')
+    parser.add_argument('--json', default=None, help='Also write the results to this file')
+    parser.add_argument('--keep', action='store_true', help='Keep the working directories')
+    args = parser.parse_args(argv)
+
+    results = []
+    for materials in args.materials:
+        result = run_scenario(args, materials, tiramigiu_args)
+        print_result(result)
+        results.append(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4)
+    sys.exit(0 if all(result['succeeded'] == result['titles'] for result in results) else 1)
+
+
+if __name__ == '__main__':
+    main()
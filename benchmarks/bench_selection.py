@@ -0,0 +1,119 @@
+"""Micro-benchmark of asset selection on synthetic inputs.
+
+Compares the AssetSelector against the previous if/elif categorizer and checks
+that both select the same assets. Run from the repository root:
+
+    python benchmarks/bench_selection.py [--materials 100000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classes.selection import AssetSelector  # noqa: E402
+
+MATERIAL_TYPES = [
+    'FINAL_PROXY', 'LOCKED_PROXY', 'PROXY_WITH_SUBTITLES', 'SERVICING_PROXY', 'DIALOGUE_LIST',
+    'PIVOT_LANGUAGE_DIALOGUE_LIST', 'PRINT_MASTER_5_1_CH', 'PRINT_MASTER_2_0_CH',
+    'DIALOG_MUSIC_AND_EFFECTS_5_1_CH', 'DIALOG_MUSIC_AND_EFFECTS_2_0_CH', 'MUSIC_CUE_SHEET',
+    'SUBTITLE_TEMPLATE', 'AUDIO_DESCRIPTION_SCRIPT', 'PRINT_MASTER_7_1_CH'
+]
+
+
+def synthetic_assets(count, seed=0):
+    rng = random.Random(seed)
+    assets = []
+    for index in range(count):
+        assets.append({
+            'status': 'ACTIVE' if rng.random() < 0.8 else 'INACTIVE',
+            'language': rng.choice(['en', 'es', 'fr', 'de', 'ja']),
+            'sourceRequestId': f"sr-{index // 50}",
+            'materialType': rng.choice(MATERIAL_TYPES),
+            'createdDate': f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T00:00:00Z",
+            'fileInfo': {'name': f"file_{rng.randint(0, count)}.mov"},
+            'materialFilter': {'fileName': f"file_{rng.randint(0, count)}.mov", 'movieId': index % 1000}
+        })
+    return assets
+
+
+def legacy_select(assets):
+    """The if/elif categorizer that AssetSelector replaced."""
+    usable_assets = []
+    available_assets = []
+    seen_files = set()
+    for asset in assets:
+        if asset['status'] == 'ACTIVE':
+            if 'materialFilter' in asset and 'fileName' in asset['materialFilter']:
+                fileName = asset['materialFilter']['fileName']
+                if fileName not in seen_files:
+                    available_assets.append(asset)
+                    seen_files.add(fileName)
+    categorized_assets = {name: [] for name in [
+        'FINAL_PROXY', 'LOCKED_PROXY', 'PROXY_WITH_SUBTITLES', 'SERVICING_PROXY', 'DIALOGUE_LIST',
+        'PIVOT_LANGUAGE_DIALOGUE_LIST', 'PRINT_MASTER_5_1_CH', 'PRINT_MASTER_2_0_CH',
+        'DIALOG_MUSIC_AND_EFFECTS_5_1_CH', 'DIALOG_MUSIC_AND_EFFECTS_2_0_CH']}
+    for asset in available_assets:
+        material_type = asset['materialType']
+        if 'FINAL_PROXY' in material_type:
+            categorized_assets['FINAL_PROXY'].append(asset)
+        elif 'PROXY_WITH_SUBTITLES' in material_type:
+            categorized_assets['PROXY_WITH_SUBTITLES'].append(asset)
+        elif 'LOCKED_PROXY' in material_type:
+            categorized_assets['LOCKED_PROXY'].append(asset)
+        elif 'SERVICING_PROXY' in material_type:
+            categorized_assets['SERVICING_PROXY'].append(asset)
+        elif 'DIALOGUE_LIST' in material_type:
+            categorized_assets['DIALOGUE_LIST'].append(asset)
+        elif 'PIVOT_LANGUAGE_DIALOGUE_LIST' in material_type:
+            categorized_assets['PIVOT_LANGUAGE_DIALOGUE_LIST'].append(asset)
+        elif 'PRINT_MASTER' in material_type:
+            if '5_1_CH' in material_type:
+                categorized_assets['PRINT_MASTER_5_1_CH'].append(asset)
+            elif '2_0_CH' in material_type:
+                categorized_assets['PRINT_MASTER_2_0_CH'].append(asset)
+        elif 'DIALOG_MUSIC_AND_EFFECTS' in material_type:
+            if '5_1_CH' in material_type:
+                categorized_assets['DIALOG_MUSIC_AND_EFFECTS_5_1_CH'].append(asset)
+            elif '2_0_CH' in material_type:
+                categorized_assets['DIALOG_MUSIC_AND_EFFECTS_2_0_CH'].append(asset)
+    usable_assets.extend(categorized_assets['FINAL_PROXY'] or categorized_assets['PROXY_WITH_SUBTITLES'] or categorized_assets['LOCKED_PROXY'] or categorized_assets['SERVICING_PROXY'])
+    usable_assets.extend(categorized_assets['DIALOGUE_LIST'])
+    usable_assets.extend(categorized_assets['PIVOT_LANGUAGE_DIALOGUE_LIST'])
+    usable_assets.extend(categorized_assets['PRINT_MASTER_5_1_CH'] or categorized_assets['PRINT_MASTER_2_0_CH'])
+    usable_assets.extend(categorized_assets['DIALOG_MUSIC_AND_EFFECTS_5_1_CH'] or categorized_assets['DIALOG_MUSIC_AND_EFFECTS_2_0_CH'])
+    return usable_assets
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--materials', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--config', default='config/selection.json')
+    args = parser.parse_args()
+
+    assets = synthetic_assets(args.materials)
+    selector = AssetSelector.from_file(args.config)
+    legacy_time, legacy = best_of(lambda: legacy_select(assets), args.repeat)
+    selector_time, selection = best_of(lambda: selector.select(assets), args.repeat)
+    if [id(asset) for asset in legacy] != [id(asset) for asset in selection.selected]:
+        print("MISMATCH: selector and legacy categorizer selected different assets")
+        sys.exit(1)
+    print(f"{args.materials} materials, {len(selection.selected)} selected")
+    print(f"legacy if/elif   {legacy_time * 1000:8.1f} ms")
+    print(f"AssetSelector    {selector_time * 1000:8.1f} ms  ({legacy_time / selector_time:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
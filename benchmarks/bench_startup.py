@@ -0,0 +1,84 @@
+"""Cold start regression benchmark of the CLI.
+
+Imports tiramigiu in fresh interpreters and fails when the median wall time of
+the process goes over the budget, or when the browser stack (selenium,
+seleniumwire) gets imported without a login. Run from the repository root:
+
+    python benchmarks/bench_startup.py [--repeat 10] [--budget 0.5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import tiramigiu
+print(json.dumps({
+    'import': time.perf_counter() - started,
+    'browser_modules': sorted(name for name in ('selenium', 'seleniumwire') if name in sys.modules)
+}))
+"""
+
+
+def run_probe():
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    wall = time.perf_counter() - started
+    result = json.loads(output.strip().splitlines()[-1])
+    result['wall'] = wall
+    return result
+
+
+def slowest_imports(top):
+    """Return the slowest top-level imports of tiramigiu according to -X importtime."""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import tiramigiu'], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # Nesting is indented by two spaces per level, keep the direct imports of tiramigiu
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--budget', type=float, default=0.5, help='Maximum median process wall time in seconds')
+    parser.add_argument('--top', type=int, default=10, help='Slowest imports listed when over budget')
+    args = parser.parse_args()
+
+    # Warm the file system cache and __pycache__ so runs compare interpreter work only
+    run_probe()
+    results = [run_probe() for _ in range(args.repeat)]
+    wall = statistics.median(result['wall'] for result in results)
+    imports = statistics.median(result['import'] for result in results)
+    browser_modules = results[-1]['browser_modules']
+    print(f"{'process wall time':<22}{wall * 1000:8.1f}ms (median of {args.repeat}, budget {args.budget * 1000:.0f}ms)")
+    print(f"{'import tiramigiu':<22}{imports * 1000:8.1f}ms")
+
+    failed = False
+    if browser_modules:
+        print(f"FAIL: browser stack imported at startup: {', '.join(browser_modules)}")
+        failed = True
+    if wall > args.budget:
+        print("FAIL: startup over budget, slowest top-level imports:")
+        for cumulative, name in slowest_imports(args.top):
+            print(f"{cumulative / 1000:8.1f}ms  {name}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
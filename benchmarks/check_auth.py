@@ -0,0 +1,87 @@
+"""Check the silent re-authentication and its fallback to the browser login.
+
+Starts benchmarks/standin_server.py in-process with tokens behind a session
+cookie, points Meechum's authorization endpoint at it and has a fresh Backlot
+client authenticate:
+
+    silent  the endpoint grants a code to prompt=none, so the silent path must
+            sign in without opening the browser
+    login   the endpoint answers prompt=none with login_required, so Meechum
+            must fall back to the browser login
+
+The browser needs Chrome, so in this check it is replaced by a client following
+the interactive authorization redirect with plain requests. Exits with status 1
+when a mode takes the wrong path or ends without a token. Run from the
+repository root:
+
+    python benchmarks/check_auth.py
+"""
+import os
+import sys
+import tempfile
+import threading
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+from netflix.backlot import Backlot  # noqa: E402
+from netflix.meechum import Meechum  # noqa: E402
+from standin_server import StandIn, serve  # noqa: E402
+
+# Authorizations each mode must end up with
+EXPECTED = {
+    'silent': {'silent': 1},
+    'login': {'login_required': 1, 'interactive': 1}
+}
+
+
+def check(mode):
+    standin = StandIn(auth=mode)
+    server = serve(standin)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    browser_logins = []
+    try:
+        with tempfile.TemporaryDirectory() as profile_dir:
+            meechum = Meechum(profile_dir=profile_dir, auth_url=f"{url}/as/authorization.oauth2")
+
+            def browser_login(redirect_url):
+                browser_logins.append(redirect_url)
+                meechum.session.get(meechum.build_auth_url(redirect_url), timeout=10).raise_for_status()
+                meechum.save_session()
+
+            meechum.authenticate_with_browser = browser_login
+            backlot = Backlot(meechum, base_url=url, gateway_url=f"{url}/subscriptions/sse")
+            backlot.refresh_token()
+            if backlot.refresh_timer:
+                backlot.refresh_timer.cancel()
+    finally:
+        server.shutdown()
+        server.server_close()
+    failures = []
+    if not backlot.token_is_fresh():
+        failures.append('no access token')
+    if dict(standin.authorizations) != EXPECTED[mode]:
+        failures.append(f"authorizations {dict(standin.authorizations)}, expected {EXPECTED[mode]}")
+    if bool(browser_logins) != (mode == 'login'):
+        failures.append(f"{len(browser_logins)} browser logins")
+    return failures
+
+
+def main():
+    os.chdir(ROOT)
+    failed = False
+    for mode in EXPECTED:
+        failures = check(mode)
+        if failures:
+            failed = True
+            print(f"FAIL {mode}: {'; '.join(failures)}")
+        else:
+            print(f"OK {mode}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
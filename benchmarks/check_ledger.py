@@ -0,0 +1,105 @@
+"""Check that the ledger only skips titles whose selected materials are all on disk.
+
+Runs tiramigiu.py four times against benchmarks/standin_server.py and the fake
+ascp, with one ledger and download folder, and exits with status 1 when:
+
+    first    a title fails or is skipped on the first run
+    repeat   a title is not skipped once it is complete
+    deleted  the title whose files were deleted is skipped, or its files are not
+             downloaded again
+    added    a title is skipped after the stand-in added materials to it
+
+Run from the repository root:
+
+    python benchmarks/check_ledger.py [--titles 2] [--materials 6]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+FILE_SIZE = 1000
+
+
+def start_standin(materials):
+    command = [sys.executable, os.path.join(BENCHMARKS, 'standin_server.py'), '--port', '0',
+               '--materials', str(materials), '--latency', '0']
+    server = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    return server, server.stdout.readline().strip()
+
+
+def run(work_dir, materials, movie_ids):
+    """Run tiramigiu.py and return its run counters and the downloaded files of each title."""
+    server, url = start_standin(materials)
+    report_path = os.path.join(work_dir, 'report.json')
+    command = [
+        sys.executable, os.path.join(ROOT, 'tiramigiu.py'),
+        '--backlot-url', url, '--gateway-url', f"{url}/subscriptions/sse", '--auth-url', f"{url}/as/authorization.oauth2",
+        '--ascp-path', os.path.join(BENCHMARKS, 'fake_ascp.py'),
+        '--download-dir', os.path.join(work_dir, 'dl'), '--profile-dir', os.path.join(work_dir, 'profile'),
+        '--ledger', os.path.join(work_dir, 'ledger.db'), '--no-cache', '--artifacts', 'off', '--report', report_path
+    ] + movie_ids
+    try:
+        subprocess.run(command, cwd=ROOT, env=dict(os.environ, FAKE_ASCP_FILE_SIZE=str(FILE_SIZE)),
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    finally:
+        server.terminate()
+        server.wait()
+    with open(report_path, 'r') as f:
+        counters = json.load(f)['counters']
+    os.unlink(report_path)
+    names = os.listdir(os.path.join(work_dir, 'dl'))
+    files = {movie_id: sorted(name for name in names if name.startswith(f"{movie_id}_")) for movie_id in movie_ids}
+    return counters, files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--titles', type=int, default=2)
+    parser.add_argument('--materials', type=int, default=6)
+    args = parser.parse_args()
+    movie_ids = [str(80000001 + index) for index in range(args.titles)]
+    failures = []
+    work_dir = tempfile.mkdtemp(prefix='check_ledger_')
+    try:
+        counters, files = run(work_dir, args.materials, movie_ids)
+        if counters.get('titles.succeeded') != args.titles or counters.get('titles.skipped'):
+            failures.append(f"first: {counters.get('titles.succeeded', 0)} succeeded, {counters.get('titles.skipped', 0)} skipped")
+        downloaded = {movie_id: len(names) for movie_id, names in files.items()}
+
+        counters, _ = run(work_dir, args.materials, movie_ids)
+        if counters.get('titles.skipped') != args.titles:
+            failures.append(f"repeat: {counters.get('titles.skipped', 0)}/{args.titles} titles skipped")
+
+        deleted = movie_ids[0]
+        for name in files[deleted]:
+            os.unlink(os.path.join(work_dir, 'dl', name))
+        counters, files = run(work_dir, args.materials, movie_ids)
+        if counters.get('titles.succeeded') != 1 or counters.get('titles.skipped') != args.titles - 1:
+            failures.append(f"deleted: {counters.get('titles.succeeded', 0)} succeeded, {counters.get('titles.skipped', 0)} skipped")
+        if len(files[deleted]) != downloaded[deleted]:
+            failures.append(f"deleted: {len(files[deleted])} of {downloaded[deleted]} files of {deleted} on disk")
+
+        counters, files = run(work_dir, args.materials * 2, movie_ids)
+        if counters.get('titles.skipped'):
+            failures.append(f"added: {counters['titles.skipped']} titles skipped")
+        unchanged = [movie_id for movie_id in movie_ids if len(files[movie_id]) <= downloaded[movie_id]]
+        if unchanged:
+            failures.append(f"added: no new files for {', '.join(unchanged)}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK: complete titles skipped, re-downloaded after deleting files and after materials were added")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Check the ascp progress parser, stall detection and periodic progress reporting.
+
+Feeds recorded ascp output lines through classes.progress.TransferProgress and
+checks the parsed bytes, size resolution, rate, ETA and completed files, then
+that a session counts as stalled only while its bytes stop moving. Finally runs
+Aspera.wait_with_progress on a short process with progress intervals of 0 and
+below, which must report nothing, and with a short interval, which must report
+progress and one stall warning. Exits with status 1 on any mismatch. Run from
+the repository root:
+
+    python benchmarks/check_progress.py
+"""
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from classes.aspera import Aspera  # noqa: E402
+from classes.progress import TransferProgress  # noqa: E402
+
+MB = 1024 ** 2
+# Recorded ascp output: (line, expected file, bytes, resolution, rate in bits/s, ETA in seconds), None for other lines
+LINES = [
+    ('Movie_PM51.wav     37%  371MB  49.8Mb/s    01:10 ETA', ('Movie_PM51.wav', 371 * MB, MB, 49.8e6, 70)),
+    ('Movie_PM51.wav     68%  682.5MB  51.2Mb/s    00:32 ETA', ('Movie_PM51.wav', int(682.5 * MB), MB / 10, 51.2e6, 32)),
+    ('Session Stop  (Error: Disk write failed)', None),
+    ('Movie_PM51.wav    100% 1003MB  50.1Mb/s    00:00 ETA', ('Movie_PM51.wav', 1003 * MB, MB, 50.1e6, 0)),
+    ('Dialogue List FR.pdf  100%  512KB  1.2Gb/s', ('Dialogue List FR.pdf', 512 * 1024, 1024, 1.2e9, None)),
+    ('Feature_UHD.mxf       3%  1.25GB  950Mb/s    1:02:40 ETA', ('Feature_UHD.mxf', int(1.25 * 1024 * MB), 1024 * MB / 100, 950e6, 3760)),
+    ('Completed: 1541620K bytes transferred in 21 seconds', None),
+    ('', None),
+]
+
+
+class Recorder:
+    """Logger stand-in keeping the messages per level."""
+
+    def __init__(self):
+        self.messages = {'info': [], 'warning': []}
+
+    def info(self, message):
+        self.messages['info'].append(message)
+
+    def warning(self, message):
+        self.messages['warning'].append(message)
+
+    def debug(self, message):
+        pass
+
+    error = warning
+
+
+def check_parser(failures):
+    snapshots = []
+    progress = TransferProgress(label='check', callback=snapshots.append)
+    for line, expected in LINES:
+        parsed = progress.parse_line(line)
+        if parsed != (expected is not None):
+            failures.append(f"{line!r}: parsed as {'progress' if parsed else 'other output'}")
+            continue
+        if expected is None:
+            continue
+        name, size, resolution, rate, eta = expected
+        info = progress.files.get(name, {})
+        got = (info.get('bytes'), info.get('resolution'), progress.current_rate, progress.eta)
+        if got[0] != size or abs(got[1] - resolution) > 1e-6 or abs(got[2] - rate) > 1e-3 or got[3] != eta:
+            failures.append(f"{line!r}: (bytes, resolution, rate, eta) {got}, expected {(size, resolution, rate, eta)}")
+    if len(snapshots) != sum(1 for _, expected in LINES if expected):
+        failures.append(f"{len(snapshots)} progress callbacks for {sum(1 for _, expected in LINES if expected)} progress lines")
+    expected_completed = {'Movie_PM51.wav': 1003 * MB, 'Dialogue List FR.pdf': 512 * 1024}
+    if progress.completed_files != expected_completed:
+        failures.append(f"completed files {progress.completed_files}, expected {expected_completed}")
+    # A later, lower figure, e.g. after ascp restarts a file, does not take bytes back
+    progress.parse_line('Movie_PM51.wav      5%  50MB  49.8Mb/s    01:10 ETA')
+    if progress.files['Movie_PM51.wav']['bytes'] != 1003 * MB:
+        failures.append(f"bytes of a file went back to {progress.files['Movie_PM51.wav']['bytes']}")
+
+
+def check_stalls(failures):
+    progress = TransferProgress(label='check', stall_timeout=0.2)
+    progress.parse_line('Feature_UHD.mxf       3%  1.25GB  950Mb/s    1:02:40 ETA')
+    if progress.stalled():
+        failures.append('stalled right after progress')
+    time.sleep(0.3)
+    if not progress.stalled():
+        failures.append(f"not stalled after {progress.stall_timeout}s without progress")
+    progress.parse_line('Feature_UHD.mxf       3%  1.25GB  0.0Mb/s    1:02:40 ETA')
+    if not progress.stalled():
+        failures.append('a line without new bytes ended the stall')
+    progress.parse_line('Feature_UHD.mxf       4%  1.26GB  950Mb/s    1:02:00 ETA')
+    if progress.stalled():
+        failures.append('still stalled after new bytes')
+    if progress.snapshot()['stalled']:
+        failures.append('the snapshot still reports a stall')
+
+
+def run_wait(progress_interval, stall_timeout=300):
+    snapshots = []
+    aspera = Aspera({}, ascp_path=sys.executable, progress_callback=snapshots.append,
+                    progress_interval=progress_interval, stall_timeout=stall_timeout)
+    aspera.logger = Recorder()
+    process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(0.5)'])
+    returncode = aspera.wait_with_progress(process)
+    return returncode, aspera.logger.messages, snapshots
+
+
+def check_wait(failures):
+    for interval in (0, -1):
+        returncode, messages, _ = run_wait(interval)
+        if returncode != 0 or messages['info'] or messages['warning']:
+            failures.append(f"interval {interval}: return code {returncode}, {len(messages['info'])} progress lines, "
+                            f"{len(messages['warning'])} warnings")
+    returncode, messages, snapshots = run_wait(0.1, stall_timeout=0.15)
+    if returncode != 0 or len(messages['info']) < 2:
+        failures.append(f"interval 0.1: return code {returncode}, {len(messages['info'])} progress lines")
+    if len(messages['warning']) != 1 or len(snapshots) != 1:
+        failures.append(f"interval 0.1: {len(messages['warning'])} stall warnings and {len(snapshots)} stall callbacks, expected 1")
+
+
+def main():
+    failures = []
+    check_parser(failures)
+    check_stalls(failures)
+    check_wait(failures)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"OK: {len(LINES)} recorded lines parsed, stalls detected, progress reported only with a positive interval")
+
+
+if __name__ == '__main__':
+    main()
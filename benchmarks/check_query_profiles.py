@@ -0,0 +1,189 @@
+"""Check that the lean and full query profiles extract the same materials.
+
+Takes a downloadMaterials response with every field of the full query, either
+the synthetic one of benchmarks/standin_server.py or the assets_<movie_id>.json
+artifacts of a run with --query-profile full --artifacts full, and projects it
+onto the selection set of each profile's query, as the gateway would answer it.
+Both projections go through Backlot.extract_asset_info and the selection rules,
+and the script exits with status 1 when their results differ. Run from the
+repository root:
+
+    python benchmarks/check_query_profiles.py [--materials 1000] [--replay artifacts/<run_id>]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+from classes.selection import AssetSelector  # noqa: E402
+from netflix.backlot import Backlot  # noqa: E402
+from netflix.material import Material  # noqa: E402
+from netflix.meechum import Meechum  # noqa: E402
+from standin_server import StandIn  # noqa: E402
+
+TOKEN = re.compile(r'\.\.\.\s*\w+|[{}()]|\w+|[^\s\w{}()]')
+
+
+def parse_selection(query, root):
+    """Return the selection set under the `root` field of a query as nested dicts, None for leaf fields."""
+    tokens = TOKEN.findall(re.sub(r'#.*', '', query))
+    fragments = {}
+    position = 0
+    operation = None
+
+    def skip_arguments(index):
+        depth = 0
+        while True:
+            depth += {'(': 1, ')': -1}.get(tokens[index], 0)
+            index += 1
+            if depth == 0:
+                return index
+
+    def parse_set(index):
+        # tokens[index] is "{"; returns the fields and the index after the matching "}"
+        fields = {}
+        index += 1
+        while tokens[index] != '}':
+            token = tokens[index]
+            if token.startswith('...'):
+                fields.setdefault('...', []).append(token[3:].strip())
+                index += 1
+                continue
+            name, index = token, index + 1
+            if tokens[index] == ':':
+                # Aliases are not used by the queries of this repository
+                raise ValueError(f"Unsupported alias {name}")
+            if tokens[index] == '(':
+                index = skip_arguments(index)
+            if tokens[index] == '{':
+                fields[name], index = parse_set(index)
+            else:
+                fields[name] = None
+        return fields, index + 1
+
+    while position < len(tokens):
+        if tokens[position] == 'fragment':
+            name = tokens[position + 1]
+            # fragment <name> on <type> {
+            fragments[name], position = parse_set(position + 4)
+        elif tokens[position] == '{':
+            operation, position = parse_set(position)
+        else:
+            position += 1
+
+    def expand(fields):
+        if fields is None:
+            return None
+        expanded = {}
+        for name in fields.get('...', []):
+            expanded.update(expand(fragments[name]))
+        expanded.update((name, expand(sub)) for name, sub in fields.items() if name != '...')
+        return expanded
+
+    return expand(operation)[root]
+
+
+def project(value, fields):
+    """Keep only the fields of a selection set, like a GraphQL server answering the query."""
+    if fields is None or value is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, fields) for item in value]
+    return {name: project(value[name], sub) for name, sub in fields.items() if name in value}
+
+
+def fill(value, fields, path='x'):
+    """Add a placeholder for every field of the selection set a response is missing."""
+    if fields is None:
+        return value
+    if isinstance(value, list):
+        return [fill(item, fields, path) for item in value]
+    value = dict(value)
+    for name, sub in fields.items():
+        if name not in value:
+            value[name] = f"{path}.{name}" if sub is None else {}
+        if sub is not None and value[name] is not None:
+            value[name] = fill(value[name], sub, f"{path}.{name}")
+    return value
+
+
+def subset(small, large, path=''):
+    """Return the fields of `small` that `large` does not select."""
+    missing = []
+    for name, sub in small.items():
+        if name not in large:
+            missing.append(f"{path}{name}")
+        elif sub is not None:
+            missing.extend(subset(sub, large[name] or {}, f"{path}{name}."))
+    return missing
+
+
+def load_responses(args, full_fields):
+    if args.replay:
+        responses = []
+        for name in sorted(os.listdir(args.replay)):
+            if re.match(r'^assets_.+\.json$', name):
+                with open(os.path.join(args.replay, name), 'r') as f:
+                    responses.append(json.load(f))
+        if not responses:
+            raise SystemExit(f"No assets_<movie_id>.json artifacts in {args.replay}")
+        return responses
+    standin = StandIn(materials=args.materials, requests_per_title=args.requests_per_title)
+    response = standin.download_materials(standin.request_ids('80000001'))
+    return [{'sr_downloadMaterials': fill(response['sr_downloadMaterials'], full_fields)}]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--materials', type=int, default=1000, help='Materials of the synthetic response')
+    parser.add_argument('--requests-per-title', type=int, default=4)
+    parser.add_argument('--replay', default=None, help='Directory of assets_<movie_id>.json artifacts to check instead')
+    parser.add_argument('--selection-config', default=os.path.join(ROOT, 'config', 'selection.json'))
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    with tempfile.TemporaryDirectory() as profile_dir:
+        backlot = Backlot(Meechum(profile_dir=profile_dir))
+    selections = {profile: parse_selection(queries['downloadMaterials'], 'sr_downloadMaterials')
+                  for profile, queries in backlot.queries.items()}
+    missing = subset(selections['lean'], selections['full'])
+    if missing:
+        print(f"FAIL: the lean query selects fields the full query does not: {', '.join(missing)}")
+        sys.exit(1)
+
+    selector = AssetSelector.from_file(args.selection_config, field_getter=Material.field_getter)
+    failures = 0
+    checked = 0
+    for response in load_responses(args, selections['full']):
+        results = {}
+        for profile, fields in selections.items():
+            assets = backlot.extract_asset_info({'sr_downloadMaterials': project(response.get('sr_downloadMaterials'), fields)})
+            selection = selector.select(assets)
+            results[profile] = {
+                'assets': [asset.to_dict() for asset in assets],
+                'available': [asset.to_dict() for asset in selection.available],
+                'selected': [asset.to_dict() for asset in selection.selected]
+            }
+        checked += len(results['full']['assets'])
+        for key in ('assets', 'available', 'selected'):
+            full, lean = results['full'][key], results['lean'][key]
+            if full != lean:
+                failures += 1
+                index = next((i for i, (a, b) in enumerate(zip(full, lean)) if a != b), min(len(full), len(lean)))
+                print(f"FAIL: {key} differ at index {index} ({len(full)} full, {len(lean)} lean)")
+                print(f"  full: {full[index] if index < len(full) else None}")
+                print(f"  lean: {lean[index] if index < len(lean) else None}")
+    if failures:
+        sys.exit(1)
+    print(f"OK: {checked} materials extract and select identically with the lean and full profiles")
+
+
+if __name__ == '__main__':
+    main()
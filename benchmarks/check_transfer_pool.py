@@ -0,0 +1,90 @@
+"""Check the rate split and session limit of the shared Aspera pool.
+
+Runs benchmarks/bench_pipeline.py with the fake ascp logging every session it
+runs: with a total rate budget, pipelined and with every title run start to
+finish by its own worker, where only the pool's slots bound the sessions, then
+without a budget. Exits with status 1 when:
+
+    budget     a session is not started with -l <target rate / sessions>m and
+               --policy=fair, or more sessions than --parallel-transfers run at
+               once, or the limit is never reached
+    unlimited  a session is started with -l or --policy
+
+Run from the repository root:
+
+    python benchmarks/check_transfer_pool.py [--titles 4] [--parallel-transfers 3] [--target-rate 100]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+
+
+def run(args, *options):
+    """Run the pipeline benchmark and return the ascp sessions the fake ascp logged."""
+    with tempfile.TemporaryDirectory() as work_dir:
+        log_path = os.path.join(work_dir, 'sessions.jsonl')
+        results_path = os.path.join(work_dir, 'results.json')
+        # Slow enough for the sessions of several titles to overlap
+        command = [sys.executable, os.path.join(BENCHMARKS, 'bench_pipeline.py'), '--titles', str(args.titles),
+                   '--materials', '100', '--rate', '20', '--latency', '0', '--json', results_path,
+                   '--', '--workers', str(args.titles), '--parallel-transfers', str(args.parallel_transfers), *options]
+        subprocess.run(command, env=dict(os.environ, FAKE_ASCP_LOG=log_path), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if not os.path.exists(results_path) or not os.path.exists(log_path):
+            raise SystemExit(f"FAIL: {' '.join(command)} did not finish")
+        with open(results_path, 'r') as f:
+            result = json.load(f)[0]
+        with open(log_path, 'r') as f:
+            sessions = [json.loads(line) for line in f]
+    if result['succeeded'] != args.titles:
+        raise SystemExit(f"FAIL: {result['succeeded']}/{args.titles} titles succeeded")
+    return sessions
+
+
+def peak_sessions(sessions):
+    """Return the most sessions running at the same time."""
+    events = sorted([(session['started'], 1) for session in sessions] + [(session['finished'], -1) for session in sessions],
+                    key=lambda event: (event[0], event[1]))
+    running = peak = 0
+    for _, change in events:
+        running += change
+        peak = max(peak, running)
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--titles', type=int, default=4)
+    parser.add_argument('--parallel-transfers', type=int, default=3)
+    parser.add_argument('--target-rate', type=int, default=100, help='Total rate budget in Mbps')
+    args = parser.parse_args()
+    failures = []
+
+    expected = f"{max(1, args.target_rate // args.parallel_transfers)}m"
+    for mode, options in (('pipelined', ()), ('unpipelined', ('--pipeline-depth', '0'))):
+        sessions = run(args, '--target-rate', str(args.target_rate), *options)
+        rates = sorted({(session['rate'], session['policy']) for session in sessions}, key=str)
+        if rates != [(expected, 'fair')]:
+            failures.append(f"budget, {mode}: sessions started with (-l, --policy) {rates}, expected {[(expected, 'fair')]}")
+        peak = peak_sessions(sessions)
+        if peak != args.parallel_transfers:
+            failures.append(f"budget, {mode}: at most {peak} of {len(sessions)} sessions ran at once, expected {args.parallel_transfers}")
+
+    sessions = run(args)
+    limited = [session for session in sessions if session['rate'] or session['policy']]
+    if limited:
+        failures.append(f"unlimited: {len(limited)} of {len(sessions)} sessions started with -l or --policy")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"OK: {args.parallel_transfers} sessions at most, each at -l {expected} with --policy=fair, unlimited without a budget")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Check that transfer verification re-queues truncated files, small ones included.
+
+Runs benchmarks/bench_pipeline.py with small files and the fake ascp
+truncating every other file of a transfer the first time, and exits with
+status 1 when:
+
+    sizes    with exact sizes in the manifests, a truncated file is not
+             re-queued, or a title ends with a file of the wrong size
+    rounded  with only ascp's rounded sizes to compare, files are counted as
+             verified, or a title fails
+
+Run from the repository root:
+
+    python benchmarks/check_verify.py [--titles 2] [--materials 8] [--file-size 65536]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+
+
+def run(args, *options):
+    with tempfile.TemporaryDirectory() as work_dir:
+        results_path = os.path.join(work_dir, 'results.json')
+        command = [sys.executable, os.path.join(BENCHMARKS, 'bench_pipeline.py'), '--titles', str(args.titles),
+                   '--materials', str(args.materials), '--file-size', str(args.file_size), '--latency', '0',
+                   '--json', results_path, *options]
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if not os.path.exists(results_path):
+            raise SystemExit(f"FAIL: {' '.join(command)} wrote no results")
+        with open(results_path, 'r') as f:
+            return json.load(f)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--titles', type=int, default=2)
+    parser.add_argument('--materials', type=int, default=8)
+    parser.add_argument('--file-size', type=int, default=65536, help='Bytes per file, below the 0.1MB resolution of ascp sizes by default')
+    args = parser.parse_args()
+    failures = []
+
+    result = run(args, '--truncate', '2', '--manifest-sizes')
+    counters = result['counters']
+    files = args.titles * args.materials
+    if result['succeeded'] != args.titles:
+        failures.append(f"sizes: {result['succeeded']}/{args.titles} titles succeeded")
+    if not counters.get('verify.requeued') or counters.get('verify.failed') != counters.get('verify.requeued'):
+        failures.append(f"sizes: {counters.get('verify.failed', 0)} files failed verification, {counters.get('verify.requeued', 0)} re-queued")
+    if counters.get('verify.unverified'):
+        failures.append(f"sizes: {counters['verify.unverified']} files unverified despite exact sizes")
+    if counters.get('store.linked_bytes') != files * args.file_size:
+        failures.append(f"sizes: {counters.get('store.linked_bytes', 0)} bytes linked to titles, expected {files * args.file_size}")
+
+    result = run(args)
+    counters = result['counters']
+    if result['succeeded'] != args.titles:
+        failures.append(f"rounded: {result['succeeded']}/{args.titles} titles succeeded")
+    if counters.get('verify.unverified') != counters.get('verify.files'):
+        failures.append(f"rounded: {counters.get('verify.unverified', 0)} of {counters.get('verify.files', 0)} files reported unverified")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"OK: truncated {args.file_size}-byte files re-queued with exact sizes, reported unverified without")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Stand-in for ascp that accepts tiramigiu's command line and writes dummy files.
+
+Reads the --file-pair-list, writes every destination under the target directory
+and prints progress lines in ascp's format. Behaviour is set through environment
+variables:
+
+    FAKE_ASCP_FILE_SIZE  bytes written per file (default 65536)
+    FAKE_ASCP_RATE       simulated rate in Mbps, 0 for as fast as possible (default 0)
+    FAKE_ASCP_FAIL       exit status to fail with after the transfer (default 0)
+    FAKE_ASCP_TRUNCATE   write only half of every Nth file, while still reporting it
+                         complete, the first time it is transferred (default 0, off)
+    FAKE_ASCP_LOG        append a JSON line per session to this file, with its start
+                         and end time, -l rate, --policy and number of files
+"""
+import json
+import os
+import sys
+import time
+
+BLOCK = b'\0' * (1024 * 1024)
+
+
+def main():
+    args = sys.argv[1:]
+    wall_started = time.time()
+    pair_list = next(arg.split('=', 1)[1] for arg in args if arg.startswith('--file-pair-list='))
+    target = args[-1]
+    size = int(os.environ.get('FAKE_ASCP_FILE_SIZE', 65536))
+    rate = float(os.environ.get('FAKE_ASCP_RATE', 0))
+    truncate = int(os.environ.get('FAKE_ASCP_TRUNCATE', 0))
+    with open(pair_list, 'r') as f:
+        lines = f.read().splitlines()
+    started = time.monotonic()
+    total = 0
+    for index, destination in enumerate(lines[1::2]):
+        path = os.path.join(target, destination)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        written = size
+        if truncate and index % truncate == 0:
+            # Marked in the target directory so that the next transfer of the file succeeds
+            marker = os.path.join(target, '.fake_ascp_truncated', destination.replace('/', '_'))
+            if not os.path.exists(marker):
+                os.makedirs(os.path.dirname(marker), exist_ok=True)
+                open(marker, 'w').close()
+                written = size // 2
+        with open(path, 'wb') as f:
+            remaining = written
+            while remaining > 0:
+                remaining -= f.write(BLOCK[:min(remaining, len(BLOCK))])
+        total += size
+        if rate:
+            # Sleep until the simulated link would have carried every byte so far
+            time.sleep(max(0.0, total * 8 / (rate * 1e6) - (time.monotonic() - started)))
+        elapsed = max(time.monotonic() - started, 1e-6)
+        sys.stdout.write(f"{os.path.basename(destination)}  100%  {size / 1024 / 1024:.1f}MB  "
+                         f"{total * 8 / elapsed / 1e6:.1f}Mb/s    00:00 ETA\n")
+    sys.stdout.write(f"Completed: {total // 1024}K bytes transferred in {time.monotonic() - started:.0f} seconds\n")
+    sys.stdout.flush()
+    if os.environ.get('FAKE_ASCP_LOG'):
+        session = {
+            'started': wall_started,
+            'finished': time.time(),
+            'rate': args[args.index('-l') + 1] if '-l' in args else None,
+            'policy': next((arg.split('=', 1)[1] for arg in args if arg.startswith('--policy=')), None),
+            'files': len(lines) // 2
+        }
+        with open(os.environ['FAKE_ASCP_LOG'], 'a') as f:
+            f.write(json.dumps(session) + '\n')
+    sys.exit(int(os.environ.get('FAKE_ASCP_FAIL', 0)))
+
+
+if __name__ == '__main__':
+    main()
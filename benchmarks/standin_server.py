@@ -0,0 +1,335 @@
+"""Local stand-in for the Backlot and studio gateway endpoints used by tiramigiu.
+
+Serves /meechum?info=json, /api/sourceRequests and /subscriptions/sse with
+synthetic responses of a configurable size and latency, or replays the debug
+artifacts of an earlier run (assets_<movie_id>.json and
+aspera_manifests_<movie_id>.json, written with --artifacts full). Titles
+missing from the replay directory get synthetic responses. Run from the
+repository root:
+
+    python benchmarks/standin_server.py [--port 8700] [--materials 1000] [--latency 0.05]
+
+and point tiramigiu at it:
+
+    python tiramigiu.py --backlot-url http://127.0.0.1:8700 \\
+        --gateway-url http://127.0.0.1:8700/subscriptions/sse \\
+        --ascp-path benchmarks/fake_ascp.py --download-dir /tmp/dl <movie_id> ...
+
+With --auth silent or --auth login, the access token also needs a session
+cookie, which /meechum?code=... sets after the Meechum authorization endpoint
+/as/authorization.oauth2 redirected there. In silent mode that endpoint grants
+a code even with prompt=none, so the silent re-authentication succeeds. In login
+mode it answers prompt=none with login_required, so the browser login is
+needed. Pass --auth-url <url>/as/authorization.oauth2 to tiramigiu.
+
+The first line printed is the URL the server listens on.
+"""
+import argparse
+import base64
+import collections
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+# Types picked by config/selection.json first, the others are never selected
+SELECTED_TYPES = ['FINAL_PROXY', 'DIALOGUE_LIST', 'PRINT_MASTER_5_1_CH', 'DIALOG_MUSIC_AND_EFFECTS_2_0_CH']
+OTHER_TYPES = ['ORIGINAL_CAMERA_FILE', 'VFX_PLATE', 'TIMED_TEXT', 'AUDIO_STEM', 'ARCHIVAL_MASTER']
+LANGUAGES = ['en', 'es', 'fr', 'de', 'ja']
+AUTH_MODES = ('none', 'silent', 'login')
+SESSION_COOKIE = 'standin_session'
+
+
+class StandIn:
+    """Synthetic and replayed Backlot data, shared by the request handlers."""
+
+    def __init__(self, materials=1000, requests_per_title=4, files_per_batch=20, latency=0.0, replay_dir=None, shared=False, max_rps=0,
+                 auth='none', file_size=None):
+        self.materials = materials
+        self.requests_per_title = max(1, requests_per_title)
+        self.files_per_batch = max(1, files_per_batch)
+        self.latency = latency
+        # Calls per second served before answering 429, 0 for unlimited
+        self.max_rps = max_rps
+        self.window = collections.deque()
+        self.lock = threading.Lock()
+        # Every title points at the same files, like episodes sharing their assets
+        self.shared = shared
+        # Whether tokens need a session cookie, and how the authorization endpoint answers prompt=none
+        if auth not in AUTH_MODES:
+            raise ValueError(f"Unknown auth mode: {auth}")
+        self.auth = auth
+        # Exact size announced for every file of the manifests, as fileSize, like the fake ascp writes them
+        self.file_size = file_size
+        self.sessions = set()
+        # Authorizations by outcome: silent, login_required and interactive
+        self.authorizations = collections.Counter()
+        self.recorded_assets = {}
+        self.recorded_manifests = {}
+        # Recorded source request ID -> movie ID
+        self.request_owners = {}
+        if replay_dir:
+            self.load_replay(replay_dir)
+
+    def load_replay(self, directory):
+        for name in os.listdir(directory):
+            match = re.match(r'^(assets|aspera_manifests)_(.+)\.json$', name)
+            if not match:
+                continue
+            with open(os.path.join(directory, name), 'r') as f:
+                data = json.load(f)
+            kind, movie_id = match.groups()
+            if kind == 'assets':
+                self.recorded_assets[movie_id] = data
+                for item in data.get('sr_downloadMaterials') or []:
+                    self.request_owners[item['sourceRequestId']] = movie_id
+            else:
+                self.recorded_manifests[movie_id] = data
+
+    def throttled(self):
+        """Record a call and tell whether it exceeds the rate of the last second."""
+        if not self.max_rps:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            while self.window and self.window[0] <= now - 1:
+                self.window.popleft()
+            if len(self.window) >= self.max_rps:
+                return True
+            self.window.append(now)
+            return False
+
+    def authorize(self, query):
+        """Return the redirect of the authorization endpoint: a code, or login_required for a silent attempt in login mode."""
+        silent = query.get('prompt') == ['none']
+        params = {'state': (query.get('state') or [''])[0]}
+        with self.lock:
+            if silent and self.auth == 'login':
+                self.authorizations['login_required'] += 1
+                params['error'] = 'login_required'
+            else:
+                self.authorizations['silent' if silent else 'interactive'] += 1
+                params['code'] = uuid.uuid4().hex
+        return f"{query['redirect_uri'][0]}?{urlencode(params)}"
+
+    def open_session(self):
+        session = uuid.uuid4().hex
+        with self.lock:
+            self.sessions.add(session)
+        return session
+
+    def has_session(self, cookies):
+        if self.auth == 'none':
+            return True
+        for cookie in (cookies or '').split(';'):
+            name, _, value = cookie.strip().partition('=')
+            if name == SESSION_COOKIE and value in self.sessions:
+                return True
+        return False
+
+    def token(self):
+        claims = json.dumps({'exp': int(time.time()) + 3600}).encode('utf-8')
+        return 'standin.' + base64.urlsafe_b64encode(claims).decode('ascii').rstrip('=') + '.signature'
+
+    def request_ids(self, movie_id):
+        if movie_id in self.recorded_assets:
+            return [item['sourceRequestId'] for item in self.recorded_assets[movie_id].get('sr_downloadMaterials') or []]
+        return [f"{movie_id}-sr{index}" for index in range(self.requests_per_title)]
+
+    def owner(self, request_id):
+        return self.request_owners.get(request_id) or request_id.rsplit('-sr', 1)[0]
+
+    def download_materials(self, request_ids):
+        items = []
+        for request_id in request_ids:
+            movie_id = self.owner(request_id)
+            if movie_id in self.recorded_assets:
+                items.extend(item for item in self.recorded_assets[movie_id].get('sr_downloadMaterials') or []
+                             if item['sourceRequestId'] == request_id)
+            else:
+                items.append({'sourceRequestId': request_id, 'materials': self.synthetic_materials(movie_id, request_id)})
+        return {'sr_downloadMaterials': items}
+
+    def synthetic_materials(self, movie_id, request_id):
+        index = int(request_id.rsplit('-sr', 1)[1])
+        # Spread the title's materials over its source requests
+        count = self.materials // self.requests_per_title + (1 if index < self.materials % self.requests_per_title else 0)
+        materials = []
+        for number in range(count):
+            if number < len(SELECTED_TYPES):
+                material_type = SELECTED_TYPES[number]
+            else:
+                material_type = OTHER_TYPES[number % len(OTHER_TYPES)]
+            file_name = f"sr{index}_{number}_{material_type}.mov" if self.shared else f"{request_id}_{number}_{material_type}.mov"
+            materials.append({
+                'createdDate': '2024-05-01T10:00:00Z',
+                'language': LANGUAGES[number % len(LANGUAGES)],
+                'status': 'INACTIVE' if number >= len(SELECTED_TYPES) and number % 10 == 0 else 'ACTIVE',
+                'type': material_type,
+                'rootAmpAsset': {'assetId': {'id': f"amp-{request_id}-{number}", 'version': 1}},
+                'file': {'name': file_name, 'location': {'url': f"s3://standin/{'shared' if self.shared else movie_id}/{file_name}"}},
+                'movie': {'movieId': movie_id, 'internalTitle': f"Title {movie_id}"},
+                'packageWrapper': {'id': f"pkg-{request_id}-{number}"} if number % 2 else None
+            })
+        return materials
+
+    def manifests(self, requests):
+        movie_ids = {self.owner(request.get('sourceRequestId') or '') for request in requests}
+        if len(movie_ids) == 1 and next(iter(movie_ids)) in self.recorded_manifests:
+            return {'sr_setupDownloadSessionsForMaterials': self.recorded_manifests[next(iter(movie_ids))]}
+        files = []
+        for request in requests:
+            url = (request.get('materialFilter') or {}).get('fileLocationUrl') or f"s3://standin/{uuid.uuid4()}"
+            files.append({
+                'asperaSource': url,
+                'correlationId': str(uuid.uuid5(uuid.NAMESPACE_URL, url + '#correlation')),
+                'destinationPath': '/' + os.path.basename(url),
+                'fileIdUuid': str(uuid.uuid5(uuid.NAMESPACE_URL, url))
+            })
+            if self.file_size is not None:
+                files[-1]['fileSize'] = self.file_size
+        batches = []
+        for start in range(0, len(files), self.files_per_batch):
+            batches.append({
+                'asperaHost': '127.0.0.1',
+                'asperaBatchUuid': str(uuid.uuid4()),
+                'asperaTransportToken': 'standin-transport-token',
+                'utsUuid': str(uuid.uuid4()),
+                'fileDownloads': files[start:start + self.files_per_batch]
+            })
+        return {'sr_setupDownloadSessionsForMaterials': {'errors': [], 'session': [{'asperaBatches': batches, 'utsUuid': str(uuid.uuid4())}]}}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    standin: StandIn
+
+    def do_GET(self):
+        time.sleep(self.standin.latency)
+        if self.standin.throttled():
+            return self.send_throttled()
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/meechum' and 'info=json' in url.query:
+            if not self.standin.has_session(self.headers.get('Cookie')):
+                return self.send_json({'error': 'Not authenticated'}, status=401)
+            return self.send_json({'access_token': self.standin.token(), 'expires_in': 3600})
+        if url.path == '/meechum' and 'code' in query:
+            # The redirect endpoint exchanges the authorization code for a session cookie
+            payload = b'<html><body>Signed in</body></html>'
+            self.send_response(200)
+            self.send_header('Set-Cookie', f"{SESSION_COOKIE}={self.standin.open_session()}; Path=/")
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        if url.path == '/as/authorization.oauth2' and 'redirect_uri' in query:
+            self.send_response(302)
+            self.send_header('Location', self.standin.authorize(query))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_json({'error': 'Not found'}, status=404)
+
+    def do_POST(self):
+        time.sleep(self.standin.latency)
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        if self.standin.throttled():
+            return self.send_throttled()
+        path = urlparse(self.path).path
+        if path == '/api/sourceRequests':
+            return self.send_json(self.source_requests(body))
+        if path == '/subscriptions/sse':
+            return self.send_subscription(body)
+        self.send_json({'error': 'Not found'}, status=404)
+
+    def source_requests(self, body):
+        movie_id = None
+        for clause in body['dataset']['and']:
+            for condition in clause['or']:
+                if condition['field'] == 'movieIds':
+                    movie_id = str(condition['eq'])
+        start = body['queryConfig']['start']
+        limit = body['queryConfig']['limit']
+        request_ids = self.standin.request_ids(movie_id)[start:start + limit]
+        return {'sourceRequest': [{'requestId': request_id} for request_id in request_ids]}
+
+    def send_subscription(self, body):
+        operation = body.get('operationName')
+        variables = body.get('variables') or {}
+        if operation == 'downloadMaterialsSubscription':
+            data = self.standin.download_materials(variables.get('sourceRequestIds') or [])
+        elif operation == 'downloadMaterialsManifestsSubscription':
+            data = self.standin.manifests(variables.get('requests') or [])
+        else:
+            return self.send_json({'error': f"Unknown operation {operation}"}, status=400)
+        payload = b'event: next\ndata: ' + json.dumps({'data': data}).encode('utf-8') + b'\n\n'
+        self.send_payload(payload, 'text/event-stream')
+
+    def send_throttled(self):
+        self.send_response(429)
+        self.send_header('Retry-After', '1')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_json(self, data, status=200):
+        self.send_payload(json.dumps(data).encode('utf-8'), 'application/json', status)
+
+    def send_payload(self, payload, content_type, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(standin, host='127.0.0.1', port=0):
+    """Create the stand-in server; call serve_forever() on the result."""
+    handler = type('Handler', (StandInHandler,), {'standin': standin})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8700, help='0 picks a free port')
+    parser.add_argument('--materials', type=int, default=1000, help='Synthetic materials per title')
+    parser.add_argument('--requests-per-title', type=int, default=4, help='Synthetic source requests per title')
+    parser.add_argument('--files-per-batch', type=int, default=20, help='Files per Aspera batch of the manifests')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--max-rps', type=int, default=0, help='Answer 429 with Retry-After above this many calls per second')
+    parser.add_argument('--shared', action='store_true', help='Point every synthetic title at the same files')
+    parser.add_argument('--replay', default=None, help='Directory of recorded assets_* and aspera_manifests_* artifacts')
+    parser.add_argument('--auth', choices=AUTH_MODES, default='none',
+                        help='Require a session cookie for tokens, granted silently (silent) or only after a browser login (login)')
+    parser.add_argument('--file-size', type=int, default=None,
+                        help='Announce this exact fileSize for every file of the manifests, e.g. the FAKE_ASCP_FILE_SIZE')
+    args = parser.parse_args()
+
+    standin = StandIn(materials=args.materials, requests_per_title=args.requests_per_title,
+                      files_per_batch=args.files_per_batch, latency=args.latency, replay_dir=args.replay,
+                      shared=args.shared, max_rps=args.max_rps, auth=args.auth, file_size=args.file_size)
+    server = serve(standin, args.host, args.port)
+    print(f"http://{args.host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from classes.log import Log
+from classes.metrics import Metrics, timed
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class ArtifactWriter:
+    """Writes per-title debug artifacts on a background thread.
+
+    Policies: "off" writes nothing, "errors" only keeps the artifacts of titles that
+    fail, "full" writes everything. Formats: "json" (indented), "compact" (no
+    whitespace) or "zstd" (compact, zstandard-compressed). Artifacts go to
+    `<directory>/<run_id>/<name>_<movie_id>.json[.zst]`, created with the first one.
+    With "errors", titles in flight keep their artifacts in memory, unserialized,
+    until they finish, and a later artifact of the same name replaces the earlier one.
+    """
+    POLICIES = ('off', 'errors', 'full')
+    FORMATS = ('json', 'compact', 'zstd')
+
+    def __init__(self, policy: str = 'full', format: str = 'json', directory: str = 'artifacts', run_id: Optional[str] = None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown artifact policy: {policy}")
+        if format not in self.FORMATS:
+            raise ValueError(f"Unknown artifact format: {format}")
+        if format == 'zstd' and zstandard is None:
+            raise ValueError("The zstd artifact format requires the zstandard package")
+        self.logger = Log().get_logger(self.__class__.__name__)
+        self.policy = policy
+        self.format = format
+        self.run_id = run_id or time.strftime('%Y%m%d-%H%M%S') + f"-{os.getpid()}"
+        self.directory = os.path.join(directory, self.run_id)
+        # Movie ID -> artifacts of the title by name, until it finishes
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.queue: 'queue.Queue[Optional[Tuple[str, str, Any]]]' = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        self.created = False
+        if policy != 'off':
+            self.thread = threading.Thread(target=self.run, name='artifact-writer', daemon=True)
+            self.thread.start()
+
+    @property
+    def enabled(self) -> bool:
+        return self.policy != 'off'
+
+    def write(self, movie_id: str, name: str, data: Union[Any, Callable[[], Any]]) -> None:
+        """Queue an artifact; `data` may be a callable so serialization happens off the critical path."""
+        if self.policy == 'off':
+            return
+        if self.policy == 'errors':
+            with self.lock:
+                self.pending.setdefault(movie_id, {})[name] = data
+            return
+        self.queue.put((movie_id, name, data))
+
+    def finish_title(self, movie_id: str, success: bool) -> None:
+        """Write a failed title's buffered artifacts, or drop them when it succeeded."""
+        with self.lock:
+            artifacts = self.pending.pop(movie_id, {})
+        if success or not artifacts:
+            return
+        self.logger.info(f"Writing {len(artifacts)} debug artifacts for failed movie ID {movie_id} to {self.directory}")
+        for name, data in artifacts.items():
+            self.queue.put((movie_id, name, data))
+
+    def path_for(self, movie_id: str, name: str) -> str:
+        extension = '.json.zst' if self.format == 'zstd' else '.json'
+        return os.path.join(self.directory, f"{name}_{movie_id}{extension}")
+
+    def run(self) -> None:
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self.write_file(*item)
+            except Exception as e:
+                self.logger.error(f"Failed to write artifact: {e}")
+            finally:
+                self.queue.task_done()
+
+    @timed('artifacts.write')
+    def write_file(self, movie_id: str, name: str, data: Any) -> None:
+        if callable(data):
+            data = data()
+        if self.format == 'json':
+            payload = json.dumps(data, indent=4)
+        else:
+            payload = json.dumps(data, separators=(',', ':'))
+        if not self.created:
+            os.makedirs(self.directory, exist_ok=True)
+            self.created = True
+        path = self.path_for(movie_id, name)
+        if self.format == 'zstd':
+            compressed = zstandard.ZstdCompressor(level=3).compress(payload.encode('utf-8'))
+            with open(path, 'wb') as f:
+                f.write(compressed)
+            Metrics().count('artifacts.bytes', len(compressed))
+        else:
+            with open(path, 'w') as f:
+                f.write(payload)
+            Metrics().count('artifacts.bytes', len(payload))
+
+    def close(self) -> None:
+        """Wait for queued artifacts to be written and stop the writer thread."""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
@@ -1,19 +1,52 @@
 import os
+import re
 import platform
 import subprocess
+from classes.content_store import ContentStore
+from classes.ledger import Ledger
 from classes.log import Log
+from classes.metrics import Metrics, timed
+from classes.progress import TransferProgress
+from classes.verify import Verifier, expected_checksum
 import tempfile
-from typing import Dict, List, Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 class Aspera:
-    def __init__(self, batch_info: Dict, download_folder: str = "./dl/", movie_id: str = ""):
+    def __init__(self, batch_info: Dict, download_folder: str = "./dl/", movie_id: str = "", ascp_path: Optional[str] = None,
+                 progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None, progress_interval: float = 30,
+                 stall_timeout: float = 300, ledger: Optional[Ledger] = None, store: Optional[ContentStore] = None,
+                 verifier: Optional[Verifier] = None):
         self.batch_info = batch_info
-        self.ascp_path = self.get_ascp_path()
+        self.ascp_path = ascp_path or self.get_ascp_path()
         self.aspera_key_path = self.get_aspera_key_path()
         self.logger = Log().get_logger(self.__class__.__name__)
         self.download_folder = download_folder
         self.movie_id = movie_id
-        
+        self.returncode: Optional[int] = None
+        self.ledger = ledger
+        # With a store, ascp downloads into the store and titles get links to its files
+        self.store = store
+        # Files handed to ascp by the last build_file_pairs call
+        self.file_entries: List[Dict[str, str]] = []
+        # Files of the batch still to download, and those another transfer was downloading
+        # when the file pairs were built
+        self.file_downloads: List[Dict[str, Any]] = batch_info.get('fileDownloads') or []
+        self.deferred: List[Dict[str, Any]] = []
+        self.link_errors = 0
+        # Completed files are checked by the verifier before being recorded; those failing
+        # the check are deleted and queued here to be transferred again
+        self.verifier = verifier
+        self.requeue: List[Dict[str, Any]] = []
+        self.succeeded = False
+        self.progress_interval = progress_interval
+        self.progress = TransferProgress(
+            label=f"{movie_id or 'batch'} {batch_info.get('asperaBatchUuid', '')}".strip(),
+            callback=progress_callback,
+            stall_timeout=stall_timeout
+        )
+
     def get_ascp_path(self) -> str:
         """Get the path to the ascp executable based on the operating system."""
         system = platform.system()
@@ -44,19 +77,18 @@ class Aspera:
         else:
             raise OSError("Unsupported operating system")
 
-    def start_batch_download(self) -> None:
-        """Start the batch download process using Aspera."""
-        aspera_host = self.batch_info['asperaHost']
-        aspera_transport_token = self.batch_info['asperaTransportToken']
-        aspera_user = self.batch_info.get('asperaUser', 'filetransfer')
-
-        if 'fileDownloads' not in self.batch_info or len(self.batch_info['fileDownloads']) == 0:
-            self.logger.error("No files to download.")
-            return
+    def build_file_pairs(self) -> List[Tuple[str, str]]:
+        """Build the source-destination pairs of the batch, creating destination folders.
 
-        # Create a list of source-destination pairs
+        Files the ledger already records as complete are left out. With a store, stored
+        files are linked right away, files another transfer is downloading are deferred,
+        and the others are downloaded into the store.
+        """
         file_pairs: List[Tuple[str, str]] = []
-        for file_info in self.batch_info['fileDownloads']:
+        self.file_entries = []
+        self.deferred = []
+        self.link_errors = 0
+        for file_info in self.file_downloads:
             aspera_source = file_info['asperaSource']
             
             # Construct the destination path
@@ -64,17 +96,131 @@ class Aspera:
             if self.movie_id:
                 destination_filename = f"{self.movie_id}_{destination_filename}"
             destination_dir = os.path.abspath(os.path.join(self.download_folder, destination_filename))
+            file_id = file_info.get('fileIdUuid') or file_info.get('correlationId') or aspera_source
+            if self.ledger and self.ledger.is_file_complete(self.movie_id, file_id, destination_dir):
+                self.logger.info(f"Skipping {destination_filename}, already downloaded")
+                continue
             os.makedirs(os.path.dirname(destination_dir), exist_ok=True)
+            key = None
+            if self.store:
+                key = self.store.key_for(file_info)
+                if self.link_from_store(key, file_id, destination_dir):
+                    continue
+                if not self.store.claim(key):
+                    self.deferred.append(file_info)
+                    continue
+                # Stored by another transfer between the lookup and the claim
+                if self.link_from_store(key, file_id, destination_dir):
+                    self.store.release(key)
+                    continue
+                destination_filename = self.store.partial_path(key, destination_filename)
             
             # Add the source-destination pair to the list
             file_pairs.append((aspera_source, destination_filename))
+            self.file_entries.append({'file_id': file_id, 'path': destination_dir, 'key': key, 'file_info': file_info})
+        return file_pairs
 
-        # Create a temporary file for the source-destination pairs
-        with tempfile.NamedTemporaryFile(mode='w', delete=False) as pair_list_file:
-            for source, destination in file_pairs:
-                self.logger.debug(f"Adding to queue: {destination}")
-                pair_list_file.write(f"{source}\n{destination}\n")
-            pair_list_filename = pair_list_file.name
+    def link_from_store(self, key: str, file_id: str, destination: str) -> bool:
+        """Link a destination to its stored file; False when the store does not have it yet."""
+        linked = self.store.lookup(key, destination)
+        if linked is None:
+            return False
+        if linked:
+            self.logger.info(f"Linked {os.path.basename(destination)} from the download store")
+            if self.ledger:
+                self.ledger.record_file(self.movie_id, file_id, destination)
+        else:
+            self.link_errors += 1
+        return True
+
+    def wait_for_deferred(self) -> None:
+        """Wait until the transfers of the deferred files are released."""
+        self.logger.info(f"Waiting for {len(self.deferred)} files downloaded by other transfers")
+        for file_info in self.deferred:
+            self.store.wait(self.store.key_for(file_info))
+
+    def release_claimed(self) -> None:
+        for entry in self.file_entries:
+            if entry['key']:
+                self.store.release(entry['key'])
+
+    def downloaded_path(self, entry: Dict[str, Any]) -> str:
+        """Where ascp wrote a file: its destination, or its partial path in the store."""
+        if entry['key']:
+            return os.path.join(self.store.root, *self.store.partial_path(entry['key'], entry['path']).split('/'))
+        return entry['path']
+
+    def build_check(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the verifier check of a downloaded file from the manifest, the ledger and the ascp progress.
+
+        The manifest queries request no size or checksum, so a file is normally only verified
+        against the SHA-256 recorded in the ledger for the same file ID (--ledger-checksum),
+        e.g. by another title. A size or checksum is still used should a manifest carry one.
+        Otherwise the size ascp showed is rounded, e.g. to 0.1MB, so it is only compared up
+        to that resolution, which catches gross truncation but does not verify the file.
+        """
+        check: Dict[str, Any] = {'path': self.downloaded_path(entry), 'checksum': expected_checksum(entry['file_info'])}
+        if check['checksum'] is None and self.ledger:
+            recorded = self.ledger.find_checksum(entry['file_id'])
+            if recorded:
+                check['checksum'] = ('sha256', recorded)
+        # The ledger checksum is computed here, on the verifier's processes
+        check['hash'] = bool(self.ledger and self.ledger.checksum)
+        size = entry['file_info'].get('fileSize', entry['file_info'].get('size'))
+        reported = self.progress.files.get(os.path.basename(entry['path']))
+        if size is not None:
+            check['size'] = int(size)
+        elif reported and reported['percent'] == 100:
+            check['size'] = reported['bytes']
+            check['size_tolerance'] = reported['resolution']
+        return check
+
+    def finish_batch(self) -> bool:
+        """Verify, store and record the files of the last transfer; after a failure only files ascp reported as complete.
+
+        Files failing verification are deleted and queued in `requeue`. Stored files are
+        committed to the store and linked to their destination before being recorded in
+        the ledger, then the claims on the store are released. Returns False on link errors
+        or when files failed verification.
+        """
+        self.requeue = []
+        try:
+            entries = [entry for entry in self.file_entries
+                       if self.succeeded or os.path.basename(entry['path']) in self.progress.completed_files]
+            results: List[Optional[Dict[str, Any]]] = [None] * len(entries)
+            if self.verifier and entries:
+                with Metrics().timer('verify.batch'):
+                    results = self.verifier.verify([self.build_check(entry) for entry in entries])
+            unverified = [os.path.basename(entry['path']) for entry, result in zip(entries, results)
+                          if result and result['ok'] and not result['verified']]
+            if unverified:
+                self.logger.debug(f"{len(unverified)} files could not be verified, no checksum or exact size is known: "
+                                    f"{', '.join(unverified[:10])}" + (', ...' if len(unverified) > 10 else ''))
+            for entry, result in zip(entries, results):
+                if result and not result['ok']:
+                    self.logger.warning(f"{os.path.basename(entry['path'])} failed verification ({result['error']}), queuing it again")
+                    try:
+                        os.unlink(self.downloaded_path(entry))
+                    except OSError:
+                        pass
+                    self.requeue.append(entry['file_info'])
+                    continue
+                if entry['key']:
+                    if not (self.store.commit(entry['key'], entry['path']) and self.store.link(entry['key'], entry['path'])):
+                        self.link_errors += 1
+                        continue
+                if self.ledger:
+                    checksum = result['checksum'] if result and result['algorithm'] == 'sha256' else None
+                    self.ledger.record_file(self.movie_id, entry['file_id'], entry['path'], checksum=checksum)
+        finally:
+            self.release_claimed()
+        return self.link_errors == 0 and not self.requeue
+
+    def build_command(self, pair_list_filename: str, max_rate: Optional[str] = None) -> List[str]:
+        """Build the ascp command line for a file pair list."""
+        aspera_host = self.batch_info['asperaHost']
+        aspera_transport_token = self.batch_info['asperaTransportToken']
+        aspera_user = self.batch_info.get('asperaUser', 'filetransfer')
         command = [
             self.ascp_path,
             "-i", self.aspera_key_path,
@@ -83,16 +229,179 @@ class Aspera:
             f"--host={aspera_host}",
             f"--user={aspera_user}",
             "--overwrite=diff",
-            f"--file-pair-list={pair_list_filename}",
-            self.download_folder.replace('\\', '/')
         ]
+        if max_rate:
+            command.extend(["-l", max_rate, "--policy=fair"])
+        command.extend([
+            f"--file-pair-list={pair_list_filename}",
+            (self.store.root if self.store else self.download_folder).replace('\\', '/')
+        ])
+        return command
+
+    @timed('aspera.batch')
+    def start_batch_download(self, max_rate: Optional[str] = None, finish: bool = True) -> bool:
+        """Start the batch download process using Aspera and wait for it to finish.
+
+        `max_rate` is passed to ascp's -l option, e.g. "2500m" for 2.5 Gbps. Without
+        `finish`, the caller runs `finish_batch` to verify and record the files.
+        """
+        if 'fileDownloads' not in self.batch_info or len(self.batch_info['fileDownloads']) == 0:
+            self.logger.error("No files to download.")
+            return False
+
+        # Create a list of source-destination pairs
+        self.succeeded = False
+        file_pairs = self.build_file_pairs()
+        if len(file_pairs) == 0:
+            if self.deferred:
+                self.logger.info(f"{len(self.deferred)} files of the batch are being downloaded by other transfers.")
+            else:
+                self.logger.info("All files of the batch are already downloaded.")
+            return self.link_errors == 0
+
+        # Create a temporary file for the source-destination pairs
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as pair_list_file:
+            for source, destination in file_pairs:
+                self.logger.debug(f"Adding to queue: {destination}")
+                pair_list_file.write(f"{source}\n{destination}\n")
+            pair_list_filename = pair_list_file.name
+        command = self.build_command(pair_list_filename, max_rate)
 
         try:
-            self.logger.info("Starting batch download...")
-            subprocess.run(command, check=True)
+            self.logger.info(f"Starting batch download of {len(file_pairs)} files" + (f" at up to {max_rate}" if max_rate else "") + "...")
+            self.progress.reset()
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            reader = threading.Thread(target=self.read_output, args=(process.stdout,), daemon=True)
+            reader.start()
+            self.returncode = self.wait_with_progress(process)
+            reader.join()
+            self.logger.info(self.progress.summary())
+            metrics = Metrics()
+            metrics.count('aspera.bytes', self.progress.bytes_transferred)
+            metrics.count('aspera.files', len(self.progress.completed_files))
+            if self.returncode != 0:
+                raise subprocess.CalledProcessError(self.returncode, command)
             self.logger.info("Batch download finished successfully.")
-        except subprocess.CalledProcessError as e:
+            self.succeeded = True
+        except (OSError, subprocess.CalledProcessError) as e:
             self.logger.error(f"Error during batch download: {e}")
+        except BaseException:
+            self.release_claimed()
+            raise
         finally:
             # Remove the temporary file
-            os.unlink(pair_list_filename)
\ No newline at end of file
+            os.unlink(pair_list_filename)
+        if finish:
+            return self.finish_batch() and self.succeeded
+        return self.succeeded
+
+    def read_output(self, stream) -> None:
+        """Feed ascp output to the progress tracker; progress lines are terminated by CR, others by LF."""
+        buffer = b''
+        for chunk in iter(lambda: stream.read1(65536), b''):
+            buffer += chunk
+            lines = re.split(b'[\r\n]', buffer)
+            buffer = lines.pop()
+            for raw_line in lines:
+                self.handle_output_line(raw_line.decode('utf-8', errors='replace'))
+        if buffer:
+            self.handle_output_line(buffer.decode('utf-8', errors='replace'))
+        stream.close()
+
+    def handle_output_line(self, line: str) -> None:
+        if line.strip() and not self.progress.parse_line(line):
+            self.logger.debug(f"ascp: {line.strip()}")
+
+    def wait_with_progress(self, process: subprocess.Popen) -> int:
+        """Wait for ascp to exit, logging progress every `progress_interval` seconds and warning on stalls.
+
+        A `progress_interval` of 0 or less disables both, and only the summary at the end is logged.
+        """
+        if self.progress_interval <= 0:
+            return process.wait()
+        stall_reported = False
+        while True:
+            try:
+                return process.wait(timeout=self.progress_interval)
+            except subprocess.TimeoutExpired:
+                self.logger.info(self.progress.summary())
+                if self.progress.stalled():
+                    if not stall_reported:
+                        self.logger.warning(f"{self.progress.label}: no progress for over {self.progress.stall_timeout:.0f}s, transfer may need a restart")
+                        if self.progress.callback:
+                            self.progress.callback(self.progress.snapshot())
+                    stall_reported = True
+                else:
+                    stall_reported = False
+
+
+class AsperaPool:
+    """Runs Aspera batches concurrently within a shared number of ascp sessions.
+
+    The pool is shared by every title of a run, so `max_parallel` bounds the ascp
+    sessions on the host. `target_rate` (in Mbps) is split evenly across the session
+    slots so that all running sessions together stay within the budget. Files failing
+    verification are transferred again up to `verify_retries` times per batch.
+    """
+
+    def __init__(self, max_parallel: int = 1, target_rate: Optional[int] = None, verify_retries: int = 2):
+        self.logger = Log().get_logger(self.__class__.__name__)
+        self.max_parallel = max(1, max_parallel)
+        self.target_rate = target_rate
+        self.verify_retries = max(0, verify_retries)
+        self.slots = threading.Semaphore(self.max_parallel)
+
+    def session_rate(self) -> Optional[str]:
+        """Return the ascp -l value for one session slot, or None when unlimited."""
+        if not self.target_rate:
+            return None
+        return f"{max(1, self.target_rate // self.max_parallel)}m"
+
+    def run(self, transfers: List[Aspera]) -> List[bool]:
+        """Run the transfers, at most `max_parallel` at once across the pool, and return their outcome."""
+        if not transfers:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_parallel, len(transfers)), thread_name_prefix='ascp') as executor:
+            results = list(executor.map(self._run_one, transfers))
+        failed = results.count(False)
+        if failed:
+            self.logger.error(f"{failed} of {len(results)} Aspera batches failed")
+        else:
+            self.logger.info(f"All {len(results)} Aspera batches finished successfully")
+        return results
+
+    def _run_one(self, transfer: Aspera) -> bool:
+        attempts = 0
+        while True:
+            with Metrics().timer('aspera.slot_wait'):
+                self.slots.acquire()
+            try:
+                succeeded = transfer.start_batch_download(max_rate=self.session_rate(), finish=False)
+            finally:
+                self.slots.release()
+            # Verifying and recording the files does not need the ascp session; files failing
+            # verification are transferred again below
+            transfer.finish_batch()
+            succeeded = succeeded and transfer.link_errors == 0
+            if not succeeded:
+                break
+            retry = []
+            if transfer.requeue:
+                if attempts >= self.verify_retries:
+                    self.logger.error(f"{len(transfer.requeue)} files of {transfer.progress.label} still fail verification after {attempts} retries")
+                    succeeded = False
+                    break
+                attempts += 1
+                Metrics().count('verify.requeued', len(transfer.requeue))
+                retry.extend(transfer.requeue)
+            if transfer.deferred:
+                # Files shared with another running batch: wait without holding a slot, then
+                # run the batch again to link them, or download them if that transfer failed
+                transfer.wait_for_deferred()
+                retry.extend(transfer.deferred)
+            if not retry:
+                break
+            transfer.file_downloads = retry
+        if not succeeded:
+            Metrics().count('aspera.failed_batches')
+        return succeeded
@@ -0,0 +1,27 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Iterator
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = 'w') -> Iterator[IO]:
+    """Open a temporary file next to path, replacing path with it once the block completes.
+
+    Readers never see a partial file, and a failed write leaves path untouched. The
+    file is created readable by its owner only, as by NamedTemporaryFile.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(mode=mode, dir=directory, suffix='.tmp', delete=False) as f:
+        temp_path = f.name
+        try:
+            yield f
+        except BaseException:
+            f.close()
+            os.unlink(temp_path)
+            raise
+    try:
+        os.replace(temp_path, path)
+    except OSError:
+        os.unlink(temp_path)
+        raise
@@ -0,0 +1,142 @@
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Optional
+from classes.atomic_file import atomic_write
+from classes.log import Log
+from classes.metrics import Metrics
+
+
+class ResponseCache:
+    """On-disk JSON cache with a TTL and size-bounded LRU eviction.
+
+    Entries are files named after the hash of their key. Reads refresh the file's
+    modification time, which is what eviction orders by. With `refresh` set, reads
+    always miss but fresh responses are still written.
+    """
+
+    def __init__(self, directory: str = './cache', ttl: float = 3600, max_entries: int = 500,
+                 max_bytes: int = 512 * 1024 * 1024, refresh: bool = False):
+        self.logger = Log().get_logger(self.__class__.__name__)
+        self.directory = os.path.abspath(directory)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, key: Any) -> str:
+        digest = hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, key: Any) -> Optional[Any]:
+        """Return the cached value for key, or None when missing, expired or refreshing."""
+        if self.refresh:
+            return None
+        path = self.path_for(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Discarding unreadable cache entry {path}: {e}")
+            self.remove(path)
+            return None
+        if time.time() - entry.get('created', 0) > self.ttl:
+            self.remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry.get('value')
+
+    def set(self, key: Any, value: Any) -> None:
+        """Store value for key, then evict the least recently used entries over the limits."""
+        with atomic_write(self.path_for(key)) as f:
+            json.dump({'created': time.time(), 'key': key, 'value': value}, f, separators=(',', ':'), default=str)
+        self.evict()
+
+    def store(self, key: Any, value: Any) -> None:
+        """Like `set`, but a failed write is only logged: the cache never fails the call it caches."""
+        try:
+            self.set(key, value)
+        except OSError as e:
+            Metrics().count('cache.write_errors')
+            self.logger.warning(f"Failed to cache a response: {e}")
+
+    def evict(self) -> None:
+        with self.lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.json'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            entries.sort()
+            total_bytes = sum(size for _, size, _ in entries)
+            while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+                _, size, path = entries.pop(0)
+                self.remove(path)
+                total_bytes -= size
+
+    def remove(self, path: str) -> None:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def cached_response(func: Callable) -> Callable:
+    """Serve a Service method, or coroutine method, from `self.cache` when set, keyed by method name and arguments.
+
+    Sync and async clients use the same keys, so they share cached responses.
+    """
+    signature = inspect.signature(func)
+
+    def lookup(self, args, kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        key = [func.__name__] + [value for name, value in bound.arguments.items() if name != 'self']
+        value = self.cache.get(key)
+        if value is not None:
+            Metrics().count('cache.hits')
+            self.logger.debug(f"Using cached response for {func.__name__}")
+        else:
+            Metrics().count('cache.misses')
+        return key, value
+
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(self, *args, **kwargs):
+            if getattr(self, 'cache', None) is None:
+                return await func(self, *args, **kwargs)
+            key, value = lookup(self, args, kwargs)
+            if value is not None:
+                return value
+            value = await func(self, *args, **kwargs)
+            if value is not None:
+                self.cache.store(key, value)
+            return value
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if getattr(self, 'cache', None) is None:
+            return func(self, *args, **kwargs)
+        key, value = lookup(self, args, kwargs)
+        if value is not None:
+            return value
+        value = func(self, *args, **kwargs)
+        if value is not None:
+            self.cache.store(key, value)
+        return value
+    return wrapper
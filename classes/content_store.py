@@ -0,0 +1,290 @@
+import errno
+import hashlib
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from filelock import FileLock, Timeout
+
+from classes.log import Log
+from classes.metrics import Metrics
+
+# ioctl request of Linux's FICLONE, sharing the extents of one file with another
+FICLONE = 0x40049409
+
+
+class ContentStore:
+    """Content-addressed store of downloaded files, shared by every title on a host.
+
+    Files are keyed by their fileIdUuid, or a hash of the Aspera source when a manifest
+    has none, and transferred once into `partial/<key>/`. A completed file moves to
+    `objects/<key[:2]>/<key>` and each title's destination becomes a link to it: a
+    hardlink, a reflink on filesystems that support FICLONE, or a copy as a last
+    resort. Transfers of the same key are serialised with a per-key file lock, so other
+    threads and processes wait for the running transfer instead of repeating it.
+
+    Hardlinked destinations share one inode with the stored file and with each other,
+    so editing one title's file in place changes it for every title linking to it;
+    replace such files instead of editing them.
+
+    Stored files take disk space until `prune` removes them, which it does once no
+    title links to them any more, i.e. once their hardlink count is back to one.
+    Copies and reflinks share no link count, so an object placed that way even once
+    is marked by a `<key>.copied` file next to it and never pruned.
+    """
+    LINK_MODES = ('auto', 'hardlink', 'reflink', 'copy')
+    # Seconds an unlinked object or idle partial transfer is kept, so that files just
+    # committed, or transfers about to resume, are left to the run using them
+    PRUNE_MIN_AGE = 3600
+
+    def __init__(self, root: str, link_mode: str = 'auto'):
+        if link_mode not in self.LINK_MODES:
+            raise ValueError(f"Unknown link mode: {link_mode}")
+        self.logger = Log().get_logger(self.__class__.__name__)
+        self.root = os.path.abspath(root)
+        self.link_mode = link_mode
+        self.lock = threading.Lock()
+        # Key -> (file lock, event set once the owning transfer released the key)
+        self.in_flight: Dict[str, Any] = {}
+        os.makedirs(os.path.join(self.root, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(self.root, 'partial'), exist_ok=True)
+
+    def key_for(self, file_info: Dict[str, Any]) -> str:
+        file_id = file_info.get('fileIdUuid')
+        if file_id and re.match(r'^[A-Za-z0-9-]+$', file_id):
+            return file_id.lower()
+        return hashlib.sha256(file_info['asperaSource'].encode('utf-8')).hexdigest()
+
+    def object_path(self, key: str) -> str:
+        return os.path.join(self.root, 'objects', key[:2], key)
+
+    def partial_path(self, key: str, file_name: str) -> str:
+        """Return the destination of a transfer, relative to the store root as ascp expects."""
+        return '/'.join(('partial', key, os.path.basename(file_name.strip('/'))))
+
+    def has(self, key: str) -> bool:
+        return os.path.isfile(self.object_path(key))
+
+    def lock_path(self, key: str) -> str:
+        return os.path.join(self.root, 'partial', f"{key}.lock")
+
+    def claim(self, key: str) -> bool:
+        """Take ownership of a key's transfer; False while another thread or process transfers it."""
+        with self.lock:
+            if key in self.in_flight:
+                return False
+            lock = FileLock(self.lock_path(key))
+            try:
+                lock.acquire(timeout=0)
+            except Timeout:
+                return False
+            self.in_flight[key] = (lock, threading.Event())
+            return True
+
+    def release(self, key: str) -> None:
+        with self.lock:
+            lock, event = self.in_flight.pop(key)
+            if self.has(key):
+                # Claims re-check the store after locking, so a stored key no longer needs its lock file
+                try:
+                    os.unlink(lock.lock_file)
+                except OSError:
+                    pass
+            lock.release()
+        event.set()
+
+    def wait(self, key: str) -> None:
+        """Block until the transfer of a key claimed elsewhere is released."""
+        with self.lock:
+            entry = self.in_flight.get(key)
+        if entry:
+            entry[1].wait()
+        elif not self.has(key):
+            # Owned by another process
+            with FileLock(self.lock_path(key)):
+                pass
+
+    def commit(self, key: str, file_name: str) -> bool:
+        """Move a completed transfer into the objects of the store."""
+        partial = os.path.join(self.root, *self.partial_path(key, file_name).split('/'))
+        target = self.object_path(key)
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(partial, target)
+        except OSError as e:
+            self.logger.error(f"Failed to store {partial}: {e}")
+            return False
+        shutil.rmtree(os.path.dirname(partial), ignore_errors=True)
+        return True
+
+    def link(self, key: str, destination: str) -> bool:
+        """Make destination a link to, or copy of, a stored file."""
+        source = self.object_path(key)
+        try:
+            if os.path.exists(destination) and os.path.samefile(source, destination):
+                return True
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            # Linked next to the destination, then swapped in so a failure leaves it untouched
+            temp_path = f"{destination}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                method = self.place(source, temp_path)
+                if method != 'hardlink' and not os.path.exists(f"{source}.copied"):
+                    # Not counted in the link count of the object, so prune must keep it
+                    open(f"{source}.copied", 'a').close()
+                os.replace(temp_path, destination)
+            finally:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+        except OSError as e:
+            self.logger.error(f"Failed to link {destination} to the store: {e}")
+            return False
+        metrics = Metrics()
+        metrics.count(f"store.{method}s")
+        metrics.count('store.linked_bytes', os.path.getsize(destination))
+        return True
+
+    def place(self, source: str, destination: str) -> str:
+        """Create destination from source with the configured link mode and return the method used."""
+        if self.link_mode in ('auto', 'hardlink'):
+            try:
+                os.link(source, destination)
+                return 'hardlink'
+            except OSError as e:
+                if self.link_mode == 'hardlink' or e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                    raise
+        if self.link_mode in ('auto', 'reflink'):
+            try:
+                self.reflink(source, destination)
+                return 'reflink'
+            except OSError:
+                if self.link_mode == 'reflink':
+                    raise
+        shutil.copyfile(source, destination)
+        return 'copy'
+
+    def reflink(self, source: str, destination: str) -> None:
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOTSUP, 'Reflinks are only supported on Linux')
+        import fcntl
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except OSError:
+                dst.close()
+                os.unlink(destination)
+                raise
+
+    @contextmanager
+    def try_lock(self, key: str) -> Iterator[bool]:
+        """Hold the file lock of a key nobody is transferring or linking, yielding whether it was taken."""
+        with self.lock:
+            lock = None if key in self.in_flight else FileLock(self.lock_path(key))
+            try:
+                if lock:
+                    lock.acquire(timeout=0)
+            except Timeout:
+                lock = None
+        if lock is None:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            try:
+                os.unlink(lock.lock_file)
+            except OSError:
+                pass
+            lock.release()
+
+    def prune(self, min_age: float = PRUNE_MIN_AGE) -> int:
+        """Remove stored files no title links to and partial transfers nobody holds, returning the bytes freed.
+
+        Entries are removed under their key's file lock, which `claim` and `lookup` hold
+        as well, so another process never loses a file it is transferring or linking.
+        """
+        cutoff = time.time() - min_age
+        freed = removed = 0
+        objects = os.path.join(self.root, 'objects')
+        for prefix in os.scandir(objects):
+            if not prefix.is_dir(follow_symlinks=False):
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.name.endswith('.copied') or os.path.exists(f"{entry.path}.copied"):
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                # The change time moves on commit and on every link made or removed
+                if stat.st_nlink != 1 or stat.st_ctime >= cutoff:
+                    continue
+                with self.try_lock(entry.name) as locked:
+                    if not locked:
+                        continue
+                    try:
+                        # Checked again now that no other process can link it
+                        stat = os.stat(entry.path)
+                        if stat.st_nlink != 1 or stat.st_ctime >= cutoff:
+                            continue
+                        os.unlink(entry.path)
+                    except OSError as e:
+                        self.logger.warning(f"Failed to prune {entry.path}: {e}")
+                        continue
+                freed += stat.st_size
+                removed += 1
+        partial = os.path.join(self.root, 'partial')
+        for entry in os.scandir(partial):
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                if os.stat(entry.path).st_mtime >= cutoff:
+                    continue
+            except OSError:
+                continue
+            with self.try_lock(entry.name) as locked:
+                if not locked:
+                    continue
+                size = sum(os.path.getsize(os.path.join(directory, name))
+                           for directory, _, names in os.walk(entry.path) for name in names)
+                shutil.rmtree(entry.path, ignore_errors=True)
+            freed += size
+            removed += 1
+        if removed:
+            self.logger.info(f"Pruned {removed} unused entries from the download store, freeing {freed / 1024 ** 2:.1f} MiB")
+        Metrics().count('store.pruned_bytes', freed)
+        return freed
+
+    def lookup(self, key: str, destination: str) -> Optional[bool]:
+        """Link destination when the key is already stored; None when it is not.
+
+        Linking holds the key's file lock, so `prune` in another process cannot remove
+        the file in between, unless this process already holds it through `claim`.
+        """
+        if not self.has(key):
+            return None
+        with self.lock:
+            claimed = key in self.in_flight
+        if claimed:
+            return self.link_stored(key, destination)
+        lock = FileLock(self.lock_path(key))
+        with lock:
+            try:
+                return self.link_stored(key, destination)
+            finally:
+                # As in release, a stored key no longer needs its lock file
+                try:
+                    os.unlink(lock.lock_file)
+                except OSError:
+                    pass
+
+    def link_stored(self, key: str, destination: str) -> Optional[bool]:
+        if not self.has(key):
+            # Pruned before the lock was taken
+            return None
+        Metrics().count('store.hits')
+        return self.link(key, destination)
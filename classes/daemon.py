@@ -0,0 +1,181 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from classes.job_queue import JobQueue
+from classes.log import Log
+
+
+class Daemon:
+    """Long-running service feeding queued titles through one warm pipeline.
+
+    Titles are submitted through a spool directory, a local HTTP API or both, and
+    stored in a JobQueue. Every round claims up to `round_size` jobs by priority and
+    runs them through `process` (Tiramigiu.process_movie_ids), which keeps the
+    authenticated session, caches and transfer pool between rounds.
+
+    Spool files hold one movie ID per line, optionally followed by a priority;
+    blank lines and lines starting with # are ignored. Write them under a name
+    starting with "." or ending in ".tmp" and rename them when complete. Files are
+    deleted once queued.
+
+    HTTP API: POST /jobs {"movie_ids": [...], "priority": 0}, GET /jobs for counts
+    per state and GET /jobs/<id> for one job.
+    """
+
+    def __init__(self, process: Callable[[List[str]], List[Dict[str, Any]]], jobs: JobQueue, round_size: int = 1,
+                 spool_dir: Optional[str] = None, listen: Optional[Tuple[str, int]] = None, poll_interval: float = 2,
+                 on_round: Optional[Callable[[], None]] = None):
+        self.logger = Log().get_logger(self.__class__.__name__)
+        self.process = process
+        self.jobs = jobs
+        self.round_size = max(1, round_size)
+        self.spool_dir = os.path.abspath(spool_dir) if spool_dir else None
+        self.listen = listen
+        self.poll_interval = poll_interval
+        # Called after every round, e.g. to export the run metrics
+        self.on_round = on_round
+        self.server: Optional[ThreadingHTTPServer] = None
+        # Set by submissions to start the next round without waiting for the poll interval
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+
+    def submit(self, movie_ids: List[str], priority: int = 0) -> List[Dict[str, Any]]:
+        job_ids = self.jobs.submit_many([(movie_id, priority) for movie_id in movie_ids])
+        submitted = [{'id': job_id, 'movie_id': movie_id} for job_id, movie_id in zip(job_ids, movie_ids)]
+        self.logger.info(f"Queued {len(submitted)} movie IDs with priority {priority}")
+        self.wakeup.set()
+        return submitted
+
+    def scan_spool(self) -> None:
+        """Queue the movie IDs of every complete spool file, then delete it."""
+        try:
+            entries = sorted((entry for entry in os.scandir(self.spool_dir) if entry.is_file()), key=lambda entry: entry.name)
+        except OSError as e:
+            self.logger.error(f"Failed to scan spool directory {self.spool_dir}: {e}")
+            return
+        for entry in entries:
+            if entry.name.startswith('.') or entry.name.endswith('.tmp'):
+                continue
+            try:
+                with open(entry.path, 'r') as f:
+                    lines = f.read().splitlines()
+            except OSError as e:
+                self.logger.error(f"Failed to read spool file {entry.path}: {e}")
+                continue
+            titles = []
+            for line in lines:
+                fields = line.split()
+                if not fields or fields[0].startswith('#'):
+                    continue
+                try:
+                    priority = int(fields[1]) if len(fields) > 1 else 0
+                except ValueError:
+                    self.logger.error(f"Invalid priority in spool file {entry.name}: {line}")
+                    continue
+                titles.append((fields[0], priority))
+            # Deleted only once every title is queued, a failed submission leaves the file for the next scan
+            try:
+                self.jobs.submit_many(titles)
+            except sqlite3.Error as e:
+                self.logger.error(f"Failed to queue spool file {entry.path}: {e}")
+                continue
+            try:
+                os.unlink(entry.path)
+            except OSError as e:
+                # Queued again by the next scan, which only raises the priority of queued titles
+                self.logger.error(f"Failed to delete spool file {entry.path}: {e}")
+            self.logger.info(f"Queued {len(titles)} movie IDs from spool file {entry.name}")
+
+    def run_round(self) -> int:
+        """Process one round of claimed jobs and return how many were claimed."""
+        claimed = self.jobs.claim(self.round_size)
+        if not claimed:
+            return 0
+        job_ids = {movie_id: job_id for job_id, movie_id in claimed}
+        try:
+            results = self.process(list(job_ids))
+        except Exception as e:
+            self.logger.error(f"Failed to process jobs {sorted(job_ids.values())}: {e}")
+            results = [{'movie_id': movie_id, 'success': False, 'error': str(e)} for movie_id in job_ids]
+        for result in results:
+            self.jobs.finish(job_ids.pop(result['movie_id']), result['success'], result.get('error'))
+        # Titles the pipeline returned no result for
+        for movie_id, job_id in job_ids.items():
+            self.jobs.finish(job_id, False, 'No result')
+        if self.on_round:
+            self.on_round()
+        return len(claimed)
+
+    def run(self) -> None:
+        """Process queued jobs until stop() is called."""
+        requeued = self.jobs.requeue_running()
+        if requeued:
+            self.logger.info(f"Re-queued {requeued} jobs interrupted by a previous run")
+        if self.listen:
+            self.start_server()
+        if self.spool_dir:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self.logger.info(f"Watching spool directory {self.spool_dir}")
+        try:
+            while not self.stopping.is_set():
+                self.wakeup.clear()
+                if self.spool_dir:
+                    self.scan_spool()
+                if self.run_round() == 0:
+                    self.wakeup.wait(self.poll_interval)
+        finally:
+            if self.server:
+                self.server.shutdown()
+                self.server.server_close()
+        self.logger.info(f"Daemon stopped, jobs: {self.jobs.counts()}")
+
+    def stop(self) -> None:
+        """Stop after the current round."""
+        self.stopping.set()
+        self.wakeup.set()
+
+    def start_server(self) -> None:
+        handler = type('Handler', (JobRequestHandler,), {'daemon': self})
+        self.server = ThreadingHTTPServer(self.listen, handler)
+        threading.Thread(target=self.server.serve_forever, name='daemon-api', daemon=True).start()
+        self.logger.info(f"Listening for jobs on http://{self.listen[0]}:{self.server.server_port}")
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    daemon: Daemon
+    JOB_PATH = re.compile(r'^/jobs/(\d+)$')
+
+    def do_GET(self):
+        if self.path == '/jobs':
+            return self.send_json(200, self.daemon.jobs.counts())
+        match = self.JOB_PATH.match(self.path)
+        job = self.daemon.jobs.get(int(match.group(1))) if match else None
+        if job is None:
+            return self.send_json(404, {'error': 'Not found'})
+        self.send_json(200, job)
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            return self.send_json(404, {'error': 'Not found'})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+            movie_ids = [str(movie_id) for movie_id in body['movie_ids']]
+            priority = int(body.get('priority', 0))
+        except (ValueError, KeyError, TypeError) as e:
+            return self.send_json(400, {'error': f"Invalid job request: {e}"})
+        self.send_json(202, {'jobs': self.daemon.submit(movie_ids, priority)})
+
+    def send_json(self, status: int, data: Any) -> None:
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        self.daemon.logger.debug(f"{self.address_string()} {format % args}")
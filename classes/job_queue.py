@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from classes.log import Log
+
+
+class JobQueue:
+    """Persistent priority queue of titles to process, for daemon mode.
+
+    Jobs move from "queued" to "running" when claimed and end "done" or "failed".
+    Higher priorities are claimed first, then oldest first. A title has at most one
+    queued or running job; submitting it again raises that job's priority instead.
+    """
+    STATES = ('queued', 'running', 'done', 'failed')
+    COLUMNS = ('id', 'movie_id', 'priority', 'state', 'submitted_at', 'started_at', 'finished_at', 'error')
+
+    def __init__(self, path: str = './jobs.db'):
+        self.logger = Log().get_logger(self.__class__.__name__)
+        self.path = os.path.abspath(path)
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, movie_id TEXT NOT NULL, priority INTEGER NOT NULL DEFAULT 0, '
+                'state TEXT NOT NULL, submitted_at REAL NOT NULL, started_at REAL, finished_at REAL, error TEXT)'
+            )
+            self.connection.execute('CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (state, priority DESC, id)')
+
+    def submit(self, movie_id: str, priority: int = 0) -> int:
+        """Queue a title and return its job ID."""
+        return self.submit_many([(movie_id, priority)])[0]
+
+    def submit_many(self, titles: List[Tuple[str, int]]) -> List[int]:
+        """Queue (movie ID, priority) pairs in one transaction and return their job IDs."""
+        with self.lock, self.connection:
+            return [self.insert(movie_id, priority) for movie_id, priority in titles]
+
+    def insert(self, movie_id: str, priority: int) -> int:
+        # Called with the lock held, inside a transaction
+        row = self.connection.execute(
+            "SELECT id, priority FROM jobs WHERE movie_id = ? AND state IN ('queued', 'running')", (movie_id,)
+        ).fetchone()
+        if row is not None:
+            if priority > row[1]:
+                self.connection.execute('UPDATE jobs SET priority = ? WHERE id = ?', (priority, row[0]))
+            return row[0]
+        cursor = self.connection.execute(
+            "INSERT INTO jobs (movie_id, priority, state, submitted_at) VALUES (?, ?, 'queued', ?)",
+            (movie_id, priority, time.time())
+        )
+        return cursor.lastrowid
+
+    def claim(self, limit: int) -> List[Tuple[int, str]]:
+        """Mark up to `limit` queued jobs as running and return their IDs and movie IDs."""
+        with self.lock, self.connection:
+            rows = self.connection.execute(
+                "SELECT id, movie_id FROM jobs WHERE state = 'queued' ORDER BY priority DESC, id LIMIT ?", (limit,)
+            ).fetchall()
+            now = time.time()
+            self.connection.executemany(
+                "UPDATE jobs SET state = 'running', started_at = ? WHERE id = ?", [(now, job_id) for job_id, _ in rows]
+            )
+            return [(job_id, movie_id) for job_id, movie_id in rows]
+
+    def finish(self, job_id: int, success: bool, error: Optional[str] = None) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                'UPDATE jobs SET state = ?, finished_at = ?, error = ? WHERE id = ?',
+                ('done' if success else 'failed', time.time(), error, job_id)
+            )
+
+    def requeue_running(self) -> int:
+        """Return jobs left running by a previous process to the queue."""
+        with self.lock, self.connection:
+            cursor = self.connection.execute("UPDATE jobs SET state = 'queued', started_at = NULL WHERE state = 'running'")
+            return cursor.rowcount
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.connection.execute(f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(zip(self.COLUMNS, row)) if row else None
+
+    def counts(self) -> Dict[str, int]:
+        """Return the number of jobs in every state."""
+        with self.lock:
+            rows = self.connection.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall()
+        counts = {state: 0 for state in self.STATES}
+        counts.update(rows)
+        return counts
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
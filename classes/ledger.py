@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from classes.log import Log
+from classes.verify import hash_file
+
+
+class Ledger:
+    """Persistent record of completed transfers, shared by every title of a run.
+
+    Files are keyed by movie ID, file ID (fileIdUuid or correlationId) and destination
+    path. A file only counts as complete while it is still on disk with the recorded size.
+    Titles are recorded with a key of the materials selected for them, and a title only
+    counts as complete while the same materials are selected and all of its files are.
+    """
+    HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, path: str = './ledger.db', checksum: bool = False):
+        self.logger = Log().get_logger(self.__class__.__name__)
+        self.path = os.path.abspath(path)
+        self.checksum = checksum
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS files ('
+                'movie_id TEXT NOT NULL, file_id TEXT NOT NULL, destination TEXT NOT NULL, '
+                'size INTEGER NOT NULL, checksum TEXT, completed_at REAL NOT NULL, '
+                'PRIMARY KEY (movie_id, file_id, destination))'
+            )
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS titles (movie_id TEXT PRIMARY KEY, completed_at REAL NOT NULL, selection TEXT)'
+            )
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(titles)')]
+            if 'selection' not in columns:
+                # Titles recorded without a selection key never count as complete again
+                self.connection.execute('ALTER TABLE titles ADD COLUMN selection TEXT')
+
+    def get_file(self, movie_id: str, file_id: str, destination: str) -> Optional[sqlite3.Row]:
+        with self.lock:
+            cursor = self.connection.execute(
+                'SELECT size, checksum, completed_at FROM files WHERE movie_id = ? AND file_id = ? AND destination = ?',
+                (movie_id, file_id, os.path.abspath(destination))
+            )
+            return cursor.fetchone()
+
+    def is_file_complete(self, movie_id: str, file_id: str, destination: str) -> bool:
+        """Check whether a file was recorded as complete and is still on disk with the same size."""
+        row = self.get_file(movie_id, file_id, destination)
+        if row is None:
+            return False
+        try:
+            return os.path.getsize(destination) == row[0]
+        except OSError:
+            return False
+
+    def find_checksum(self, file_id: str) -> Optional[str]:
+        """Return the SHA-256 last recorded for a file ID at any destination, e.g. by another title."""
+        with self.lock:
+            cursor = self.connection.execute(
+                'SELECT checksum FROM files WHERE file_id = ? AND checksum IS NOT NULL ORDER BY completed_at DESC LIMIT 1',
+                (file_id,)
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def record_file(self, movie_id: str, file_id: str, destination: str, checksum: Optional[str] = None) -> None:
+        """Record a downloaded file with its current size, and checksum when enabled.
+
+        A SHA-256 already computed by the caller is stored as is instead of hashing the file again.
+        """
+        try:
+            size = os.path.getsize(destination)
+        except OSError as e:
+            self.logger.warning(f"Not recording {destination} in the ledger: {e}")
+            return
+        if self.checksum and checksum is None:
+            checksum = self.file_checksum(destination)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO files (movie_id, file_id, destination, size, checksum, completed_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (movie_id, file_id, os.path.abspath(destination), size, checksum, time.time())
+            )
+
+    @staticmethod
+    def selection_key(requests: List[Dict[str, Any]]) -> str:
+        """Key of the materials selected for a title, independent of their order."""
+        encoded = sorted(json.dumps(request, sort_keys=True) for request in requests)
+        return hashlib.sha256('\n'.join(encoded).encode('utf-8')).hexdigest()
+
+    def is_title_complete(self, movie_id: str, selection: str) -> bool:
+        """Check whether a title was completed with the same selection and all of its files are still on disk."""
+        with self.lock:
+            row = self.connection.execute('SELECT selection FROM titles WHERE movie_id = ?', (movie_id,)).fetchone()
+            files = self.connection.execute('SELECT destination, size FROM files WHERE movie_id = ?', (movie_id,)).fetchall()
+        if row is None or row[0] != selection or not files:
+            return False
+        for destination, size in files:
+            try:
+                if os.path.getsize(destination) != size:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def record_title(self, movie_id: str, selection: str) -> None:
+        """Record that every material of a title's selection has been downloaded."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO titles (movie_id, completed_at, selection) VALUES (?, ?, ?)',
+                (movie_id, time.time(), selection)
+            )
+
+    def file_checksum(self, path: str) -> str:
+        """Compute the SHA-256 of a file."""
+        return hash_file(path, block_size=self.HASH_BLOCK_SIZE)[1]
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
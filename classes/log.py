@@ -36,14 +36,14 @@ class Log:
         )
         console_handler.setFormatter(console_formatter)
 
-        # File handler for general logs
-        file_handler = RotatingFileHandler('./logs/general.log', maxBytes=5*1024*1024, backupCount=5)
+        # File handler for general logs, log files are only opened on their first record
+        file_handler = RotatingFileHandler('./logs/general.log', maxBytes=5*1024*1024, backupCount=5, delay=True)
         file_handler.setLevel(logging.INFO)
         file_formatter = logging.Formatter('%(asctime)s - %(class_name)s - %(levelname)s - %(message)s')
         file_handler.setFormatter(file_formatter)
 
         # File handler for error logs
-        error_handler = RotatingFileHandler('./logs/error.log', maxBytes=5*1024*1024, backupCount=5)
+        error_handler = RotatingFileHandler('./logs/error.log', maxBytes=5*1024*1024, backupCount=5, delay=True)
         error_handler.setLevel(logging.ERROR)
         error_formatter = logging.Formatter('%(asctime)s - %(class_name)s - %(levelname)s - %(message)s')
         error_handler.setFormatter(error_formatter)
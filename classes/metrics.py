@@ -0,0 +1,123 @@
+import inspect
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from classes.atomic_file import atomic_write
+
+
+class Metrics:
+    """Process-wide stage timers and counters, exported as a JSON report or Prometheus text.
+
+    A singleton like Log, so every module records into the same run. Timers keep a
+    count, total and maximum per stage name; counters are plain sums (bytes,
+    materials, retries). Recording takes one lock acquisition.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(Metrics, cls).__new__(cls)
+            cls._instance.reset()
+        return cls._instance
+
+    def reset(self) -> None:
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.started_monotonic = time.monotonic()
+        # Stage name -> [count, total seconds, max seconds]
+        self.timers: Dict[str, list] = {}
+        self.counters: Dict[str, float] = {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                if seconds > timer[2]:
+                    timer[2] = seconds
+
+    def count(self, name: str, value: float = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'started': self.started,
+                'elapsed': time.monotonic() - self.started_monotonic,
+                'timers': {name: {'count': count, 'total': total, 'mean': total / count, 'max': maximum}
+                           for name, (count, total, maximum) in sorted(self.timers.items())},
+                'counters': dict(sorted(self.counters.items()))
+            }
+
+    def prometheus_text(self, prefix: str = 'tiramigiu') -> str:
+        """Format the metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_stage_seconds Time spent per stage.",
+            f"# TYPE {prefix}_stage_seconds summary"
+        ]
+        for name, timer in snapshot['timers'].items():
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {timer["total"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {timer["count"]}')
+        lines.append(f"# TYPE {prefix}_stage_seconds_max gauge")
+        for name, timer in snapshot['timers'].items():
+            lines.append(f'{prefix}_stage_seconds_max{{stage="{name}"}} {timer["max"]:.6f}')
+        for name, value in snapshot['counters'].items():
+            metric = f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value:g}")
+        lines.append(f"# TYPE {prefix}_run_seconds gauge")
+        lines.append(f"{prefix}_run_seconds {snapshot['elapsed']:.3f}")
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, path: str, **extra: Any) -> None:
+        """Write the metrics, plus any extra fields, as a JSON report."""
+        self.write_file(path, json.dumps({**self.snapshot(), **extra}, indent=4))
+
+    def write_prometheus(self, path: str) -> None:
+        """Write the Prometheus text format, e.g. for the node exporter textfile collector."""
+        self.write_file(path, self.prometheus_text())
+
+    def write_file(self, path: str, content: str) -> None:
+        # Replaced atomically so scrapers never read a partial file
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with atomic_write(path) as f:
+            f.write(content)
+
+
+def timed(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """Record every call of the decorated function, or coroutine function, under `name`, by default its qualified name."""
+    def decorator(func: Callable) -> Callable:
+        stage = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with Metrics().timer(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with Metrics().timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
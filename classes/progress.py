@@ -0,0 +1,124 @@
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+# ascp progress lines, e.g. "Movie_PM51.wav     37%  371MB  49.8Mb/s    01:10 ETA"
+PROGRESS_LINE = re.compile(
+    r'^(?P<name>\S.*?)\s+(?P<percent>\d{1,3})%\s+(?P<size>[\d.]+)(?P<size_unit>[KMGTP]?B)'
+    r'\s+(?P<rate>[\d.]+)(?P<rate_unit>[KMGT]?b)/s(?:\s+(?P<eta>[\d:]+)(?:\s+ETA)?)?\s*$'
+)
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'TB': 1024 ** 4, 'PB': 1024 ** 5}
+RATE_UNITS = {'b': 1, 'Kb': 1000, 'Mb': 1000 ** 2, 'Gb': 1000 ** 3, 'Tb': 1000 ** 4}
+
+
+def parse_eta(eta: Optional[str]) -> Optional[int]:
+    """Convert an ascp "HH:MM:SS" or "MM:SS" ETA into seconds."""
+    if not eta:
+        return None
+    seconds = 0
+    for part in eta.split(':'):
+        if not part.isdigit():
+            return None
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+class TransferProgress:
+    """Tracks the progress of one ascp session from its output lines.
+
+    Every parsed update is published to `callback` as a snapshot dict; `stalled()`
+    reports whether no bytes have moved for `stall_timeout` seconds.
+    """
+
+    def __init__(self, label: str = '', callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 stall_timeout: float = 300):
+        self.label = label
+        self.callback = callback
+        self.stall_timeout = stall_timeout
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Clear all metrics and restart the clock, e.g. when ascp is (re)started."""
+        self.started = time.monotonic()
+        self.last_progress = self.started
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.completed_files: Dict[str, int] = {}
+        self.current_file: Optional[str] = None
+        self.current_rate = 0.0
+        self.eta: Optional[int] = None
+
+    def parse_line(self, line: str) -> bool:
+        """Update the progress from one line of ascp output, returning whether it was a progress line."""
+        match = PROGRESS_LINE.match(line.strip())
+        if not match:
+            return False
+        name = match.group('name')
+        size, unit = match.group('size'), SIZE_UNITS[match.group('size_unit')]
+        transferred = int(float(size) * unit)
+        # ascp rounds the size it shows, e.g. "371MB" is only known to the megabyte
+        resolution = unit / 10 ** len(size.partition('.')[2])
+        percent = min(100, int(match.group('percent')))
+        with self.lock:
+            previous = self.files.get(name, {}).get('bytes', 0)
+            if transferred > previous:
+                self.last_progress = time.monotonic()
+            self.files[name] = {'bytes': max(previous, transferred), 'percent': percent, 'resolution': resolution}
+            self.current_file = name
+            self.current_rate = float(match.group('rate')) * RATE_UNITS[match.group('rate_unit')]
+            self.eta = parse_eta(match.group('eta'))
+            if percent == 100 and name not in self.completed_files:
+                self.completed_files[name] = self.files[name]['bytes']
+        if self.callback:
+            self.callback(self.snapshot())
+        return True
+
+    @property
+    def bytes_transferred(self) -> int:
+        return sum(file_info['bytes'] for file_info in self.files.values())
+
+    def average_rate(self) -> float:
+        """Average rate since the session started, in bits per second."""
+        elapsed = time.monotonic() - self.started
+        return self.bytes_transferred * 8 / elapsed if elapsed > 0 else 0.0
+
+    def stalled(self) -> bool:
+        return time.monotonic() - self.last_progress > self.stall_timeout
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current metrics as a plain dict."""
+        with self.lock:
+            return {
+                'label': self.label,
+                'bytes_transferred': self.bytes_transferred,
+                'current_rate': self.current_rate,
+                'average_rate': self.average_rate(),
+                'current_file': self.current_file,
+                'eta': self.eta,
+                'files_completed': len(self.completed_files),
+                'files_seen': len(self.files),
+                'elapsed': time.monotonic() - self.started,
+                'stalled': self.stalled()
+            }
+
+    def summary(self) -> str:
+        """Format the current metrics as a single log line."""
+        snapshot = self.snapshot()
+        line = (f"{snapshot['label']}: {format_bytes(snapshot['bytes_transferred'])} transferred, "
+                f"{snapshot['files_completed']}/{snapshot['files_seen']} files done, "
+                f"current {snapshot['current_rate'] / 1e6:.1f} Mbps, average {snapshot['average_rate'] / 1e6:.1f} Mbps")
+        if snapshot['current_file']:
+            line += f", on {snapshot['current_file']}"
+        if snapshot['eta'] is not None:
+            line += f" (ETA {snapshot['eta']}s)"
+        return line
+
+
+def format_bytes(size: float) -> str:
+    """Format a byte count with a binary unit suffix."""
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if size < 1024 or unit == 'TB':
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
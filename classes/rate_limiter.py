@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from classes.log import Log
+from classes.metrics import Metrics
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second up to `burst` tokens; not thread-safe on its own."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now: float) -> float:
+        """Take a token and return 0, or return the seconds until one is available."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class HostLimiter:
+    """Request rate and adaptive concurrency limit of one host.
+
+    A token bucket caps the request rate. The number of calls in flight is bounded
+    by a limit adjusted AIMD-style: it grows by one per limit's worth of successful
+    calls while calls are using it, and halves on throttling (429, 5xx or connection
+    errors), at most once per `DECREASE_INTERVAL` so one burst of failures counts
+    once. A Retry-After pauses every caller of the host until it passes.
+    """
+    DECREASE_FACTOR = 0.5
+    DECREASE_INTERVAL = 1.0
+    # Sleep of an async caller between checks for a free slot
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, host: str, rate: Optional[float] = None, burst: Optional[float] = None,
+                 initial_limit: float = 16, min_limit: float = 1, max_limit: float = 128):
+        self.logger = Log().get_logger(self.__class__.__name__)
+        self.host = host
+        self.bucket = TokenBucket(rate, burst or rate) if rate else None
+        self.min_limit = max(1.0, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(max(initial_limit, self.min_limit), self.max_limit)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def try_acquire(self) -> float:
+        """Take a slot and a token and return 0, or return the seconds to wait before trying again."""
+        with self.condition:
+            return self._try_acquire()
+
+    def _try_acquire(self) -> float:
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= int(self.limit):
+            return self.POLL_INTERVAL
+        if self.bucket:
+            wait = self.bucket.reserve(now)
+            if wait > 0:
+                return wait
+        self.in_flight += 1
+        return 0.0
+
+    def acquire(self) -> None:
+        """Block until a call to the host may start."""
+        with self.condition:
+            while True:
+                wait = self._try_acquire()
+                if wait == 0:
+                    return
+                # Woken early when a call finishes
+                self.condition.wait(wait)
+
+    async def acquire_async(self) -> None:
+        """Wait on the event loop until a call to the host may start."""
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self, throttled: bool, retry_after: Optional[float] = None) -> None:
+        """Finish a call, adapting the limit to whether the host throttled it."""
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                Metrics().count('ratelimit.throttled')
+                if retry_after:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+                if now - self.last_decrease >= self.DECREASE_INTERVAL:
+                    self.last_decrease = now
+                    self.limit = max(self.min_limit, self.limit * self.DECREASE_FACTOR)
+                    self.logger.info(f"{self.host} is throttling, concurrency limit lowered to {int(self.limit)}")
+            elif self.in_flight + 1 >= int(self.limit):
+                # Only grow while the limit is what bounds the calls
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+class RateLimiter:
+    """Per-host limiters shared by every session and client of a run."""
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None,
+                 initial_limit: float = 16, min_limit: float = 1, max_limit: float = 128):
+        self.settings = {'rate': rate, 'burst': burst, 'initial_limit': initial_limit, 'min_limit': min_limit, 'max_limit': max_limit}
+        self.hosts: Dict[str, HostLimiter] = {}
+        self.lock = threading.Lock()
+
+    def for_url(self, url: str) -> HostLimiter:
+        host = urlsplit(url).netloc.lower()
+        with self.lock:
+            limiter = self.hosts.get(host)
+            if limiter is None:
+                limiter = self.hosts[host] = HostLimiter(host, **self.settings)
+            return limiter
@@ -0,0 +1,155 @@
+import heapq
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+
+class SelectionResult:
+    """Outcome of one selection pass over a title's assets."""
+    __slots__ = ('available', 'categories', 'selected')
+
+    def __init__(self, available: List[Any], categories: Dict[str, List[Any]], selected: List[Any]):
+        self.available = available
+        self.categories = categories
+        self.selected = selected
+
+
+MATERIAL_FILTER_FIELDS = {'fileName', 'fileLocationUrl', 'movieId', 'packageId', 'ampAssetId'}
+
+
+def asset_field_getter(field: str) -> Callable[[Any], Any]:
+    """Return a reader for a field of an extracted asset dict; file name and ids live in materialFilter."""
+    if field in MATERIAL_FILTER_FIELDS:
+        return lambda asset: asset.get('materialFilter', {}).get(field)
+    return lambda asset: asset.get(field)
+
+
+class AssetSelector:
+    """Selects the assets to download with declarative rules.
+
+    The config is a dict (usually loaded from config/selection.json) with:
+
+    - "status": statuses an asset must have to be considered, e.g. ["ACTIVE"]
+    - "dedupe_by": field whose first occurrence wins, e.g. "fileName"
+    - "categories": ordered rules {"name", "contains": [substrings of materialType]};
+      the first rule whose substrings all match the type assigns the category
+    - "selections": ordered output groups {"categories": [...]} taking the first
+      non-empty category, with optional "order_by" ([{"field", "descending"}]),
+      "preferred_languages" and "limit" to pick the best assets of that category
+
+    Rules are compiled once; the category of each distinct materialType is memoised,
+    so a selection is a single pass over the assets plus the per-group ordering.
+    """
+
+    def __init__(self, config: Dict[str, Any], field_getter: Callable[[str], Callable[[Any], Any]] = asset_field_getter):
+        self.field_getter = field_getter
+        self.statuses = set(config.get('status') or [])
+        self.dedupe_by: Optional[str] = config.get('dedupe_by')
+        self.rules = [(rule['name'], tuple(rule['contains'])) for rule in config.get('categories', [])]
+        self.category_names = [name for name, _ in self.rules]
+        self.selections = [self.compile_selection(selection) for selection in config.get('selections', [])]
+        self.type_categories: Dict[str, Optional[str]] = {}
+        self.get_status = field_getter('status')
+        self.get_type = field_getter('materialType')
+        self.get_dedupe_key = field_getter(self.dedupe_by) if self.dedupe_by else None
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> 'AssetSelector':
+        with open(path, 'r') as f:
+            return cls(json.load(f), **kwargs)
+
+    def compile_selection(self, selection: Dict[str, Any]) -> Dict[str, Any]:
+        for category in selection['categories']:
+            if category not in self.category_names:
+                raise ValueError(f"Selection references unknown category: {category}")
+        languages = selection.get('preferred_languages') or []
+        return {
+            'categories': selection['categories'],
+            'order_by': [(order['field'], bool(order.get('descending'))) for order in selection.get('order_by', [])],
+            'language_rank': {language: rank for rank, language in enumerate(languages)},
+            'limit': selection.get('limit')
+        }
+
+    def category_of(self, material_type: str) -> Optional[str]:
+        """Return the category of a materialType, matching the rules once per distinct type."""
+        try:
+            return self.type_categories[material_type]
+        except KeyError:
+            pass
+        category = None
+        for name, substrings in self.rules:
+            if all(substring in material_type for substring in substrings):
+                category = name
+                break
+        self.type_categories[material_type] = category
+        return category
+
+    def select(self, assets: List[Any]) -> SelectionResult:
+        """Filter, deduplicate, categorize and pick the assets to download in one pass."""
+        statuses = self.statuses
+        get_status = self.get_status
+        get_type = self.get_type
+        get_dedupe_key = self.get_dedupe_key
+        type_categories = self.type_categories
+        available = []
+        categories: Dict[str, List[Any]] = {name: [] for name in self.category_names}
+        seen = set()
+        for asset in assets:
+            if statuses and get_status(asset) not in statuses:
+                continue
+            if get_dedupe_key:
+                key = get_dedupe_key(asset)
+                if key is None or key in seen:
+                    continue
+                seen.add(key)
+            available.append(asset)
+            material_type = get_type(asset) or ''
+            category = type_categories[material_type] if material_type in type_categories else self.category_of(material_type)
+            if category is not None:
+                categories[category].append(asset)
+
+        selected = []
+        for selection in self.selections:
+            for category in selection['categories']:
+                if categories[category]:
+                    selected.extend(self.best(categories[category], selection))
+                    break
+        return SelectionResult(available, categories, selected)
+
+    def best(self, assets: List[Any], selection: Dict[str, Any]) -> List[Any]:
+        """Order a category's assets by the selection's tie-breaks and keep up to its limit."""
+        if not selection['order_by'] and not selection['language_rank']:
+            return assets[:selection['limit']] if selection['limit'] else assets
+        key = self.sort_key(selection)
+        if selection['limit']:
+            return heapq.nsmallest(selection['limit'], assets, key=key)
+        return sorted(assets, key=key)
+
+    def sort_key(self, selection: Dict[str, Any]) -> Callable[[Any], tuple]:
+        get_language = self.field_getter('language')
+        language_rank = selection['language_rank']
+        order_by = [(self.field_getter(name), descending) for name, descending in selection['order_by']]
+
+        def key(asset):
+            parts = []
+            if language_rank:
+                parts.append(language_rank.get(get_language(asset), len(language_rank)))
+            for get_value, descending in order_by:
+                value = get_value(asset)
+                # Missing values sort last in either direction
+                parts.append((value is None, Reversed(value) if descending else value))
+            return tuple(parts)
+        return key
+
+
+class Reversed:
+    """Wraps a value to invert its ordering, for descending sort keys."""
+    __slots__ = ('value',)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __lt__(self, other: 'Reversed') -> bool:
+        return other.value < self.value
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Reversed) and other.value == self.value
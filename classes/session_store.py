@@ -0,0 +1,96 @@
+import json
+import os
+import time
+from http.cookiejar import Cookie
+from typing import Any, Dict, Iterable, List, Optional
+
+from filelock import FileLock
+from requests.cookies import create_cookie
+
+from classes.atomic_file import atomic_write
+from classes.log import Log
+
+
+class SessionStore:
+    """JSON file of session cookies and access tokens, shared by processes on one host.
+
+    Updates run under an exclusive file lock and merge into the current contents:
+    cookies by domain, path and name, tokens by service, keeping the one that expires
+    last. The file is replaced atomically, so readers never see a partial write.
+    """
+    VERSION = 1
+    # Long enough for another process to finish an interactive login
+    LOCK_TIMEOUT = 900
+
+    def __init__(self, path: str):
+        self.logger = Log().get_logger(self.__class__.__name__)
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock = FileLock(self.path + '.lock', timeout=self.LOCK_TIMEOUT)
+
+    def load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable session store {self.path}: {e}")
+            return {}
+        if data.get('version') != self.VERSION:
+            self.logger.warning(f"Ignoring session store {self.path} with unknown version {data.get('version')}")
+            return {}
+        return data
+
+    def load_cookies(self) -> List[Cookie]:
+        """Return the stored cookies that have not expired."""
+        now = time.time()
+        return [cookie_from_dict(cookie) for cookie in self.load().get('cookies', [])
+                if cookie.get('expires') is None or cookie['expires'] > now]
+
+    def load_token(self, service: str) -> Optional[Dict[str, Any]]:
+        """Return the stored {"token", "expires_at"} of a service, if any."""
+        return self.load().get('tokens', {}).get(service)
+
+    def update(self, cookies: Optional[Iterable[Cookie]] = None, tokens: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        """Merge cookies and service tokens into the store."""
+        with self.lock:
+            data = self.load()
+            if cookies is not None:
+                merged = {cookie_key(cookie): cookie for cookie in data.get('cookies', [])}
+                merged.update((cookie_key(cookie), cookie) for cookie in map(cookie_to_dict, cookies))
+                data['cookies'] = list(merged.values())
+            stored_tokens = data.setdefault('tokens', {})
+            for service, token in (tokens or {}).items():
+                current = stored_tokens.get(service)
+                if current is None or token['expires_at'] >= current['expires_at']:
+                    stored_tokens[service] = token
+            data['version'] = self.VERSION
+            data['saved_at'] = time.time()
+            self.write(data)
+
+    def write(self, data: Dict[str, Any]) -> None:
+        # Created readable by its owner only
+        with atomic_write(self.path) as f:
+            json.dump(data, f, separators=(',', ':'))
+
+
+def cookie_key(cookie: Dict[str, Any]) -> str:
+    return f"{cookie['domain']}|{cookie['path']}|{cookie['name']}"
+
+
+def cookie_to_dict(cookie: Cookie) -> Dict[str, Any]:
+    return {
+        'name': cookie.name,
+        'value': cookie.value,
+        'domain': cookie.domain,
+        'path': cookie.path,
+        'secure': cookie.secure,
+        'expires': cookie.expires,
+        'rest': getattr(cookie, '_rest', {})
+    }
+
+
+def cookie_from_dict(cookie: Dict[str, Any]) -> Cookie:
+    return create_cookie(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'],
+                         secure=cookie['secure'], expires=cookie['expires'], rest=cookie.get('rest') or {})
@@ -0,0 +1,136 @@
+import json
+from typing import Any, Iterable, Iterator, List, Optional
+
+
+class SSEEvent:
+    """A single dispatched server-sent event."""
+    __slots__ = ('event', 'data', 'id', 'retry')
+
+    def __init__(self, event: str = 'message', data: str = '', id: Optional[str] = None, retry: Optional[int] = None):
+        self.event = event
+        self.data = data
+        self.id = id
+        self.retry = retry
+
+    def json(self) -> Any:
+        """Decode the event data as JSON."""
+        return json.loads(self.data)
+
+    def __repr__(self) -> str:
+        return f"SSEEvent(event={self.event!r}, id={self.id!r}, data={len(self.data)} chars)"
+
+
+class SSEParser:
+    """Incremental text/event-stream parser.
+
+    Bytes are fed in arbitrary chunks; complete events are returned as soon as
+    their terminating blank line has been received.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._scanned = 0
+        self._event = ''
+        self._data: List[str] = []
+        self._has_data = False
+        self.last_event_id: Optional[str] = None
+        self.retry: Optional[int] = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """Feed raw bytes and return the events completed by them."""
+        events = []
+        self._buffer += chunk
+        while True:
+            line, found = self._next_line()
+            if not found:
+                break
+            event = self._process_line(line)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def close(self) -> List[SSEEvent]:
+        """Discard an unterminated line and event left over when the stream ends.
+
+        Only a blank line dispatches an event, so an event cut off by a dropped
+        connection is never returned with partial data.
+        """
+        events = []
+        if self._buffer.endswith(b'\r'):
+            # A line ended by a CR was only held back in case an LF followed
+            event = self._process_line(bytes(self._buffer[:-1]))
+            if event is not None:
+                events.append(event)
+        self._buffer.clear()
+        self._scanned = 0
+        self._event = ''
+        self._data = []
+        self._has_data = False
+        return events
+
+    def _next_line(self):
+        # Lines end in CRLF, LF or CR; only scan bytes not inspected by a previous call
+        buffer = self._buffer
+        lf = buffer.find(b'\n', self._scanned)
+        cr = buffer.find(b'\r', self._scanned, lf if lf != -1 else len(buffer))
+        if cr != -1:
+            if cr + 1 == len(buffer):
+                # A trailing CR may still be followed by LF in the next chunk
+                self._scanned = cr
+                return b'', False
+            end, skip = cr, 2 if buffer[cr + 1] == 0x0A else 1
+        elif lf != -1:
+            end, skip = lf, 1
+        else:
+            self._scanned = len(buffer)
+            return b'', False
+        line = bytes(buffer[:end])
+        del buffer[:end + skip]
+        self._scanned = 0
+        return line, True
+
+    def _process_line(self, raw_line: bytes) -> Optional[SSEEvent]:
+        if not raw_line:
+            return self._dispatch()
+        line = raw_line.decode('utf-8', errors='replace')
+        if line.startswith(':'):
+            return None
+        field, _, value = line.partition(':')
+        if value.startswith(' '):
+            value = value[1:]
+        if field == 'data':
+            self._data.append(value)
+            self._has_data = True
+        elif field == 'event':
+            self._event = value
+        elif field == 'id':
+            if '\0' not in value:
+                self.last_event_id = value
+        elif field == 'retry':
+            if value.isdigit():
+                self.retry = int(value)
+        return None
+
+    def _dispatch(self) -> Optional[SSEEvent]:
+        if not self._has_data:
+            self._event = ''
+            return None
+        event = SSEEvent(
+            event=self._event or 'message',
+            data='\n'.join(self._data),
+            id=self.last_event_id,
+            retry=self.retry
+        )
+        self._event = ''
+        self._data = []
+        self._has_data = False
+        return event
+
+
+def iter_sse_events(chunks: Iterable[bytes]) -> Iterator[SSEEvent]:
+    """Yield events from an iterable of raw byte chunks as they complete."""
+    parser = SSEParser()
+    for chunk in chunks:
+        if chunk:
+            yield from parser.feed(chunk)
+    yield from parser.close()
@@ -0,0 +1,113 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+# Only the standard library here: this module is imported before everything it times
+
+
+class StartupProfiler:
+    """Times module imports and named initialization phases of the CLI.
+
+    When enabled, a finder placed first on sys.meta_path wraps the loader of every
+    module imported from then on, recording cumulative and self execution time.
+    Phases are timed with `with profiler.phase(name):`. Disabled, both are no-ops.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        # Module name -> (cumulative, self) seconds
+        self.imports: Dict[str, Tuple[float, float]] = {}
+        self.phases: List[Tuple[str, float]] = []
+        # Time spent in outermost imports, nested ones are included in their importer's time
+        self.import_total = 0.0
+        self.local = threading.local()
+        self.finder = None
+        if enabled:
+            self.finder = ImportTimingFinder(self)
+            sys.meta_path.insert(0, self.finder)
+
+    def uninstall(self) -> None:
+        if self.finder in sys.meta_path:
+            sys.meta_path.remove(self.finder)
+        self.finder = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    @contextmanager
+    def time_import(self, name: str) -> Iterator[None]:
+        stack = self.local.__dict__.setdefault('stack', [])
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            else:
+                self.import_total += elapsed
+            self.imports[name] = (elapsed, elapsed - children)
+
+    def report(self, top: int = 20) -> List[str]:
+        """Return report lines: slowest modules by cumulative import time, then the phases."""
+        lines = [f"Startup took {time.perf_counter() - self.started:.3f}s, "
+                 f"{len(self.imports)} modules imported in {self.import_total:.3f}s"]
+        lines.append(f"{'cumulative':>10} {'self':>8}  module")
+        for name, (cumulative, own) in sorted(self.imports.items(), key=lambda item: -item[1][0])[:top]:
+            lines.append(f"{cumulative * 1000:8.1f}ms {own * 1000:6.1f}ms  {name}")
+        for name, elapsed in self.phases:
+            lines.append(f"{elapsed * 1000:8.1f}ms  {name}")
+        return lines
+
+
+class ImportTimingFinder:
+    """Meta path finder that defers to the other finders and times the loaders they return."""
+
+    def __init__(self, profiler: StartupProfiler):
+        self.profiler = profiler
+
+    def find_spec(self, fullname, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                spec.loader = TimedLoader(spec.loader, self.profiler)
+            return spec
+        return None
+
+
+class TimedLoader:
+    """Loader proxy that times exec_module and hands the module its real loader back."""
+
+    def __init__(self, loader, profiler: StartupProfiler):
+        self.loader = loader
+        self.profiler = profiler
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        module.__loader__ = self.loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self.loader
+        with self.profiler.time_import(module.__name__):
+            self.loader.exec_module(module)
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
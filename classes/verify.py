@@ -0,0 +1,156 @@
+import hashlib
+import mmap
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+from classes.log import Log
+from classes.metrics import Metrics
+
+HASH_BLOCK_SIZE = 64 * 1024 * 1024
+# Manifest keys that may carry an expected checksum, and their algorithm
+CHECKSUM_KEYS = {'sha256': 'sha256', 'md5': 'md5', 'sha1': 'sha1'}
+
+
+def hash_file(path: str, algorithm: str = 'sha256', block_size: int = HASH_BLOCK_SIZE) -> Tuple[int, str]:
+    """Return the size and hex digest of a file, reading it through mmap in large slices.
+
+    Falls back to reads into one reusable buffer where the file cannot be mapped.
+    """
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return size, digest.hexdigest()
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            mapped = None
+        if mapped is not None:
+            with mapped:
+                if hasattr(mapped, 'madvise'):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                view = memoryview(mapped)
+                try:
+                    # hashlib releases the GIL on large updates, and the slices are not copied
+                    for offset in range(0, size, block_size):
+                        digest.update(view[offset:offset + block_size])
+                finally:
+                    view.release()
+            return size, digest.hexdigest()
+        buffer = bytearray(block_size)
+        view = memoryview(buffer)
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+        return size, digest.hexdigest()
+
+
+def expected_checksum(file_info: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    """Return the (algorithm, hex digest) a manifest file entry announces, if any."""
+    checksum = file_info.get('checksum')
+    if isinstance(checksum, dict) and checksum.get('value'):
+        algorithm = str(checksum.get('algorithm') or 'sha256').lower().replace('-', '')
+        if algorithm in CHECKSUM_KEYS:
+            return algorithm, checksum['value'].lower()
+    for key, algorithm in CHECKSUM_KEYS.items():
+        if file_info.get(key):
+            return algorithm, str(file_info[key]).lower()
+    return None
+
+
+class Verifier:
+    """Checks downloaded files against their expected size and checksum.
+
+    Sizes are compared in the calling thread. Files with a checksum to compare, or
+    one to record, are hashed on a process pool shared by every batch of the run,
+    so several large files hash on separate cores. A check is a dict with "path"
+    and optionally "size" (expected bytes), "size_tolerance", "checksum"
+    ((algorithm, hex digest)) and "hash" (compute a SHA-256 even without an
+    expected checksum). A file only counts as verified when a checksum or an
+    exact size was compared; one passing a size check with a tolerance is not
+    known to be bad, but not verified either.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.logger = Log().get_logger(self.__class__.__name__)
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.lock = threading.Lock()
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self.executor is None:
+                # Spawned, as forking a process with running transfer threads is unsafe
+                self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self.executor
+
+    def verify(self, checks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Verify every file, returning for each {"ok", "verified", "size", "algorithm", "checksum", "error"}."""
+        results: List[Dict[str, Any]] = []
+        futures: Dict[int, Future] = {}
+        for index, check in enumerate(checks):
+            result = {'ok': True, 'verified': False, 'size': None, 'algorithm': None, 'checksum': None, 'error': None}
+            results.append(result)
+            try:
+                result['size'] = os.path.getsize(check['path'])
+            except OSError as e:
+                result.update(ok=False, error=f"missing: {e}")
+                continue
+            expected_size = check.get('size')
+            if expected_size is not None:
+                tolerance = check.get('size_tolerance', 0)
+                if abs(result['size'] - expected_size) > tolerance:
+                    result.update(ok=False, error=f"size {result['size']} bytes, expected {expected_size}")
+                    continue
+                result['verified'] = tolerance < 1
+            if check.get('checksum') or check.get('hash'):
+                result['algorithm'] = check['checksum'][0] if check.get('checksum') else 'sha256'
+                try:
+                    futures[index] = self.get_executor().submit(hash_file, check['path'], result['algorithm'])
+                except BrokenProcessPool as e:
+                    self.discard_executor()
+                    result.update(ok=False, error=f"not hashed: {e}")
+        metrics = Metrics()
+        for index, future in futures.items():
+            check, result = checks[index], results[index]
+            try:
+                with metrics.timer('verify.hash'):
+                    size, digest = future.result()
+            except BrokenProcessPool as e:
+                # A worker died, e.g. killed for memory; the next batch gets a new pool
+                self.discard_executor()
+                result.update(ok=False, error=f"not hashed: {e}")
+                continue
+            except OSError as e:
+                result.update(ok=False, error=f"unreadable: {e}")
+                continue
+            metrics.count('verify.hashed_bytes', size)
+            result['checksum'] = digest
+            if check.get('checksum'):
+                if digest != check['checksum'][1]:
+                    result.update(ok=False, error=f"{check['checksum'][0]} {digest}, expected {check['checksum'][1]}")
+                else:
+                    result['verified'] = True
+        metrics.count('verify.files', len(checks))
+        metrics.count('verify.failed', sum(1 for result in results if not result['ok']))
+        metrics.count('verify.unverified', sum(1 for result in results if result['ok'] and not result['verified']))
+        return results
+
+    def discard_executor(self) -> None:
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            self.logger.warning("The hashing process pool broke, starting a new one")
+            executor.shutdown(wait=False)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
@@ -0,0 +1,277 @@
+import asyncio
+import importlib.util
+import threading
+from contextlib import aclosing
+from functools import wraps
+from typing import Any, AsyncIterator, Coroutine, Dict, List, Optional, Tuple
+
+from classes.cache import cached_response
+from classes.log import Log
+from classes.metrics import Metrics, timed
+from classes.sse import SSEEvent, SSEParser
+from netflix.backlot import Backlot
+from netflix.transport import parse_retry_after
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+def ensure_session(func):
+    @wraps(func)
+    async def wrapper(self: 'AsyncBacklot', *args, **kwargs):
+        backlot = self.backlot
+        if not backlot.token_is_fresh():
+            # Authentication is rare and may open a browser, so it stays on the synchronous client
+            await asyncio.to_thread(backlot.refresh_token, stale_token=backlot.token)
+        token = backlot.token
+        try:
+            return await func(self, *args, **kwargs)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 401:
+                raise
+            Metrics().count('backlot.unauthorized_retries')
+            self.logger.info(f"{func.__name__} was unauthorized, refreshing the access token and retrying")
+            await asyncio.to_thread(backlot.refresh_token, stale_token=token)
+            return await func(self, *args, **kwargs)
+    return wrapper
+
+
+class AsyncBacklot:
+    """Asynchronous Backlot client for fanning out metadata queries on one event loop.
+
+    Has the methods of Backlot as coroutines and shares its access token, queries,
+    cache and cookie jar, so authenticating on the synchronous client is enough.
+    Calls run on a background event loop; `run` submits a coroutine from any
+    thread and waits for its result. At most `max_concurrency` calls are in
+    flight, over HTTP/2 when the h2 package is installed, and every call goes
+    through the per-host limiter of the shared Transport, like the synchronous
+    sessions. Connection errors are retried by the httpx transport.
+    """
+
+    def __init__(self, backlot: Backlot, max_concurrency: int = 100, http2: bool = True):
+        if httpx is None:
+            raise ValueError("The httpx client requires the httpx package")
+        self.logger = Log().get_logger(self.__class__.__name__)
+        self.backlot = backlot
+        self.max_concurrency = max(1, max_concurrency)
+        self.http2 = http2 and importlib.util.find_spec('h2') is not None
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='backlot-async', daemon=True)
+        self.thread.start()
+        self.client: 'httpx.AsyncClient' = self.run(self.create_client())
+
+    @property
+    def cache(self):
+        return self.backlot.cache
+
+    async def create_client(self) -> 'httpx.AsyncClient':
+        transport = self.backlot.meechum.transport
+        connect_timeout, read_timeout = transport.timeout
+        limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.logger.debug(f"Async client: {self.max_concurrency} concurrent calls, HTTP/2 {'on' if self.http2 else 'off'}")
+        return httpx.AsyncClient(
+            # The session's jar itself, so cookies set by either client are seen by both
+            cookies=self.backlot.session.cookies,
+            headers=self.backlot.headers,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            transport=httpx.AsyncHTTPTransport(retries=transport.retries, http2=self.http2, limits=limits)
+        )
+
+    def run(self, coroutine: Coroutine) -> Any:
+        """Run a coroutine on the client's event loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self) -> None:
+        self.run(self.client.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def send(self, method: str, url: str, idempotent: bool = False, stream: bool = False, **kwargs) -> 'httpx.Response':
+        """Send a request within the concurrency limit and the host's rate limiter.
+
+        Throttled calls are retried after their Retry-After, and transient 5xx
+        responses of idempotent calls with the backoff of the shared Transport.
+        A streamed response must be closed by the caller.
+        """
+        transport = self.backlot.meechum.transport
+        limiter = transport.limiter.for_url(url)
+        methods = {method} if idempotent else ()
+        attempt = 0
+        while True:
+            with Metrics().timer('ratelimit.wait'):
+                await limiter.acquire_async()
+            try:
+                async with self.semaphore:
+                    response = await self.client.send(self.client.build_request(method, url, **kwargs), stream=stream)
+            except Exception:
+                limiter.release(throttled=True)
+                raise
+            retry_after = parse_retry_after(response.headers)
+            limiter.release(throttled=transport.is_throttled(response.status_code), retry_after=retry_after)
+            if attempt >= transport.retries or not transport.should_retry(method, response.status_code, methods):
+                return response
+            delay = transport.retry_delay(attempt, retry_after)
+            attempt += 1
+            Metrics().count('http.retries')
+            self.logger.info(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+            await response.aclose()
+            await asyncio.sleep(delay)
+
+    def get_access_token(self) -> str:
+        """Retrieve the access token from the Meechum service."""
+        return self.run(self.fetch_access_token())[0]
+
+    @timed('backlot.fetch_access_token')
+    async def fetch_access_token(self) -> Tuple[str, Optional[float]]:
+        """Retrieve the access token and its lifetime in seconds, when given, from the Meechum service."""
+        url = f'{self.backlot.base_url}/meechum?info=json'
+        try:
+            response = await self.send('GET', url, idempotent=True)
+            response.raise_for_status()
+            return self.backlot.parse_access_token(response.json())
+        except Exception as e:
+            self.logger.error(f"Failed to get access token: {e}")
+            raise
+
+    @timed('backlot.search_requests')
+    @cached_response
+    @ensure_session
+    async def search_requests(self, movie_id: str, source_type: str = 'SECONDARY_AUDIO_SOURCE', start: int = 0, limit: int = 25000,
+                              request_statuses: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Search for one page of source requests based on movie ID, source type and request statuses."""
+        url, headers, data = self.backlot.build_search_request(movie_id, source_type, start, limit, request_statuses)
+        try:
+            response = await self.send('POST', url, idempotent=True, headers=headers, json=data)
+            response.raise_for_status()
+            Metrics().count('backlot.response_bytes', len(response.content))
+            return response.json()
+        except Exception as e:
+            self.logger.error(f"Failed to search requests: {e}")
+            raise
+
+    async def iter_request_ids(self, movie_id: str, source_type: str = 'SECONDARY_AUDIO_SOURCE', page_size: int = Backlot.SEARCH_PAGE_SIZE,
+                               request_statuses: Optional[List[str]] = None) -> AsyncIterator[List[str]]:
+        """Yield the request IDs of a movie's source requests one page at a time, as the pages arrive."""
+        if page_size < 1:
+            raise ValueError(f"page_size must be at least 1, got {page_size}")
+        start = 0
+        while True:
+            page = await self.search_requests(movie_id, source_type, start=start, limit=page_size, request_statuses=request_statuses)
+            if 'sourceRequest' not in page:
+                message = f"sourceRequest not found in search response for movie ID {movie_id} at offset {start}"
+                if start > 0:
+                    # Ending here would pass off the pages found so far as every source request of the title
+                    raise Exception(message)
+                self.logger.error(message)
+                return
+            request_ids = self.backlot.page_request_ids(page)
+            self.logger.debug(f"Found {len(request_ids)} source requests for movie ID {movie_id} at offset {start}")
+            if request_ids:
+                yield request_ids
+            # An empty page also ends the search, should the server ignore the limit
+            if not request_ids or len(request_ids) < page_size:
+                return
+            start += page_size
+
+    async def list_request_id_pages(self, movie_id: str, **kwargs) -> List[List[str]]:
+        """Return every page of request IDs of a movie, see `iter_request_ids`."""
+        return [request_ids async for request_ids in self.iter_request_ids(movie_id, **kwargs)]
+
+    async def subscribe(self, data: Dict[str, Any], headers: Dict[str, str]) -> AsyncIterator[SSEEvent]:
+        """Post a GraphQL subscription and yield its server-sent events as they arrive."""
+        connect_timeout, read_timeout = self.backlot.sse_timeout
+        metrics = Metrics()
+        response = await self.send('POST', self.backlot.gateway_url, stream=True, headers=headers, json=data,
+                                   timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
+        try:
+            response.raise_for_status()
+            parser = SSEParser()
+            async for chunk in response.aiter_bytes(Backlot.SSE_CHUNK_SIZE):
+                metrics.count('backlot.response_bytes', len(chunk))
+                for event in parser.feed(chunk):
+                    yield event
+            for event in parser.close():
+                yield event
+        finally:
+            await response.aclose()
+
+    async def first_subscription_data(self, data: Dict[str, Any], headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """Return the first data payload of a subscription, closing the stream right after it."""
+        async with aclosing(self.subscribe(data, headers)) as events:
+            async for event in events:
+                payload = self.backlot.event_data(event, data)
+                if payload:
+                    return payload
+        return None
+
+    @timed('backlot.search_download_assets')
+    @cached_response
+    @ensure_session
+    async def search_download_assets(self, source_request_ids: List[str], profile: str = 'full') -> Optional[Dict[str, Any]]:
+        """Search for download assets based on source request IDs, fetching the fields of a query profile."""
+        headers, data = self.backlot.build_download_assets_subscription(source_request_ids, profile)
+        try:
+            return await self.first_subscription_data(data, headers)
+        except Exception as e:
+            self.logger.error(f"Failed to search download assets: {e}")
+            raise
+
+    async def search_download_assets_paged(self, movie_id: str, page_size: int = Backlot.SEARCH_PAGE_SIZE,
+                                           request_statuses: Optional[List[str]] = None, profile: str = 'full') -> List[Optional[Dict[str, Any]]]:
+        """Search the download assets of every source request page of a movie, each page as soon as it arrives."""
+        tasks = []
+        try:
+            async for request_ids in self.iter_request_ids(movie_id, page_size=page_size, request_statuses=request_statuses):
+                tasks.append(asyncio.ensure_future(self.search_download_assets(request_ids, profile=profile)))
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    @timed('backlot.search_download_assets_batch')
+    async def search_download_assets_batch(self, request_ids_by_movie: Dict[str, List[str]], chunk_size: int = 50,
+                                           profile: str = 'full') -> Dict[str, Dict[str, Any]]:
+        """Search download assets for many movies with all chunks of source request IDs in flight at once.
+
+        Same results as `Backlot.search_download_assets_batch`.
+        """
+        owners, chunks = self.backlot.plan_batch(request_ids_by_movie, chunk_size)
+        self.logger.info(f"Searching download assets for {len(owners)} source requests in {len(chunks)} concurrent subscriptions")
+
+        async def search(chunk: List[str]) -> Optional[Dict[str, Any]]:
+            try:
+                return await self.search_download_assets(chunk, profile=profile) or {}
+            except Exception as e:
+                chunk_movies = sorted({movie_id for request_id in chunk for movie_id in owners[request_id]})
+                self.logger.error(f"Batched asset search failed for movies {chunk_movies}: {e}")
+                return None
+
+        results: Dict[str, Dict[str, Any]] = {}
+        failed_movies = set()
+        for chunk, response in zip(chunks, await asyncio.gather(*(search(chunk) for chunk in chunks))):
+            chunk_movies = {movie_id for request_id in chunk for movie_id in owners[request_id]}
+            if response is None:
+                failed_movies.update(chunk_movies)
+            else:
+                self.backlot.merge_batch_response(results, response, owners, chunk_movies)
+        # A movie spread over a failed chunk only has partial results
+        return {movie_id: result for movie_id, result in results.items() if movie_id not in failed_movies}
+
+    @timed('backlot.download_materials_manifests')
+    @ensure_session
+    async def download_materials_manifests(self, requests_data: List[Dict[str, Any]], profile: str = 'full') -> Optional[Dict[str, Any]]:
+        """Download materials manifests based on request data, fetching the fields of a query profile."""
+        headers, data = self.backlot.build_manifests_subscription(requests_data, profile)
+        try:
+            manifests = await self.first_subscription_data(data, headers)
+            if manifests is None:
+                raise Exception("No data found in response")
+            return manifests
+        except Exception as e:
+            self.logger.error(f"Failed to download materials manifests: {e}")
+            raise
@@ -1,37 +1,93 @@
+from netflix.material import Material, iter_materials
 from netflix.meechum import Meechum
 from netflix.service import Service
 from functools import wraps
+import base64
 import json
+import threading
+import time
+import requests
+from classes.cache import ResponseCache, cached_response
 from classes.log import Log
-from typing import List, Dict, Any, Optional
+from classes.metrics import Metrics, timed
+from classes.sse import SSEEvent, iter_sse_events
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
 def ensure_session(func):
   @wraps(func)
   def wrapper(self: 'Backlot', *args, **kwargs):
-    if not self.check_authentication():
-      self.logger.debug("Session invalid or expired. Re-authenticating...")
-      self.meechum.authenticate(self.redirect_url)
-      self.session = self.meechum.session
-      self.token = self.get_access_token()
-    return func(self, *args, **kwargs)
+    if not self.token_is_fresh():
+      self.refresh_token(stale_token=self.token)
+    token = self.token
+    try:
+      return func(self, *args, **kwargs)
+    except requests.HTTPError as e:
+      if e.response is None or e.response.status_code != 401:
+        raise
+      # The token was revoked or expired early: refresh once and retry
+      Metrics().count('backlot.unauthorized_retries')
+      self.logger.info(f"{func.__name__} was unauthorized, refreshing the access token and retrying")
+      self.refresh_token(stale_token=token)
+      return func(self, *args, **kwargs)
   return wrapper
 
+def decode_token_expiry(token: str) -> Optional[float]:
+  """Return the `exp` claim of a JWT access token, or None if the token is not a JWT."""
+  parts = token.split('.')
+  if len(parts) != 3:
+    return None
+  try:
+    payload = parts[1] + '=' * (-len(parts[1]) % 4)
+    claims = json.loads(base64.urlsafe_b64decode(payload))
+    return float(claims['exp'])
+  except (ValueError, KeyError, TypeError):
+    return None
+
 class Backlot(Service):
   DOWNLOAD_MATERIALS_QUERY: Optional[str] = None
   DOWNLOAD_MATERIALS_MANIFESTS_QUERY: Optional[str] = None
+  SSE_CHUNK_SIZE = 64 * 1024
+  # Tokens are refreshed this many seconds before they expire
+  TOKEN_REFRESH_MARGIN = 120
+  # Source requests fetched per search page
+  SEARCH_PAGE_SIZE = 1000
+  # "full" fetches every material field, "lean" only what extract_asset_info and the selection read
+  QUERY_PROFILES = {
+    'full': {
+      'downloadMaterials': 'graphql/downloadMaterials.graphql',
+      'downloadMaterialsManifests': 'graphql/downloadMaterialsManifests.graphql'
+    },
+    'lean': {
+      'downloadMaterials': 'graphql/downloadMaterialsLean.graphql',
+      'downloadMaterialsManifests': 'graphql/downloadMaterialsManifestsLean.graphql'
+    }
+  }
 
-  def __init__(self, meechum: Meechum):
+  BASE_URL = 'https://backlot.netflixstudios.com'
+  GATEWAY_URL = 'https://studiogateway.prod.netflixstudios.com/subscriptions/sse'
+
+  def __init__(self, meechum: Meechum, sse_connect_timeout: float = 30, sse_read_timeout: float = 300,
+               base_url: Optional[str] = None, gateway_url: Optional[str] = None):
     super().__init__(meechum)
-    self.base_url = 'https://backlot.netflixstudios.com'
+    # Overridable to point a run at a stand-in server, see benchmarks/standin_server.py
+    self.base_url = (base_url or self.BASE_URL).rstrip('/')
     self.redirect_url = self.base_url + "/meechum"
+    self.gateway_url = gateway_url or self.GATEWAY_URL
+    self.sse_timeout = (sse_connect_timeout, sse_read_timeout)
     self.logger = Log().get_logger(self.__class__.__name__)
+    # Source request searches only read, so they are retried like GETs
+    meechum.transport.mount_idempotent(self.session, f'{self.base_url}/api/sourceRequests')
     
     # Load GraphQL queries from files
+    self.queries: Dict[str, Dict[str, str]] = {}
     try:
-      with open('graphql/downloadMaterials.graphql', 'r') as f:
-        self.DOWNLOAD_MATERIALS_QUERY = f.read()
-      with open('graphql/downloadMaterialsManifests.graphql', 'r') as f:
-        self.DOWNLOAD_MATERIALS_MANIFESTS_QUERY = f.read()
+      for profile, files in self.QUERY_PROFILES.items():
+        self.queries[profile] = {}
+        for name, path in files.items():
+          with open(path, 'r') as f:
+            self.queries[profile][name] = f.read()
+      self.DOWNLOAD_MATERIALS_QUERY = self.queries['full']['downloadMaterials']
+      self.DOWNLOAD_MATERIALS_MANIFESTS_QUERY = self.queries['full']['downloadMaterialsManifests']
     except FileNotFoundError as e:
       self.logger.error(f"GraphQL query file not found: {e}")
       raise
@@ -41,38 +97,148 @@ class Backlot(Service):
     
     self.authenticated = False
     self.token = None
+    self.token_expires_at: Optional[float] = None
+    self.auth_lock = threading.RLock()
+    self.refresh_timer: Optional[threading.Timer] = None
+    # Optional metadata response cache, never used for manifests and their transport tokens
+    self.cache: Optional[ResponseCache] = None
+    self.restore_token()
 
   def check_authentication(self, refresh_token: bool = False) -> bool:
     """Check if the current session is authenticated."""
-    if self.authenticated and not refresh_token:
+    if self.token_is_fresh() and not refresh_token:
       return True
     try:
-      self.token = self.get_access_token()
-      self.logger.debug(f"Access token: {self.token}")
+      self.set_token(*self.fetch_access_token())
       self.logger.info("Backlot session is valid, new token requested")
-      self.authenticated = True
       return True
     except Exception as e:
       self.logger.warning(f"Backlot session is invalid. Status code: {str(e)}")
+      self.authenticated = False
       return False
 
+  def token_is_fresh(self) -> bool:
+    """Check whether the current token is known and not about to expire."""
+    if not self.authenticated or not self.token:
+      return False
+    return self.token_expires_at is None or time.time() < self.token_expires_at - self.TOKEN_REFRESH_MARGIN
+
+  def set_token(self, token: str, expires_in: Optional[float] = None, persist: bool = True) -> None:
+    """Install a new access token and schedule its refresh shortly before it expires."""
+    self.token = token
+    self.authenticated = True
+    self.logger.debug(f"Access token: {self.token}")
+    if expires_in is not None:
+      self.token_expires_at = time.time() + expires_in
+    else:
+      self.token_expires_at = decode_token_expiry(token)
+    if persist and self.token_expires_at is not None:
+      try:
+        self.meechum.save_token(self.base_url, token, self.token_expires_at)
+      except Exception as e:
+        self.logger.warning(f"Failed to persist access token: {e}")
+    self.schedule_refresh()
+
+  def restore_token(self, stale_token: Optional[str] = None) -> bool:
+    """Adopt the persisted access token when it is still fresh and not `stale_token`.
+
+    Lets a new process skip authentication, and a process whose token went stale pick
+    up the token another process already refreshed, along with its cookies.
+    """
+    stored = self.meechum.load_token(self.base_url)
+    if not stored:
+      return False
+    token, expires_at = stored
+    if token == stale_token or time.time() >= expires_at - self.TOKEN_REFRESH_MARGIN:
+      return False
+    self.meechum.load_session()
+    self.set_token(token, expires_in=expires_at - time.time(), persist=False)
+    self.logger.info("Using persisted access token")
+    return True
+
+  def schedule_refresh(self) -> None:
+    if self.refresh_timer:
+      self.refresh_timer.cancel()
+      self.refresh_timer = None
+    if self.token_expires_at is None:
+      return
+    delay = self.token_expires_at - self.TOKEN_REFRESH_MARGIN - time.time()
+    if delay <= 0:
+      # Already inside the refresh margin, the next call re-authenticates
+      return
+    self.refresh_timer = threading.Timer(delay, self.background_refresh)
+    self.refresh_timer.daemon = True
+    self.refresh_timer.start()
+    self.logger.debug(f"Access token refresh scheduled in {delay:.0f}s")
+
+  def background_refresh(self) -> None:
+    try:
+      self.refresh_token(stale_token=self.token)
+    except Exception as e:
+      # The next call re-authenticates through ensure_session
+      self.logger.warning(f"Background token refresh failed: {e}")
+
+  def refresh_token(self, stale_token: Optional[str] = None) -> None:
+    """Fetch a new access token unless another thread already replaced `stale_token`.
+
+    Workers share one session, so the lock makes sure only one of them refreshes or
+    re-authenticates while the others wait for its token. The session store lock does
+    the same across processes.
+    """
+    with self.auth_lock:
+      if self.token_is_fresh() and self.token != stale_token:
+        return
+      # Processes sharing the session store refresh one at a time
+      with self.meechum.store.lock:
+        if self.restore_token(stale_token=stale_token):
+          return
+        if not self.check_authentication(refresh_token=True) or not self.token_is_fresh():
+          self.logger.debug("Session invalid or expired. Re-authenticating...")
+          self.meechum.authenticate(self.redirect_url)
+          self.session = self.meechum.session
+          self.set_token(*self.fetch_access_token())
+
   def get_access_token(self) -> str:
     """Retrieve the access token from the Meechum service."""
+    return self.fetch_access_token()[0]
+
+  @timed('backlot.fetch_access_token')
+  def fetch_access_token(self) -> Tuple[str, Optional[float]]:
+    """Retrieve the access token and its lifetime in seconds, when given, from the Meechum service."""
     url = f'{self.base_url}/meechum?info=json'
     try:
       response = self.session.get(url, headers=self.headers)
       response.raise_for_status()
-      data = response.json()
-      if 'access_token' not in data:
-        raise Exception("Access token not found in response.")
-      return data['access_token']
+      return self.parse_access_token(response.json())
     except Exception as e:
       self.logger.error(f"Failed to get access token: {e}")
       raise
 
+  def parse_access_token(self, data: Dict[str, Any]) -> Tuple[str, Optional[float]]:
+    if 'access_token' not in data:
+      raise Exception("Access token not found in response.")
+    expires_in = data.get('expires_in')
+    return data['access_token'], float(expires_in) if expires_in is not None else None
+
+  @timed('backlot.search_requests')
+  @cached_response
   @ensure_session
-  def search_requests(self, movie_id: str, source_type: str = 'SECONDARY_AUDIO_SOURCE') -> Dict[str, Any]:
-    """Search for source requests based on movie ID and source type."""
+  def search_requests(self, movie_id: str, source_type: str = 'SECONDARY_AUDIO_SOURCE', start: int = 0, limit: int = 25000,
+                      request_statuses: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Search for one page of source requests based on movie ID, source type and request statuses."""
+    url, headers, data = self.build_search_request(movie_id, source_type, start, limit, request_statuses)
+    try:
+      response = self.session.post(url, headers=headers, json=data)
+      response.raise_for_status()
+      Metrics().count('backlot.response_bytes', len(response.content))
+      return response.json()
+    except Exception as e:
+      self.logger.error(f"Failed to search requests: {e}")
+      raise
+
+  def build_search_request(self, movie_id: str, source_type: str, start: int, limit: int,
+                           request_statuses: Optional[List[str]]) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+    """Return the URL, headers and body of a source request search."""
     url = f'{self.base_url}/api/sourceRequests'
     headers = self.headers.copy()
     headers.update({
@@ -83,75 +249,104 @@ class Backlot(Service):
     data = {
       "dataset": {
         "and": [
-          {"or": [{"field": "requestStatus", "eq": "all"}]},
+          {"or": [{"field": "requestStatus", "eq": status} for status in request_statuses or ['all']]},
           {"or": [{"field": "movieIds", "eq": movie_id}]},
           {"or": [{"field": "sourceType", "eq": source_type}]}
         ]
       },
       "queryConfig": {
-        "start": 0,
-        "limit": 25000,
+        "start": start,
+        "limit": limit,
         "includeAllFields": False
       }
     }
-    try:
-      response = self.session.post(url, headers=headers, json=data)
+    return url, headers, data
+
+  def iter_request_ids(self, movie_id: str, source_type: str = 'SECONDARY_AUDIO_SOURCE', page_size: int = SEARCH_PAGE_SIZE,
+                       request_statuses: Optional[List[str]] = None) -> Iterator[List[str]]:
+    """Yield the request IDs of a movie's source requests one page at a time, as the pages arrive."""
+    if page_size < 1:
+      raise ValueError(f"page_size must be at least 1, got {page_size}")
+    start = 0
+    while True:
+      page = self.search_requests(movie_id, source_type, start=start, limit=page_size, request_statuses=request_statuses)
+      if 'sourceRequest' not in page:
+        message = f"sourceRequest not found in search response for movie ID {movie_id} at offset {start}"
+        if start > 0:
+          # Ending here would pass off the pages found so far as every source request of the title
+          raise Exception(message)
+        self.logger.error(message)
+        return
+      request_ids = self.page_request_ids(page)
+      self.logger.debug(f"Found {len(request_ids)} source requests for movie ID {movie_id} at offset {start}")
+      if request_ids:
+        yield request_ids
+      # An empty page also ends the search, should the server ignore the limit
+      if not request_ids or len(request_ids) < page_size:
+        return
+      start += page_size
+
+  def page_request_ids(self, page: Dict[str, Any]) -> List[str]:
+    return [request['requestId'] for request in page['sourceRequest']]
+
+  def subscribe(self, data: Dict[str, Any], headers: Dict[str, str]) -> Iterator[SSEEvent]:
+    """Post a GraphQL subscription and yield its server-sent events as they arrive."""
+    with self.session.post(self.gateway_url, headers=headers, json=data, stream=True, timeout=self.sse_timeout) as response:
       response.raise_for_status()
-      return response.json()
-    except Exception as e:
-      self.logger.error(f"Failed to search requests: {e}")
-      raise
+      yield from iter_sse_events(self.count_bytes(response.iter_content(chunk_size=self.SSE_CHUNK_SIZE)))
+
+  def count_bytes(self, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    metrics = Metrics()
+    for chunk in chunks:
+      metrics.count('backlot.response_bytes', len(chunk))
+      yield chunk
+
+  def iter_subscription_data(self, data: Dict[str, Any], headers: Dict[str, str]) -> Iterator[Dict[str, Any]]:
+    """Yield the decoded payload of every subscription event that carries data."""
+    for event in self.subscribe(data, headers):
+      payload = self.event_data(event, data)
+      if payload:
+        yield payload
 
-  def extract_asset_info(self, response_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+  def event_data(self, event: SSEEvent, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the data carried by a subscription event, logging the errors it reports."""
+    payload = event.json()
+    if "errors" in payload and payload["errors"]:
+      self.logger.warning(f"Subscription {data.get('operationName')} returned errors: {payload['errors']}")
+    if "data" in payload and payload["data"]:
+      return payload["data"]
+    return None
+
+  def first_subscription_data(self, data: Dict[str, Any], headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Return the first data payload of a subscription, closing the stream right after it."""
+    events = self.iter_subscription_data(data, headers)
+    try:
+      return next(events, None)
+    finally:
+      events.close()
+
+  def extract_asset_info(self, response_data: Dict[str, Any]) -> List[Material]:
     """Extract asset information from the response data."""
-    assets_info = []
-
-    if 'sr_downloadMaterials' in response_data:
-      for item in response_data['sr_downloadMaterials']:
-        source_request_id = item.get('sourceRequestId')
-        materials = item.get('materials', [])
-
-        for material in materials:
-          status = material.get('status', 'UNKNOWN')
-          file_info = material.get('file', {})
-          movie_info = material.get('movie', {})
-          type = material.get('type', 'UNKNOWN')
-          language = material.get('language', None)
-          material_filter = {}
-
-          root_amp_asset = material.get('rootAmpAsset', {})
-          if root_amp_asset:
-            material_filter["ampAssetId"] = root_amp_asset.get('assetId', {}).get('id')
-          if file_info:
-            if 'location' in file_info and file_info['location'] and 'url' in file_info['location']:
-              material_filter["fileLocationUrl"] = file_info['location']['url']
-            if 'name' in file_info:
-              material_filter["fileName"] = file_info['name']
-          if movie_info:
-            material_filter["movieId"] = movie_info.get('movieId')
-          package_info = material.get('packageWrapper', {})
-          if package_info and package_info["id"]:
-            material_filter["packageId"] = package_info["id"]
-          if "packageId" in material_filter and "ampAssetId" in material_filter:
-            del material_filter["ampAssetId"]
-
-          asset_info = {
-            'status': status,
-            'language': language,
-            'sourceRequestId': source_request_id,
-            'materialType': type,
-            'fileInfo': file_info,
-            'materialFilter': material_filter
-          }
-
-          assets_info.append(asset_info)
-
-    return assets_info
+    return list(self.iter_asset_info(response_data))
+
+  def iter_asset_info(self, response_data: Dict[str, Any]) -> Iterator[Material]:
+    """Lazily extract asset information from the response data, one Material at a time."""
+    return iter_materials(response_data or {})
 
+  @timed('backlot.search_download_assets')
+  @cached_response
   @ensure_session
-  def search_download_assets(self, source_request_ids: List[str]) -> Optional[Dict[str, Any]]:
-    """Search for download assets based on source request IDs."""
-    url = 'https://studiogateway.prod.netflixstudios.com/subscriptions/sse'
+  def search_download_assets(self, source_request_ids: List[str], profile: str = 'full') -> Optional[Dict[str, Any]]:
+    """Search for download assets based on source request IDs, fetching the fields of a query profile."""
+    headers, data = self.build_download_assets_subscription(source_request_ids, profile)
+    try:
+      return self.first_subscription_data(data, headers)
+    except Exception as e:
+      self.logger.error(f"Failed to search download assets: {e}")
+      raise
+
+  def build_download_assets_subscription(self, source_request_ids: List[str], profile: str) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    """Return the headers and body of a downloadMaterials subscription."""
     headers = {
       'accept': 'text/event-stream',
       'authorization': f'Bearer {self.token}',
@@ -166,25 +361,92 @@ class Backlot(Service):
       "variables": {
         "sourceRequestIds": source_request_ids
       },
-      "query": self.DOWNLOAD_MATERIALS_QUERY
+      "query": self.get_query('downloadMaterials', profile)
     }
+    return headers, data
+
+  def get_query(self, name: str, profile: str = 'full') -> str:
+    """Return the GraphQL query `name` for a query profile."""
+    if profile not in self.queries:
+      raise ValueError(f"Unknown query profile: {profile}")
+    return self.queries[profile][name]
+
+  @timed('backlot.search_download_assets_batch')
+  def search_download_assets_batch(self, request_ids_by_movie: Dict[str, List[str]], chunk_size: int = 50, profile: str = 'full') -> Dict[str, Dict[str, Any]]:
+    """Search download assets for many movies with one subscription per chunk of source request IDs.
+
+    Results are split back per movie ID in the same shape as `search_download_assets`.
+    Movies whose chunk failed are left out so callers can fall back to a per-title search.
+    """
+    owners, chunks = self.plan_batch(request_ids_by_movie, chunk_size)
+    results: Dict[str, Dict[str, Any]] = {}
+    failed_movies = set()
+    for chunk in chunks:
+      chunk_movies = {movie_id for request_id in chunk for movie_id in owners[request_id]}
+      self.logger.info(f"Searching download assets for {len(chunk)} source requests across {len(chunk_movies)} movies")
+      try:
+        response = self.search_download_assets(chunk, profile=profile) or {}
+      except Exception as e:
+        self.logger.error(f"Batched asset search failed for movies {sorted(chunk_movies)}: {e}")
+        failed_movies.update(chunk_movies)
+        continue
+      self.merge_batch_response(results, response, owners, chunk_movies)
+    # A movie spread over a failed chunk only has partial results
+    return {movie_id: result for movie_id, result in results.items() if movie_id not in failed_movies}
+
+  def plan_batch(self, request_ids_by_movie: Dict[str, List[str]], chunk_size: int) -> Tuple[Dict[str, List[str]], List[List[str]]]:
+    """Map every distinct source request ID to the movies asking for it, and chunk the IDs."""
+    owners: Dict[str, List[str]] = {}
+    for movie_id, request_ids in request_ids_by_movie.items():
+      for request_id in request_ids:
+        owners.setdefault(request_id, [])
+        if movie_id not in owners[request_id]:
+          owners[request_id].append(movie_id)
+    all_request_ids = list(owners)
+    chunk_size = max(1, chunk_size)
+    return owners, [all_request_ids[start:start + chunk_size] for start in range(0, len(all_request_ids), chunk_size)]
+
+  def merge_batch_response(self, results: Dict[str, Dict[str, Any]], response: Dict[str, Any], owners: Dict[str, List[str]],
+                           chunk_movies: set) -> None:
+    """Split the response of one chunk per movie ID into `results`."""
+    for movie_id in chunk_movies:
+      results.setdefault(movie_id, {'sr_downloadMaterials': []})
+    for item in response.get('sr_downloadMaterials') or []:
+      for movie_id, materials in self._split_materials_by_movie(item, owners.get(item.get('sourceRequestId'), []), chunk_movies).items():
+        results[movie_id]['sr_downloadMaterials'].append({**item, 'materials': materials})
+
+  def _split_materials_by_movie(self, item: Dict[str, Any], owners: List[str], candidates: set) -> Dict[str, List[Dict[str, Any]]]:
+    """Assign the materials of one source request to the movie IDs that asked for it."""
+    materials = item.get('materials') or []
+    if len(owners) == 1:
+      return {owners[0]: materials}
+    # Shared or unknown source request: route by movie.movieId, unmatched materials go to every owner
+    split: Dict[str, List[Dict[str, Any]]] = {movie_id: [] for movie_id in owners}
+    for material in materials:
+      material_movie_id = str((material.get('movie') or {}).get('movieId'))
+      if material_movie_id in split or (not owners and material_movie_id in candidates):
+        split.setdefault(material_movie_id, []).append(material)
+      else:
+        for movie_id in owners:
+          split[movie_id].append(material)
+    return split
+
+  @timed('backlot.download_materials_manifests')
+  @ensure_session
+  def download_materials_manifests(self, requests_data: List[Dict[str, Any]], profile: str = 'full') -> Optional[Dict[str, Any]]:
+    """Download materials manifests based on request data, fetching the fields of a query profile."""
+    headers, data = self.build_manifests_subscription(requests_data, profile)
     try:
-      response = self.session.post(url, headers=headers, json=data)
-      response.raise_for_status()
-      for line in response.text.splitlines():
-        if line.startswith('data:'):
-          data = json.loads(line[5:])
-          if "data" in data and data["data"]:
-            return data["data"]
-      return None
+      manifests = self.first_subscription_data(data, headers)
+      if manifests is None:
+        raise Exception("No data found in response")
+      return manifests
     except Exception as e:
-      self.logger.error(f"Failed to search download assets: {e}")
+      self.logger.error(f"Failed to download materials manifests: {e}")
       raise
 
-  @ensure_session
-  def download_materials_manifests(self, requests_data: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
-    """Download materials manifests based on request data."""
-    url = 'https://studiogateway.prod.netflixstudios.com/subscriptions/sse'
+  def build_manifests_subscription(self, requests_data: List[Dict[str, Any]], profile: str) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    """Return the headers and body of a downloadMaterialsManifests subscription."""
     headers = {
       'accept': 'text/event-stream',
       'authorization': f'Bearer {self.token}',
@@ -198,17 +460,6 @@ class Backlot(Service):
       "variables": {
         "requests": requests_data
       },
-      "query": self.DOWNLOAD_MATERIALS_MANIFESTS_QUERY
+      "query": self.get_query('downloadMaterialsManifests', profile)
     }
-    try:
-      response = self.session.post(url, headers=headers, json=data)
-      response.raise_for_status()
-      for line in response.text.splitlines():
-        if line.startswith('data:'):
-          data = json.loads(line[5:])
-          if "data" in data and data["data"]:
-            return data["data"]
-      raise Exception("No data found in response")
-    except Exception as e:
-      self.logger.error(f"Failed to download materials manifests: {e}")
-      raise
+    return headers, data
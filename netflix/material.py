@@ -0,0 +1,111 @@
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+class Material:
+    """Compact record of one downloadable material.
+
+    Holds only the fields the pipeline reads; the GraphQL request shape and the
+    debug dict are built on demand.
+    """
+    __slots__ = ('status', 'language', 'source_request_id', 'material_type', 'created_date',
+                 'file_name', 'file_location_url', 'movie_id', 'package_id', 'amp_asset_id')
+
+    # Field names used by the selection config, mapped to attributes
+    FIELDS = {
+        'status': 'status',
+        'language': 'language',
+        'sourceRequestId': 'source_request_id',
+        'materialType': 'material_type',
+        'createdDate': 'created_date',
+        'fileName': 'file_name',
+        'fileLocationUrl': 'file_location_url',
+        'movieId': 'movie_id',
+        'packageId': 'package_id',
+        'ampAssetId': 'amp_asset_id'
+    }
+
+    def __init__(self, status: str = 'UNKNOWN', language: Optional[str] = None, source_request_id: Optional[str] = None,
+                 material_type: str = 'UNKNOWN', created_date: Optional[str] = None, file_name: Optional[str] = None,
+                 file_location_url: Optional[str] = None, movie_id: Any = None, package_id: Optional[str] = None,
+                 amp_asset_id: Optional[str] = None):
+        self.status = status
+        self.language = language
+        self.source_request_id = source_request_id
+        self.material_type = material_type
+        self.created_date = created_date
+        self.file_name = file_name
+        self.file_location_url = file_location_url
+        self.movie_id = movie_id
+        self.package_id = package_id
+        self.amp_asset_id = amp_asset_id
+
+    @classmethod
+    def from_response(cls, source_request_id: Optional[str], material: Dict[str, Any]) -> 'Material':
+        """Build a record from one material of a downloadMaterials response."""
+        file_info = material.get('file') or {}
+        root_amp_asset = material.get('rootAmpAsset') or {}
+        # Positional arguments keep construction cheap on responses with 100k+ materials
+        return cls(
+            material.get('status', 'UNKNOWN'),
+            material.get('language'),
+            source_request_id,
+            material.get('type', 'UNKNOWN'),
+            material.get('createdDate'),
+            file_info.get('name'),
+            (file_info.get('location') or {}).get('url'),
+            (material.get('movie') or {}).get('movieId'),
+            (material.get('packageWrapper') or {}).get('id') or None,
+            (root_amp_asset.get('assetId') or {}).get('id')
+        )
+
+    @staticmethod
+    def field_getter(field: str) -> Callable[['Material'], Any]:
+        """Return a reader for a selection config field."""
+        return attrgetter(Material.FIELDS[field])
+
+    def material_filter(self, include_file_name: bool = False) -> Dict[str, Any]:
+        """Build the materialFilter of the download request; a package ID supersedes the AMP asset ID."""
+        material_filter = {}
+        if self.amp_asset_id is not None and self.package_id is None:
+            material_filter['ampAssetId'] = self.amp_asset_id
+        if self.file_location_url is not None:
+            material_filter['fileLocationUrl'] = self.file_location_url
+        if include_file_name and self.file_name is not None:
+            material_filter['fileName'] = self.file_name
+        if self.movie_id is not None:
+            material_filter['movieId'] = self.movie_id
+        if self.package_id is not None:
+            material_filter['packageId'] = self.package_id
+        return material_filter
+
+    def to_request(self) -> Dict[str, Any]:
+        """Serialize to an SRDownloadMaterialRequest for the manifests subscription."""
+        return {
+            'language': self.language,
+            'sourceRequestId': self.source_request_id,
+            'materialType': self.material_type,
+            'materialFilter': self.material_filter()
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize every field, for debug artifacts."""
+        return {
+            'status': self.status,
+            'language': self.language,
+            'sourceRequestId': self.source_request_id,
+            'materialType': self.material_type,
+            'createdDate': self.created_date,
+            'materialFilter': self.material_filter(include_file_name=True)
+        }
+
+    def __repr__(self) -> str:
+        return f"Material({self.material_type}, {self.file_name!r}, {self.status})"
+
+
+def iter_materials(response_data: Dict[str, Any]) -> Iterator[Material]:
+    """Yield a Material for every material of a downloadMaterials response."""
+    for item in response_data.get('sr_downloadMaterials') or []:
+        source_request_id = item.get('sourceRequestId')
+        for material in item.get('materials') or []:
+            yield Material.from_response(source_request_id, material)
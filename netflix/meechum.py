@@ -1,28 +1,38 @@
 import os
-import pickle
 import random
 import string
 import platform
-from typing import Optional
-from urllib.parse import urlparse
+import time
+from typing import Optional, Tuple
+from urllib.parse import parse_qs, urlparse
 
 import requests
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-from seleniumwire import webdriver
 
 from classes.log import Log
+from classes.metrics import timed
+from classes.session_store import SessionStore
+from netflix.transport import Transport
 
 
 class Meechum:
-    def __init__(self, profile_dir: Optional[str] = None):
+    AUTH_URL = 'https://meechum.netflix.com/as/authorization.oauth2'
+    SILENT_AUTH_TIMEOUT = 30
+    LOGIN_TIMEOUT = 600
+    POLL_INTERVAL_MIN = 0.1
+    POLL_INTERVAL_MAX = 2.0
+
+    def __init__(self, profile_dir: Optional[str] = None, transport: Optional[Transport] = None, auth_url: Optional[str] = None):
         self.logger = Log().get_logger(self.__class__.__name__)
+        # Overridable like the Backlot URLs, e.g. to authenticate against benchmarks/standin_server.py
+        self.auth_url = auth_url or self.AUTH_URL
         self.profile_dir = os.path.abspath(profile_dir or './profile')
         os.makedirs(self.profile_dir, exist_ok=True)
-        self.session_file = os.path.join(self.profile_dir, 'session.pkl')
+        self.store = SessionStore(os.path.join(self.profile_dir, 'session.json'))
         self.session = requests.Session()
         self.load_session()
+        # Mounted after loading so a restored session gets the configured adapters too
+        self.transport = transport or Transport()
+        self.transport.mount(self.session)
         self.headers = {
             'accept': '*/*',
             'accept-language': 'en-US,en;q=0.9',
@@ -40,18 +50,28 @@ class Meechum:
         self.session.headers.update(self.headers)
 
     def save_session(self) -> None:
-        with open(self.session_file, 'wb') as f:
-            pickle.dump(self.session, f)
+        """Persist the session cookies, merging them with those saved by other processes."""
+        self.store.update(cookies=self.session.cookies)
 
     def load_session(self) -> None:
-        if os.path.exists(self.session_file):
-            with open(self.session_file, 'rb') as f:
-                self.session = pickle.load(f)
-                self.logger.debug("Loaded cookies:")
-                for cookie in self.session.cookies:
-                    self.logger.debug(cookie)
+        """Load the persisted cookies into the session."""
+        cookies = self.store.load_cookies()
+        for cookie in cookies:
+            self.session.cookies.set_cookie(cookie)
+        self.logger.debug(f"Loaded {len(cookies)} cookies from {self.store.path}")
 
-    def authenticate(self, redirect_url: str) -> None:
+    def save_token(self, service: str, token: str, expires_at: float) -> None:
+        """Persist the access token of a service so later runs can skip authentication."""
+        self.store.update(tokens={service: {'token': token, 'expires_at': expires_at}})
+
+    def load_token(self, service: str) -> Optional[Tuple[str, float]]:
+        """Return the persisted access token of a service and its expiry time, if any."""
+        stored = self.store.load_token(service)
+        if not stored:
+            return None
+        return stored['token'], stored['expires_at']
+
+    def build_auth_url(self, redirect_url: str, silent: bool = False) -> str:
         def generate_random_string(length: int = 32) -> str:
             return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
 
@@ -63,8 +83,58 @@ class Meechum:
             'nonce': generate_random_string(),
             'auth_strategy': 'NetflixPartnerLogin'
         }
-        base_url = 'https://meechum.netflix.com/as/authorization.oauth2'
-        auth_url = f"{base_url}?{requests.compat.urlencode(params)}&scope=default+sourcedeliveriesui+studiogateway+jet_sap_sap_ui_backlot_ui-prod+studioplayback+e2eToken"
+        if silent:
+            # Never show a login page, redirect back with an error instead
+            params['prompt'] = 'none'
+        return f"{self.auth_url}?{requests.compat.urlencode(params)}&scope=default+sourcedeliveriesui+studiogateway+jet_sap_sap_ui_backlot_ui-prod+studioplayback+e2eToken"
+
+    @timed('meechum.authenticate')
+    def authenticate(self, redirect_url: str) -> None:
+        if self.authenticate_silently(redirect_url):
+            self.save_session()
+            return
+        self.authenticate_with_browser(redirect_url)
+
+    def authenticate_silently(self, redirect_url: str) -> bool:
+        """Re-run the authorization flow with the persisted SSO cookies and plain requests.
+
+        Succeeds when Meechum redirects straight back to `redirect_url` with an
+        authorization code, which the redirect endpoint exchanges for session cookies.
+        """
+        auth_url = self.build_auth_url(redirect_url, silent=True)
+        redirect_host = urlparse(redirect_url).netloc
+        try:
+            self.logger.info("Attempting silent re-authentication...")
+            response = self.session.get(auth_url, allow_redirects=True, timeout=self.SILENT_AUTH_TIMEOUT)
+        except requests.RequestException as e:
+            self.logger.warning(f"Silent re-authentication failed: {e}")
+            return False
+        for hop in list(response.history) + [response]:
+            parsed_url = urlparse(hop.url)
+            query = parse_qs(parsed_url.query)
+            if parsed_url.netloc != redirect_host:
+                continue
+            if 'error' in query or 'error_description' in query:
+                self.logger.info(f"Silent re-authentication not possible: {query.get('error', ['unknown'])[0]}")
+                return False
+            if 'code' in query:
+                if response.status_code >= 400:
+                    self.logger.warning(f"Silent re-authentication redirect failed with status {response.status_code}")
+                    return False
+                self.logger.info("Silent re-authentication successful.")
+                return True
+        self.logger.info("Silent re-authentication needs an interactive login")
+        return False
+
+    @timed('meechum.authenticate_with_browser')
+    def authenticate_with_browser(self, redirect_url: str) -> None:
+        # The browser stack takes seconds to import, only pay for it when a login is needed
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+        from seleniumwire import webdriver
+
+        auth_url = self.build_auth_url(redirect_url)
 
         options = webdriver.ChromeOptions()
         options.add_argument("--disable-infobars")
@@ -82,23 +152,7 @@ class Meechum:
             driver = webdriver.Chrome(options=options)
         try:
             self.logger.info("Attempting automatic authentication...")
-            success = False
-
-            # Wait for the user to complete the login
-            visited_urls = set()
-            while not success:
-                for request in driver.requests:
-                    if request.url in visited_urls:
-                        continue
-                    visited_urls.add(request.url)
-                    print(request.url)
-                    parsed_url = urlparse(request.url)
-                    if (parsed_url.netloc == urlparse(redirect_url).netloc and
-                        "error_description" not in request.url):
-                        self.logger.info("Login successful via redirect.")
-                        request.abort()
-                        success = True
-                        break
+            self.wait_for_redirect(driver, redirect_url)
 
             # After login, navigate to the redirect URL to capture cookies
             driver.get(redirect_url)
@@ -114,4 +168,32 @@ class Meechum:
             self.logger.error(f"Authentication failed: {e}")
             raise
         finally:
-            driver.quit()
\ No newline at end of file
+            driver.quit()
+
+    def wait_for_redirect(self, driver, redirect_url: str) -> None:
+        """Poll the captured browser requests until the login redirects to `redirect_url`.
+
+        The poll interval backs off while nothing new is captured and resets on new requests.
+        """
+        redirect_host = urlparse(redirect_url).netloc
+        deadline = time.monotonic() + self.LOGIN_TIMEOUT
+        interval = self.POLL_INTERVAL_MIN
+        # Wait for the user to complete the login
+        visited_urls = set()
+        while time.monotonic() < deadline:
+            new_requests = False
+            for request in driver.requests:
+                if request.url in visited_urls:
+                    continue
+                visited_urls.add(request.url)
+                new_requests = True
+                self.logger.debug(request.url)
+                parsed_url = urlparse(request.url)
+                if (parsed_url.netloc == redirect_host and
+                    "error_description" not in request.url):
+                    self.logger.info("Login successful via redirect.")
+                    request.abort()
+                    return
+            interval = self.POLL_INTERVAL_MIN if new_requests else min(interval * 2, self.POLL_INTERVAL_MAX)
+            time.sleep(interval)
+        raise TimeoutError(f"Login did not complete within {self.LOGIN_TIMEOUT}s")
@@ -0,0 +1,148 @@
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Iterable, Mapping, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from classes.log import Log
+from classes.metrics import Metrics
+from classes.rate_limiter import RateLimiter
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Return the seconds a Retry-After header asks to wait, given as seconds or as an HTTP date."""
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - parsedate_to_datetime(headers['date'])).total_seconds())
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default (connect, read) timeout to calls made without one."""
+
+    def __init__(self, timeout: Tuple[float, float], **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class RateLimitedHTTPAdapter(TimeoutHTTPAdapter):
+    """TimeoutHTTPAdapter that passes every call through the per-host limiter of its Transport.
+
+    Throttled and transient 5xx responses are retried here rather than inside urllib3,
+    so the limiter sees each of them.
+    """
+
+    def __init__(self, timeout: Tuple[float, float], transport: 'Transport', methods: Iterable[str], **kwargs):
+        self.transport = transport
+        self.methods = frozenset(methods)
+        super().__init__(timeout, **kwargs)
+
+    def send(self, request, **kwargs):
+        limiter = self.transport.limiter.for_url(request.url)
+        attempt = 0
+        while True:
+            with Metrics().timer('ratelimit.wait'):
+                limiter.acquire()
+            try:
+                response = super().send(request, **kwargs)
+            except Exception:
+                limiter.release(throttled=True)
+                raise
+            retry_after = parse_retry_after(response.headers)
+            limiter.release(throttled=self.transport.is_throttled(response.status_code), retry_after=retry_after)
+            if attempt >= self.transport.retries or not self.transport.should_retry(request.method, response.status_code, self.methods):
+                return response
+            delay = self.transport.retry_delay(attempt, retry_after)
+            attempt += 1
+            Metrics().count('http.retries')
+            self.transport.logger.info(f"{request.method} {request.url} returned {response.status_code}, retrying in {delay:.1f}s")
+            response.close()
+            time.sleep(delay)
+
+
+class CountingRetry(Retry):
+    """Retry that counts every retried call in the run metrics."""
+
+    def increment(self, *args, **kwargs) -> Retry:
+        Metrics().count('http.retries')
+        return super().increment(*args, **kwargs)
+
+
+class Transport:
+    """Connection pooling, timeouts, retries and rate limits shared by every Service session.
+
+    Sessions get keep-alive pools sized for the number of threads issuing calls, a
+    default connect/read timeout so no call can hang forever, and retries with
+    jittered exponential backoff on connection errors and transient 5xx responses.
+    Only idempotent methods are retried, plus POST endpoints registered with
+    `mount_idempotent` (read-only searches). Every call also goes through the
+    per-host `limiter`; 429 responses are retried for any method, since the server
+    did not process them, after their Retry-After.
+    """
+    RETRY_STATUSES = (500, 502, 503, 504)
+    THROTTLE_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 10, read_timeout: float = 60,
+                 retries: int = 3, backoff_factor: float = 0.5, backoff_jitter: float = 0.5,
+                 limiter: Optional[RateLimiter] = None):
+        self.logger = Log().get_logger(self.__class__.__name__)
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_jitter = backoff_jitter
+        self.limiter = limiter or RateLimiter()
+
+    def build_retry(self) -> Retry:
+        """Retry connection and read errors in urllib3; responses are retried by the adapter."""
+        return CountingRetry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=0,
+            other=0,
+            # Hand the last response back to raise_for_status instead of raising MaxRetryError
+            raise_on_status=False
+        )
+
+    def build_adapter(self, methods: Iterable[str] = Retry.DEFAULT_ALLOWED_METHODS) -> HTTPAdapter:
+        return RateLimitedHTTPAdapter(self.timeout, self, methods, pool_connections=self.pool_size, pool_maxsize=self.pool_size,
+                                      max_retries=self.build_retry())
+
+    def is_throttled(self, status: int) -> bool:
+        return status in self.THROTTLE_STATUSES
+
+    def should_retry(self, method: str, status: int, methods: Iterable[str] = Retry.DEFAULT_ALLOWED_METHODS) -> bool:
+        return status == 429 or (status in self.RETRY_STATUSES and method.upper() in methods)
+
+    def retry_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before retry number `attempt` + 1: the Retry-After, or jittered exponential backoff."""
+        if retry_after is not None:
+            return retry_after
+        return self.backoff_factor * 2 ** attempt + random.uniform(0, self.backoff_jitter)
+
+    def mount(self, session: requests.Session) -> requests.Session:
+        """Replace the default adapters of a session, including one restored from disk."""
+        adapter = self.build_adapter()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        self.logger.debug(f"Mounted transport: pool size {self.pool_size}, timeout {self.timeout}, {self.retries} retries")
+        return session
+
+    def mount_idempotent(self, session: requests.Session, url_prefix: str, methods: Optional[Iterable[str]] = None) -> None:
+        """Also retry POST calls under url_prefix, for endpoints that only read."""
+        methods = set(methods or Retry.DEFAULT_ALLOWED_METHODS) | {'POST'}
+        session.mount(url_prefix, self.build_adapter(methods))
@@ -1,17 +1,132 @@
 import sys
+import time
+from classes.startup import StartupProfiler
+# Installed before the other imports so that --profile-startup can time them
+startup_profiler = StartupProfiler(enabled=__name__ == '__main__' and '--profile-startup' in sys.argv)
 import json
+import argparse
+import os
+import queue
+import signal
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from netflix.meechum import Meechum
 from netflix.backlot import Backlot
+from netflix.material import Material
+from netflix.transport import Transport
 from classes.log import Log
-from classes.aspera import Aspera
+from classes.metrics import Metrics
+from classes.selection import AssetSelector
+from classes.artifacts import ArtifactWriter
+from classes.aspera import Aspera, AsperaPool
+from classes.cache import ResponseCache
+from classes.content_store import ContentStore
+from classes.ledger import Ledger
+from classes.rate_limiter import RateLimiter
+from classes.verify import Verifier
 import platform
 
+@dataclass
+class Settings:
+    """Tunables of a Tiramigiu run, see the command line options of the same name for each."""
+    # Concurrency, batching and query shape of the metadata calls
+    workers: int = 1
+    batch_size: int = 0
+    query_profile: str = 'lean'
+    pipeline_depth: int = 2
+    search_page_size: int = Backlot.SEARCH_PAGE_SIZE
+    request_statuses: Optional[List[str]] = None
+    selection_config: str = 'config/selection.json'
+    force: bool = False
+    # Endpoints, HTTP client and per-host pacing
+    backlot_url: Optional[str] = None
+    gateway_url: Optional[str] = None
+    auth_url: Optional[str] = None
+    profile_dir: Optional[str] = None
+    connect_timeout: float = 10
+    read_timeout: float = 60
+    retries: int = 3
+    http_client: str = 'requests'
+    max_concurrency: int = 100
+    http2: bool = True
+    host_rate: Optional[float] = 50
+    host_concurrency: int = 16
+    max_host_concurrency: int = 128
+    # Aspera transfers, verification and the download store
+    parallel_transfers: int = 1
+    target_rate: Optional[int] = None
+    ascp_path: Optional[str] = None
+    progress_interval: float = 30
+    stall_timeout: float = 300
+    manifest_max_age: float = 600
+    verify: bool = True
+    verify_workers: Optional[int] = None
+    verify_retries: int = 2
+    download_folder: Optional[str] = None
+    store: bool = True
+    store_dir: Optional[str] = None
+    link_mode: str = 'auto'
+    prune_store: bool = True
+
+    # Settings carried by a command line option of another name
+    OPTIONS = {'download_folder': 'download_dir'}
+    # Settings turned off by a --no-<option> flag
+    NEGATED = ('http2', 'verify', 'store', 'prune_store')
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> 'Settings':
+        values = {}
+        for field in fields(cls):
+            if field.name in cls.NEGATED:
+                values[field.name] = not getattr(args, f"no_{field.name}")
+            else:
+                values[field.name] = getattr(args, cls.OPTIONS.get(field.name, field.name))
+        return cls(**values)
+
+
 class Tiramigiu:
-    def __init__(self):
+    def __init__(self, settings: Optional[Settings] = None, ledger: Optional[Ledger] = None,
+                 cache: Optional[ResponseCache] = None, artifacts: Optional[ArtifactWriter] = None):
         self.logger = Log().get_logger(self.__class__.__name__)
-        self.meechum = Meechum()
-        self.backlot = Backlot(self.meechum)
+        self.settings = settings = settings or Settings()
+        self.workers = max(1, settings.workers)
+        # Calls to each Backlot and gateway host are paced and their concurrency adapted to throttling
+        limiter = RateLimiter(rate=settings.host_rate or None, initial_limit=settings.host_concurrency,
+                              max_limit=settings.max_host_concurrency)
+        # Keep-alive connections for every thread issuing metadata calls: workers, their
+        # discovery threads, transfer stage consumers and the token refresh timer
+        transport = Transport(pool_size=max(10, 2 * self.workers + settings.parallel_transfers + 1),
+                              connect_timeout=settings.connect_timeout, read_timeout=settings.read_timeout,
+                              retries=settings.retries, limiter=limiter)
+        self.meechum = Meechum(profile_dir=settings.profile_dir, transport=transport, auth_url=settings.auth_url)
+        self.backlot = Backlot(self.meechum, base_url=settings.backlot_url, gateway_url=settings.gateway_url)
+        self.backlot.cache = cache
+        # Metadata calls of every worker multiplexed on one event loop instead of a blocking socket each
+        self.async_backlot = None
+        if settings.http_client == 'httpx':
+            # Only the httpx client needs the asyncio and httpx stack
+            from netflix.async_backlot import AsyncBacklot
+            self.async_backlot = AsyncBacklot(self.backlot, max_concurrency=settings.max_concurrency, http2=settings.http2)
+        self.artifacts = artifacts or ArtifactWriter(policy='off')
+        self.selector = AssetSelector.from_file(settings.selection_config, field_getter=Material.field_getter)
+        # Source requests per batched downloadMaterials subscription, 0 disables batching
+        self.batch_size = max(0, settings.batch_size)
+        # Shared by every title, bounds the concurrent ascp sessions and splits the rate budget
+        self.aspera_pool = AsperaPool(max_parallel=settings.parallel_transfers, target_rate=settings.target_rate,
+                                      verify_retries=settings.verify_retries)
+        # Checks every transferred file before it is recorded, hashing on a process pool started on first use
+        self.verifier = Verifier(workers=settings.verify_workers) if settings.verify else None
+        # Completed files and titles from earlier runs, `force` re-processes completed titles
+        self.ledger = ledger
+        # Titles prepared ahead of the transfer stage, 0 runs each title start to finish
+        self.pipeline_depth = max(0, settings.pipeline_depth)
+        # Content-addressed download store, created on first use in the download folder by default,
+        # and pruned of stored files no title links to any more when opened
+        self.store: Optional[ContentStore] = None
+        self.store_lock = threading.Lock()
 
     # Slack notification function
     def send_slack_notification(self, message):
@@ -23,124 +138,483 @@ class Tiramigiu:
         if response.status_code != 200:
             self.logger.error(f"Request to Slack returned an error {response.status_code}, the response is:\n{response.text}")
 
-    def process_movie_ids(self, movie_ids):
-        for movie_id in movie_ids:
-            self.logger.info(f"Processing movie ID: {movie_id}")
-            search_response = self.backlot.search_requests(movie_id=movie_id)
-
-            if 'sourceRequest' in search_response:
-                self.logger.info("sourceRequest found in search_response")
-                # Extract all requestIds
-                request_ids = [request['requestId'] for request in search_response['sourceRequest']]
-                self.logger.debug(f"Extracted request IDs: {request_ids}")
-                if len(request_ids) == 0:
-                    self.logger.error("No request IDs found in search_response")
-                    self.send_slack_notification(f"No sourceRequest found for movie ID: {movie_id}")
-                    continue
+    def get_download_folder(self) -> str:
+        """Get the configured download folder, or the default one of the operating system."""
+        if self.settings.download_folder:
+            return self.settings.download_folder
+        system = platform.system()
+        if system == 'Darwin':
+            return f"/Volumes/mne-qc/downloads/Tiramigiu/"
+        elif system == 'Windows':
+            return f"C:\\Volumes\\nflx-post-services\\mne-qc\\downloads\\Tiramigiu\\"
+        return "./dl/"
+
+    def get_store(self) -> Optional[ContentStore]:
+        """Get the download store shared by every title, or None when disabled."""
+        if not self.settings.store:
+            return None
+        with self.store_lock:
+            if self.store is None:
+                self.store = ContentStore(self.settings.store_dir or os.path.join(self.get_download_folder(), '.store'), link_mode=self.settings.link_mode)
+                if self.settings.prune_store:
+                    self.store.prune()
+            return self.store
+
+    def map(self, func: Callable[[Any], Any], items: List[Any]) -> List[Any]:
+        """Apply func to every item, on the worker pool when more than one worker is configured."""
+        if self.workers == 1 or len(items) <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tiramigiu') as executor:
+            return list(executor.map(func, items))
+
+    def process_movie_ids(self, movie_ids: List[str]) -> List[Dict[str, Any]]:
+        """Process every movie ID, running up to `workers` titles at once, and log a summary."""
+        started = time.monotonic()
+        results = []
+        if self.workers > 1:
+            self.logger.info(f"Processing {len(movie_ids)} movie IDs with {self.workers} workers")
+        if self.batch_size > 0:
+            results.extend(self.process_movie_ids_batched(movie_ids))
+        else:
+            results.extend(self.run_titles(movie_ids))
+        self.log_summary(results, time.monotonic() - started)
+        return results
+
+    def process_movie_ids_batched(self, movie_ids: List[str]) -> List[Dict[str, Any]]:
+        """Resolve every title's source requests first, then discover assets in batched subscriptions."""
+        resolved = self.map(self.run_resolve_request_ids, movie_ids)
+        results = [result for result, _ in resolved if not result['success']]
+        request_ids_by_movie = {result['movie_id']: request_ids for result, request_ids in resolved if result['success']}
+        if self.async_backlot:
+            assets_by_movie = self.async_backlot.run(self.async_backlot.search_download_assets_batch(
+                request_ids_by_movie, chunk_size=self.batch_size, profile=self.settings.query_profile))
+        else:
+            assets_by_movie = self.backlot.search_download_assets_batch(request_ids_by_movie, chunk_size=self.batch_size, profile=self.settings.query_profile)
+        # Titles missing from the batch results fall back to a per-title search
+        results.extend(self.run_titles(list(request_ids_by_movie), assets_by_movie))
+        order = {movie_id: index for index, movie_id in enumerate(movie_ids)}
+        return sorted(results, key=lambda result: order[result['movie_id']])
+
+    def run_titles(self, movie_ids: List[str], assets_by_movie: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """Run the per-title pipeline for every movie ID, pipelined when a pipeline depth is set."""
+        assets_by_movie = assets_by_movie or {}
+        if self.pipeline_depth > 0:
+            return self.run_titles_pipelined(movie_ids, assets_by_movie)
+        return self.map(lambda movie_id: self.run_movie_id(movie_id, assets_by_movie.get(movie_id)), movie_ids)
+
+    def run_titles_pipelined(self, movie_ids: List[str], assets_by_movie: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Overlap metadata resolution with transfers through a bounded queue.
+
+        The worker pool prepares titles (search, selection, manifests) at most
+        `pipeline_depth` titles ahead of the transfer stage, which drains the queue
+        with one thread per ascp session slot.
+        """
+        jobs: 'queue.Queue[Optional[Tuple[Dict[str, Any], Dict[str, Any]]]]' = queue.Queue(maxsize=self.pipeline_depth)
+        results: Dict[str, Dict[str, Any]] = {}
+
+        def finish(result: Dict[str, Any]) -> None:
+            self.artifacts.finish_title(result['movie_id'], result['success'])
+            results[result['movie_id']] = result
+
+        def prepare(movie_id: str) -> None:
+            result, job = self.run_stage(movie_id, self.prepare_movie_id, assets_by_movie.get(movie_id))
+            if job and not job.get('skipped'):
+                # Blocks while the transfer stage is `pipeline_depth` titles behind
+                jobs.put((result, job))
             else:
-                self.logger.error("sourceRequest not found in search_response")
-                self.send_slack_notification(f"Failed to find sourceRequest for movie ID: {movie_id}")
-                continue
+                result['skipped'] = bool(job)
+                finish(result)
 
-            assets = self.backlot.search_download_assets(request_ids)
-            with open(f'assets_{movie_id}.json', 'w') as f:
-                json.dump(assets, f, indent=4)
-            assets = self.backlot.extract_asset_info(assets)
-            with open(f'assets_processed_{movie_id}.json', 'w') as f:
-                json.dump(assets, f, indent=4)
-
-            usable_assets = []
-            available_assets = []
-            seen_files = set()
-            for asset in assets:
-                if asset['status'] == 'ACTIVE':
-                    if 'materialFilter' in asset and 'fileName' in asset['materialFilter']:
-                        fileName = asset['materialFilter']['fileName']
-                        if fileName not in seen_files:
-                            available_assets.append(asset)
-                            seen_files.add(fileName)
-            with open(f'assets_available_{movie_id}.json', 'w') as f:
-                json.dump(available_assets, f, indent=4)
-            categorized_assets = {
-                'FINAL_PROXY': [],
-                'LOCKED_PROXY': [],
-                'PROXY_WITH_SUBTITLES': [],
-                'SERVICING_PROXY': [],
-                'DIALOGUE_LIST': [],
-                'PIVOT_LANGUAGE_DIALOGUE_LIST': [],
-                'PRINT_MASTER_5_1_CH': [],
-                'PRINT_MASTER_2_0_CH': [],
-                'DIALOG_MUSIC_AND_EFFECTS_5_1_CH': [],
-                'DIALOG_MUSIC_AND_EFFECTS_2_0_CH': []
-            }
-
-            for asset in available_assets:
-                material_type = asset['materialType']
-                if 'FINAL_PROXY' in material_type:
-                    categorized_assets['FINAL_PROXY'].append(asset)
-                elif 'PROXY_WITH_SUBTITLES' in material_type:
-                    categorized_assets['PROXY_WITH_SUBTITLES'].append(asset)
-                elif 'LOCKED_PROXY' in material_type:
-                    categorized_assets['LOCKED_PROXY'].append(asset)
-                elif 'SERVICING_PROXY' in material_type:
-                    categorized_assets['SERVICING_PROXY'].append(asset)
-                elif 'DIALOGUE_LIST' in material_type:
-                    categorized_assets['DIALOGUE_LIST'].append(asset)
-                elif 'PIVOT_LANGUAGE_DIALOGUE_LIST' in material_type:
-                    categorized_assets['PIVOT_LANGUAGE_DIALOGUE_LIST'].append(asset)
-                elif 'PRINT_MASTER' in material_type:
-                    if '5_1_CH' in material_type:
-                        categorized_assets['PRINT_MASTER_5_1_CH'].append(asset)
-                    elif '2_0_CH' in material_type:
-                        categorized_assets['PRINT_MASTER_2_0_CH'].append(asset)
-                elif 'DIALOG_MUSIC_AND_EFFECTS' in material_type:
-                    if '5_1_CH' in material_type:
-                        categorized_assets['DIALOG_MUSIC_AND_EFFECTS_5_1_CH'].append(asset)
-                    elif '2_0_CH' in material_type:
-                        categorized_assets['DIALOG_MUSIC_AND_EFFECTS_2_0_CH'].append(asset)
-            for category, assets in categorized_assets.items():
-                self.logger.debug(f"Category: {category}, Count: {len(assets)}")
-            # Select the best available assets
-            usable_assets.extend(categorized_assets['FINAL_PROXY'] or categorized_assets['PROXY_WITH_SUBTITLES'] or categorized_assets['LOCKED_PROXY'] or categorized_assets['SERVICING_PROXY'])
-            usable_assets.extend(categorized_assets['DIALOGUE_LIST'])
-            usable_assets.extend(categorized_assets['PIVOT_LANGUAGE_DIALOGUE_LIST'])
-            usable_assets.extend(categorized_assets['PRINT_MASTER_5_1_CH'] or categorized_assets['PRINT_MASTER_2_0_CH'])
-            usable_assets.extend(categorized_assets['DIALOG_MUSIC_AND_EFFECTS_5_1_CH'] or categorized_assets['DIALOG_MUSIC_AND_EFFECTS_2_0_CH'])
-            # Remove the 'status' field from the assets
-            for asset in usable_assets:
-                if 'status' in asset:
-                    del asset['status']
-                if 'fileInfo' in asset:
-                    del asset['fileInfo']
-                if 'fileName' in asset['materialFilter']:
-                    del asset['materialFilter']['fileName']
-            with open(f'categorized_assets_{movie_id}.json', 'w') as f:
-                json.dump(usable_assets, f, indent=4)
-            aspera_manifests = self.backlot.download_materials_manifests(usable_assets)
-            if "sr_setupDownloadSessionsForMaterials" in aspera_manifests:
-                aspera_manifests = aspera_manifests["sr_setupDownloadSessionsForMaterials"]
-                with open(f'aspera_manifests_{movie_id}.json', 'w') as f:
-                    json.dump(aspera_manifests, f, indent=4)
-                for session in aspera_manifests["session"]:
-                    for batch in session["asperaBatches"]:
-                        system = platform.system()
-                        if system == 'Darwin':
-                            download_folder = f"/Volumes/mne-qc/downloads/Tiramigiu/"
-                        elif system == 'Windows':
-                            download_folder = f"C:\\Volumes\\nflx-post-services\\mne-qc\\downloads\\Tiramigiu\\"
-                        aspera = Aspera(batch, download_folder=download_folder, movie_id=movie_id)
-                        aspera.start_batch_download()
-                self.send_slack_notification(f"Successfully downloaded materials for movie ID: {movie_id}")
+        def transfer() -> None:
+            while True:
+                item = jobs.get()
+                if item is None:
+                    return
+                prepared, job = item
+                result, _ = self.run_stage(prepared['movie_id'], self.transfer_movie_id, job)
+                result['duration'] += prepared['duration']
+                finish(result)
+
+        consumers = [threading.Thread(target=transfer, name=f'transfer-{index}', daemon=True)
+                     for index in range(self.aspera_pool.max_parallel)]
+        for consumer in consumers:
+            consumer.start()
+        try:
+            self.map(prepare, movie_ids)
+        finally:
+            for _ in consumers:
+                jobs.put(None)
+            for consumer in consumers:
+                consumer.join()
+        return [results[movie_id] for movie_id in movie_ids if movie_id in results]
+
+    def run_stage(self, movie_id: str, stage: Callable[..., Any], *args: Any) -> Tuple[Dict[str, Any], Any]:
+        """Run one stage for a movie ID and return its outcome and value, never raising."""
+        started = time.monotonic()
+        result = {'movie_id': movie_id, 'success': False, 'duration': 0.0, 'error': None}
+        value = None
+        try:
+            value = stage(movie_id, *args)
+            result['success'] = bool(value)
+        except Exception as e:
+            self.logger.error(f"Failed to process movie ID {movie_id}: {e}")
+            self.send_slack_notification(f"Failed to process movie ID: {movie_id} ({e})")
+            result['error'] = str(e)
+        result['duration'] = time.monotonic() - started
+        Metrics().observe(f"tiramigiu.{stage.__name__}", result['duration'])
+        return result, value
+
+    def run_resolve_request_ids(self, movie_id: str) -> Tuple[Dict[str, Any], List[str]]:
+        """Resolve the source request IDs of one movie ID, never raising."""
+        result, request_ids = self.run_stage(movie_id, self.resolve_request_ids)
+        return result, request_ids or []
+
+    def run_movie_id(self, movie_id: str, assets: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Process a single movie ID and return its outcome, never raising."""
+        result, job = self.run_stage(movie_id, self.prepare_movie_id, assets)
+        if job and not job.get('skipped'):
+            prepared = result
+            result = self.run_stage(movie_id, self.transfer_movie_id, job)[0]
+            result['duration'] += prepared['duration']
+        else:
+            result['skipped'] = bool(job)
+        self.artifacts.finish_title(movie_id, result['success'])
+        return result
+
+    def close(self) -> None:
+        """Flush pending debug artifacts and close the async client and the verifier."""
+        self.artifacts.close()
+        if self.async_backlot:
+            self.async_backlot.close()
+        if self.verifier:
+            self.verifier.close()
+
+    def log_summary(self, results: List[Dict[str, Any]], elapsed: float) -> None:
+        """Log success, failure and duration for every processed title, and count them in the run metrics."""
+        metrics = Metrics()
+        for result in results:
+            metrics.count('titles.skipped' if result.get('skipped') else 'titles.succeeded' if result['success'] else 'titles.failed')
+        succeeded = sum(1 for result in results if result['success'])
+        self.logger.info(f"Processed {len(results)} movie IDs in {elapsed:.1f}s: {succeeded} succeeded, {len(results) - succeeded} failed")
+        for result in results:
+            status = 'SKIPPED' if result.get('skipped') else 'OK' if result['success'] else 'FAILED'
+            message = f"{result['movie_id']}: {status} in {result['duration']:.1f}s"
+            if result['error']:
+                message += f" ({result['error']})"
+            if result['success']:
+                self.logger.info(message)
             else:
-                self.send_slack_notification(f"Failed to download materials for movie ID: {movie_id}")
+                self.logger.error(message)
+
+    def resolve_request_ids(self, movie_id: str) -> List[str]:
+        """Search the source requests of a movie ID and return their request IDs."""
+        request_ids = [request_id for page in self.iter_request_ids(movie_id) for request_id in page]
+        self.logger.debug(f"Extracted request IDs: {request_ids}")
+        if len(request_ids) == 0:
+            self.logger.error(f"No request IDs found for movie ID: {movie_id}")
+            self.send_slack_notification(f"No sourceRequest found for movie ID: {movie_id}")
+        return request_ids
+
+    def iter_request_ids(self, movie_id: str) -> Iterator[List[str]]:
+        """Yield the request IDs of a movie ID one search page at a time."""
+        if self.async_backlot:
+            return iter(self.async_backlot.run(self.async_backlot.list_request_id_pages(
+                movie_id, page_size=self.settings.search_page_size, request_statuses=self.settings.request_statuses)))
+        return self.backlot.iter_request_ids(movie_id, page_size=self.settings.search_page_size, request_statuses=self.settings.request_statuses)
+
+    def discover_assets(self, movie_id: str) -> Optional[Dict[str, Any]]:
+        """Search the download materials of a movie ID page by page.
+
+        Each page of request IDs is searched while the next page of source requests
+        loads, and the responses are merged into one download materials response.
+        With the async client every page's search is in flight at once.
+        """
+        if self.async_backlot:
+            responses = self.async_backlot.run(self.async_backlot.search_download_assets_paged(
+                movie_id, page_size=self.settings.search_page_size, request_statuses=self.settings.request_statuses, profile=self.settings.query_profile))
+        else:
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix='discovery') as executor:
+                futures = [executor.submit(self.backlot.search_download_assets, request_ids, profile=self.settings.query_profile)
+                           for request_ids in self.iter_request_ids(movie_id)]
+                responses = [future.result() for future in futures]
+        if len(responses) == 0:
+            self.logger.error(f"No request IDs found for movie ID: {movie_id}")
+            self.send_slack_notification(f"No sourceRequest found for movie ID: {movie_id}")
+            return None
+        if len(responses) == 1:
+            return responses[0]
+        self.logger.info(f"Merging download materials of {len(responses)} source request pages for movie ID: {movie_id}")
+        return {'sr_downloadMaterials': [item for response in responses for item in (response or {}).get('sr_downloadMaterials') or []]}
+
+    def process_movie_id(self, movie_id: str, assets: Optional[Dict[str, Any]] = None) -> bool:
+        """Run the full search, selection and download pipeline for one movie ID.
+
+        `assets` is a prefetched download materials response, as returned by batched discovery.
+        """
+        job = self.prepare_movie_id(movie_id, assets)
+        if not job:
+            return False
+        return bool(job.get('skipped')) or self.transfer_movie_id(movie_id, job)
+
+    def prepare_movie_id(self, movie_id: str, assets: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Resolve, select and set up the downloads of one movie ID, returning its transfer job."""
+        self.logger.info(f"Processing movie ID: {movie_id}")
+        if assets is None:
+            assets = self.discover_assets(movie_id)
+            if assets is None:
+                return None
+        self.artifacts.write(movie_id, 'assets', assets)
+        if self.artifacts.enabled:
+            assets = self.backlot.extract_asset_info(assets)
+            self.artifacts.write(movie_id, 'assets_processed', lambda assets=assets: [asset.to_dict() for asset in assets])
+        else:
+            # Nothing else holds on to the records, so select straight from the response
+            assets = self.backlot.iter_asset_info(assets)
+
+        with Metrics().timer('selection.select'):
+            selection = self.selector.select(assets)
+        available_assets = selection.available
+        metrics = Metrics()
+        metrics.count('materials.available', len(available_assets))
+        metrics.count('materials.selected', len(selection.selected))
+        self.artifacts.write(movie_id, 'assets_available', lambda: [asset.to_dict() for asset in available_assets])
+        for category, assets in selection.categories.items():
+            self.logger.debug(f"Category: {category}, Count: {len(assets)}")
+        # Select the best available assets
+        usable_assets = [asset.to_request() for asset in selection.selected]
+        self.artifacts.write(movie_id, 'categorized_assets', usable_assets)
+        selection_key = Ledger.selection_key(usable_assets)
+        if self.ledger and not self.settings.force and self.ledger.is_title_complete(movie_id, selection_key):
+            # Discovery still runs so that materials added since the title completed are downloaded
+            self.logger.info(f"Skipping movie ID {movie_id}, its {len(usable_assets)} selected materials are downloaded according to the ledger")
+            return {'skipped': True}
+        aspera_manifests = self.setup_downloads(movie_id, usable_assets)
+        if aspera_manifests is None:
+            return None
+        return {'requests': usable_assets, 'selection': selection_key, 'manifests': aspera_manifests, 'prepared_at': time.monotonic()}
+
+    def setup_downloads(self, movie_id: str, usable_assets: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Request Aspera download sessions, and their transport tokens, for the selected materials."""
+        if self.async_backlot:
+            aspera_manifests = self.async_backlot.run(self.async_backlot.download_materials_manifests(usable_assets, profile=self.settings.query_profile))
+        else:
+            aspera_manifests = self.backlot.download_materials_manifests(usable_assets, profile=self.settings.query_profile)
+        if "sr_setupDownloadSessionsForMaterials" not in aspera_manifests:
+            self.send_slack_notification(f"Failed to download materials for movie ID: {movie_id}")
+            return None
+        aspera_manifests = aspera_manifests["sr_setupDownloadSessionsForMaterials"]
+        self.artifacts.write(movie_id, 'aspera_manifests', aspera_manifests)
+        return aspera_manifests
+
+    def transfer_movie_id(self, movie_id: str, job: Dict[str, Any]) -> bool:
+        """Download the materials of a prepared job, renewing its sessions if they waited too long."""
+        aspera_manifests = job['manifests']
+        age = time.monotonic() - job['prepared_at']
+        if age > self.settings.manifest_max_age:
+            self.logger.info(f"Aspera sessions for movie ID {movie_id} are {age:.0f}s old, requesting fresh transport tokens")
+            aspera_manifests = self.setup_downloads(movie_id, job['requests'])
+            if aspera_manifests is None:
+                return False
+        download_folder = self.get_download_folder()
+        store = self.get_store()
+        transfers = []
+        for session in aspera_manifests["session"]:
+            for batch in session["asperaBatches"]:
+                transfers.append(Aspera(batch, download_folder=download_folder, movie_id=movie_id, ascp_path=self.settings.ascp_path,
+                                        progress_interval=self.settings.progress_interval, stall_timeout=self.settings.stall_timeout,
+                                        ledger=self.ledger, store=store, verifier=self.verifier))
+        if not all(self.aspera_pool.run(transfers)):
+            self.send_slack_notification(f"Failed to download some materials for movie ID: {movie_id}")
+            return False
+        if self.ledger:
+            self.ledger.record_title(movie_id, job['selection'])
+        self.send_slack_notification(f"Successfully downloaded materials for movie ID: {movie_id}")
+        return True
+
+def positive_int(value: str) -> int:
+    """argparse type of options that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='tiramigiu.py',
+        usage='python tiramigiu.py [options] <movie_id1> <movie_id2> ...\n       python tiramigiu.py --daemon [options] [<movie_id1> ...]'
+    )
+    parser.add_argument('movie_ids', nargs='*', help='Movie IDs to download materials for')
+    parser.add_argument('--workers', type=int, default=1, help='Number of titles to process concurrently (default: 1)')
+    parser.add_argument('--batch-size', type=int, default=0,
+                        help='Discover assets for all titles in batches of N source requests per subscription (default: off)')
+    parser.add_argument('--query-profile', choices=sorted(Backlot.QUERY_PROFILES), default='lean',
+                        help='GraphQL field profile for materials queries; "full" keeps every field in the dumps (default: lean)')
+    parser.add_argument('--parallel-transfers', type=int, default=1,
+                        help='Maximum number of concurrent ascp sessions across all titles (default: 1)')
+    parser.add_argument('--target-rate', type=int, default=None,
+                        help='Total transfer rate budget in Mbps, split across the ascp sessions (default: unlimited)')
+    parser.add_argument('--ascp-path', default=None, help='Path to the ascp executable (default: Aspera Connect location)')
+    parser.add_argument('--progress-interval', type=float, default=30,
+                        help='Seconds between transfer progress log lines and stall checks, 0 to disable them (default: 30)')
+    parser.add_argument('--stall-timeout', type=float, default=300,
+                        help='Warn when a transfer makes no progress for this many seconds (default: 300)')
+    parser.add_argument('--ledger', default='ledger.db',
+                        help='SQLite ledger of completed downloads, used to skip finished files and titles (default: ledger.db)')
+    parser.add_argument('--no-ledger', action='store_true', help='Do not read or write the transfer ledger')
+    parser.add_argument('--ledger-checksum', action='store_true', help='Store a SHA-256 of every completed file in the ledger, against which later downloads of the file are verified')
+    parser.add_argument('--force', action='store_true', help='Set up the downloads of titles the ledger records as complete')
+    parser.add_argument('--no-verify', action='store_true',
+                        help='Do not check transferred files before recording them. Manifests carry no sizes or checksums, so files '
+                             'are checked against the sizes ascp reports, to its 0.1MB resolution, and verified only against '
+                             'the SHA-256 of an earlier download recorded with --ledger-checksum')
+    parser.add_argument('--verify-workers', type=int, default=None,
+                        help='Processes hashing transferred files in parallel (default: number of CPUs)')
+    parser.add_argument('--verify-retries', type=int, default=2,
+                        help='Times a batch transfers again the files failing verification (default: 2)')
+    parser.add_argument('--cache-dir', default='cache', help='Directory of the Backlot metadata response cache (default: cache)')
+    parser.add_argument('--cache-ttl', type=float, default=3600, help='Seconds a cached metadata response stays valid (default: 3600)')
+    parser.add_argument('--cache-max-entries', type=int, default=500, help='Maximum number of cached responses (default: 500)')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the metadata response cache')
+    parser.add_argument('--refresh', action='store_true', help='Ignore cached responses but store the fresh ones')
+    parser.add_argument('--selection-config', default='config/selection.json',
+                        help='JSON rules deciding which materials are downloaded (default: config/selection.json)')
+    parser.add_argument('--artifacts', choices=ArtifactWriter.POLICIES, default='errors',
+                        help='Which titles get debug JSON artifacts written (default: errors). With errors, titles in flight keep '
+                             'their responses in memory until they finish, use off for the lowest memory use')
+    parser.add_argument('--artifact-format', choices=ArtifactWriter.FORMATS, default='compact',
+                        help='Debug artifact encoding (default: compact)')
+    parser.add_argument('--artifact-dir', default='artifacts',
+                        help='Directory receiving one sub-directory of debug artifacts per run (default: artifacts)')
+    parser.add_argument('--pipeline-depth', type=int, default=2,
+                        help='Titles whose metadata is resolved ahead of the running transfers, 0 disables pipelining (default: 2)')
+    parser.add_argument('--manifest-max-age', type=float, default=600,
+                        help='Seconds after which queued Aspera sessions are renewed before transferring (default: 600)')
+    parser.add_argument('--search-page-size', type=positive_int, default=Backlot.SEARCH_PAGE_SIZE,
+                        help=f'Source requests fetched per search page (default: {Backlot.SEARCH_PAGE_SIZE})')
+    parser.add_argument('--request-status', action='append', dest='request_statuses', metavar='STATUS',
+                        help='Only search source requests with this requestStatus, may be repeated (default: all)')
+    parser.add_argument('--connect-timeout', type=float, default=10,
+                        help='Seconds to wait for a Backlot or Meechum connection (default: 10)')
+    parser.add_argument('--read-timeout', type=float, default=60,
+                        help='Seconds to wait for Backlot or Meechum response data, subscriptions excepted (default: 60)')
+    parser.add_argument('--retries', type=int, default=3,
+                        help='Retries of idempotent calls on connection errors and 5xx responses (default: 3)')
+    parser.add_argument('--http-client', choices=('requests', 'httpx'), default='requests',
+                        help='Metadata client; httpx multiplexes the calls of every worker on one event loop, needs the httpx package (default: requests)')
+    parser.add_argument('--max-concurrency', type=int, default=100,
+                        help='Maximum metadata calls in flight with the httpx client (default: 100)')
+    parser.add_argument('--no-http2', action='store_true', help='Use HTTP/1.1 with the httpx client even when the h2 package is installed')
+    parser.add_argument('--host-rate', type=float, default=50,
+                        help='Maximum calls per second to each Backlot or gateway host, 0 for unlimited (default: 50)')
+    parser.add_argument('--host-concurrency', type=int, default=16,
+                        help='Initial limit of calls in flight per host, raised while calls succeed and halved on 429 or 5xx (default: 16)')
+    parser.add_argument('--max-host-concurrency', type=int, default=128,
+                        help='Upper bound of the adaptive per-host concurrency limit (default: 128)')
+    parser.add_argument('--download-dir', default=None,
+                        help='Directory receiving the downloaded materials (default: depends on the operating system)')
+    parser.add_argument('--store-dir', default=None,
+                        help='Content-addressed store every material is downloaded into once and linked from (default: <download dir>/.store)')
+    parser.add_argument('--no-store', action='store_true',
+                        help='Download every title\'s materials straight into its own paths, even when shared with other titles. '
+                             'With the store, a material takes disk space until no title path links to it any more and the store is pruned')
+    parser.add_argument('--no-prune-store', action='store_true',
+                        help='Keep stored materials no title links to any more, and stale partial transfers, instead of '
+                             'removing them when the store is opened')
+    parser.add_argument('--link-mode', choices=ContentStore.LINK_MODES, default='auto',
+                        help='How title paths are created from the store; auto tries hardlink, reflink, then copy (default: auto). '
+                             'Hardlinked paths share one file, so edit none in place; reflinked and copied materials are never pruned')
+    parser.add_argument('--profile-dir', default=None,
+                        help='Directory of the browser profile and the persisted session (default: profile)')
+    parser.add_argument('--backlot-url', default=None,
+                        help=f'Base URL of Backlot, e.g. a local stand-in server (default: {Backlot.BASE_URL})')
+    parser.add_argument('--gateway-url', default=None,
+                        help=f'URL of the studio gateway subscriptions endpoint (default: {Backlot.GATEWAY_URL})')
+    parser.add_argument('--auth-url', default=None,
+                        help=f'Meechum authorization endpoint of the login and silent re-authentication (default: {Meechum.AUTH_URL})')
+    parser.add_argument('--report', default=None, metavar='PATH',
+                        help='Write stage timings, counters and per-title results of the run as JSON')
+    parser.add_argument('--prometheus', default=None, metavar='PATH',
+                        help='Write stage timings and counters in the Prometheus text format, e.g. for a textfile collector')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Log the import time of every module and the duration of each initialization step')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Keep running and process titles queued through --spool-dir or --listen, plus any given movie IDs')
+    parser.add_argument('--job-db', default='jobs.db', help='SQLite job queue of daemon mode (default: jobs.db)')
+    parser.add_argument('--spool-dir', default=None,
+                        help='Directory watched for files of movie IDs, one per line with an optional priority')
+    parser.add_argument('--listen', default=None, metavar='HOST:PORT',
+                        help='Accept jobs over a local HTTP API, e.g. 127.0.0.1:8765')
+    parser.add_argument('--poll-interval', type=float, default=2,
+                        help='Seconds between spool directory scans while idle (default: 2)')
+    args = parser.parse_args(argv)
+    if not args.movie_ids and not args.daemon:
+        parser.error('at least one movie ID is required')
+    if args.daemon and not (args.spool_dir or args.listen):
+        parser.error('--daemon requires --spool-dir or --listen')
+    if args.listen:
+        host, _, port = args.listen.rpartition(':')
+        if not port.isdigit():
+            parser.error(f'invalid --listen address: {args.listen}')
+        args.listen = (host or '127.0.0.1', int(port))
+    return args
+
+def write_metrics(args: argparse.Namespace, run_id: str, **extra: Any) -> None:
+    """Export the run metrics to the --report and --prometheus paths, when given."""
+    metrics = Metrics()
+    try:
+        if args.report:
+            metrics.write_report(args.report, run_id=run_id, **extra)
+        if args.prometheus:
+            metrics.write_prometheus(args.prometheus)
+    except OSError as e:
+        Log().get_logger('Metrics').error(f"Failed to write run metrics: {e}")
 
 if __name__ == "__main__":
     # Entry point
-    if len(sys.argv) > 1:
-        movie_ids = sys.argv[1:]
-    else:
-        print("Usage: python tiramigiu.py <movie_id1> <movie_id2> ...")
+    if len(sys.argv) <= 1:
+        print("Usage: python tiramigiu.py [options] <movie_id1> <movie_id2> ...")
         sys.exit(1)
+    with startup_profiler.phase('parse arguments'):
+        args = parse_args(sys.argv[1:])
+    # Start the run clock of the metrics report
+    Metrics()
 
-    tiramigiu = Tiramigiu()
-    tiramigiu.process_movie_ids(movie_ids)
\ No newline at end of file
+    with startup_profiler.phase('open ledger, cache and artifacts'):
+        ledger = None if args.no_ledger else Ledger(args.ledger, checksum=args.ledger_checksum)
+        cache = None if args.no_cache else ResponseCache(args.cache_dir, ttl=args.cache_ttl, max_entries=args.cache_max_entries, refresh=args.refresh)
+        artifacts = ArtifactWriter(policy=args.artifacts, format=args.artifact_format, directory=args.artifact_dir)
+    with startup_profiler.phase('initialize Tiramigiu'):
+        tiramigiu = Tiramigiu(Settings.from_args(args), ledger=ledger, cache=cache, artifacts=artifacts)
+    if startup_profiler.enabled:
+        startup_profiler.uninstall()
+        logger = Log().get_logger('Startup')
+        for line in startup_profiler.report():
+            logger.info(line)
+    if args.daemon:
+        # Only daemon mode needs the HTTP server stack
+        from classes.job_queue import JobQueue
+        from classes.daemon import Daemon
+        jobs = JobQueue(args.job_db)
+        # Enough titles per round to keep every worker and the transfer pipeline busy
+        daemon = Daemon(tiramigiu.process_movie_ids, jobs, round_size=args.workers + args.pipeline_depth,
+                        spool_dir=args.spool_dir, listen=args.listen, poll_interval=args.poll_interval,
+                        on_round=lambda: write_metrics(args, artifacts.run_id, jobs=jobs.counts()))
+        signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+        if args.movie_ids:
+            daemon.submit(args.movie_ids)
+        try:
+            daemon.run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            tiramigiu.close()
+            write_metrics(args, artifacts.run_id, jobs=jobs.counts())
+            jobs.close()
+        sys.exit(0)
+    results = []
+    try:
+        results = tiramigiu.process_movie_ids(args.movie_ids)
+    finally:
+        tiramigiu.close()
+        write_metrics(args, artifacts.run_id, titles=results)
+    sys.exit(0 if all(result['success'] for result in results) else 1)